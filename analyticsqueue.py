@@ -0,0 +1,208 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Background delivery of analytics messages.
+
+Messages are produced and sent by a dedicated thread, in batches. While
+they can't be sent (e.g., the computer is offline), they are kept in a spool
+file so they survive a restart, and sending is retried w/ an increasing
+delay.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import sentry_sdk
+
+Message = Dict[str, Any]
+# Produces messages to send. It's called on the background thread.
+ProducerFn = Callable[[], List[Message]]
+# Sends a batch of messages, raising an exception if they couldn't be sent
+PostFn = Callable[[List[Message]], None]
+ClockFn = Callable[[], float]
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsQueue:  # pylint: disable=too-many-instance-attributes
+    """
+    A queue of analytics messages that are sent in batches from a background
+    thread, and saved to disk until they are sent.
+    """
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(
+        self,
+        post: PostFn,
+        spool_file: Optional[str],
+        batch_size: int = 50,
+        flush_interval: float = 5,
+        retry_interval: float = 30,
+        max_retry_interval: float = 30 * 60,
+        max_spooled: int = 1000,
+        clock: ClockFn = time.monotonic,
+    ):
+        """
+        Parameters:
+        - post: Sends a batch of messages
+        - spool_file: File that holds the messages that haven't been sent, or
+          None to only keep them in memory
+        - batch_size: The maximum number of messages to send at once
+        - flush_interval: How long (seconds) to wait for more messages before
+          sending a partial batch
+        - retry_interval: How long (seconds) to wait after the first failure
+          to send. The delay doubles after each additional failure.
+        - max_retry_interval: The longest delay (seconds) between retries
+        - max_spooled: The maximum number of unsent messages to keep. The
+          oldest ones are dropped beyond this.
+        - clock: Source of the current time (seconds)
+        """
+        self._post = post
+        self._spool_file = spool_file
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._max_spooled = max_spooled
+        self._clock = clock
+        # Producers for the background thread. None tells it to exit.
+        self._work: queue.Queue[Optional[ProducerFn]] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pending: List[Message] = []
+        self._send_at = 0.0  # When the pending messages should be sent
+        self._retry_delay = 0.0  # Current delay between failed sends
+
+    def start(self) -> None:
+        """Start the background thread, sending any spooled messages"""
+        self._thread = threading.Thread(target=self._run, name="analytics", daemon=True)
+        self._thread.start()
+
+    def put(self, producer: ProducerFn) -> None:
+        """Queue a function that produces messages. It may be called from any
+        thread and never blocks."""
+        self._work.put(producer)
+
+    def stop(self, timeout: float) -> None:
+        """
+        Make a final attempt to send the queued messages, saving the ones that
+        couldn't be sent. Waits up to timeout seconds.
+        """
+        if self._thread is None:
+            return
+        self._work.put(None)
+        self._thread.join(timeout)
+
+    @property
+    def pending(self) -> int:
+        """The number of messages that haven't been sent"""
+        return len(self._pending)
+
+    def _run(self) -> None:
+        self._pending = self._load_spool()
+        self._send_at = self._clock()
+        while True:
+            timeout: Optional[float] = None
+            if self._pending:
+                timeout = max(0.0, self._send_at - self._clock())
+            try:
+                producer = self._work.get(timeout=timeout)
+            except queue.Empty:
+                producer = self._produce_nothing
+            if producer is None:
+                if self._retry_delay == 0:  # Don't wait on a known failure
+                    self._send()
+                self._save_spool()
+                return
+            had_pending = bool(self._pending)
+            try:
+                self._pending.extend(producer())
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Analytics problems shouldn't stop the remaining messages
+                sentry_sdk.capture_exception()
+            now = self._clock()
+            if not had_pending and self._pending:
+                self._send_at = max(self._send_at, now + self._flush_interval)
+            full = len(self._pending) >= self._batch_size and self._retry_delay == 0
+            if self._pending and (full or now >= self._send_at):
+                self._send()
+
+    @staticmethod
+    def _produce_nothing() -> List[Message]:
+        return []
+
+    def _send(self) -> None:
+        """Send the next batch of messages"""
+        batch = self._pending[: self._batch_size]
+        if not batch:
+            return
+        try:
+            self._post(batch)
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            self._retry_delay = min(
+                self._max_retry_interval,
+                max(self._retry_interval, self._retry_delay * 2),
+            )
+            logger.debug(
+                "Unable to send analytics (retry in %ds): %s", self._retry_delay, err
+            )
+            self._send_at = self._clock() + self._retry_delay
+            self._save_spool()
+            return
+        del self._pending[: len(batch)]
+        if self._retry_delay > 0 or not self._pending:
+            # Back online, or everything is sent; either way, the spool is
+            # out of date
+            self._save_spool()
+        self._retry_delay = 0
+        self._send_at = self._clock()  # Send the rest right away
+
+    def _load_spool(self) -> List[Message]:
+        if self._spool_file is None:
+            return []
+        messages: List[Message] = []
+        try:
+            with open(self._spool_file, "r", encoding="utf-8") as file:
+                for line in file:
+                    messages.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as err:
+            logger.warning("Unable to load analytics spool: %s", err)
+        return messages
+
+    def _save_spool(self) -> None:
+        if self._spool_file is None:
+            return
+        if len(self._pending) > self._max_spooled:
+            del self._pending[: len(self._pending) - self._max_spooled]
+        try:
+            if not self._pending:
+                if os.path.exists(self._spool_file):
+                    os.remove(self._spool_file)
+                return
+            tmpfile = self._spool_file + ".tmp"
+            with open(tmpfile, "w", encoding="utf-8") as file:
+                for message in self._pending:
+                    file.write(json.dumps(message, default=str) + "\n")
+            os.replace(tmpfile, self._spool_file)
+        except OSError as err:
+            logger.warning("Unable to save analytics spool: %s", err)
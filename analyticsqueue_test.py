@@ -0,0 +1,84 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the analytics queue"""
+
+import os
+from typing import List
+
+from analyticsqueue import AnalyticsQueue, Message
+
+
+class FakeServer:
+    """Records the batches it receives, or fails while offline"""
+
+    def __init__(self, online: bool = True):
+        self.online = online
+        self.batches: List[List[Message]] = []
+
+    def post(self, batch: List[Message]) -> None:
+        """Receive a batch"""
+        if not self.online:
+            raise ConnectionError("offline")
+        self.batches.append(batch)
+
+
+def test_events_are_batched():
+    """Queued messages are sent together"""
+    server = FakeServer()
+    aqueue = AnalyticsQueue(server.post, None, batch_size=2, flush_interval=60)
+    aqueue.start()
+    for i in range(5):
+        aqueue.put(lambda i=i: [{"n": i}])
+    aqueue.stop(5)
+    assert [len(batch) for batch in server.batches] == [2, 2, 1]
+    assert [msg["n"] for batch in server.batches for msg in batch] == list(range(5))
+
+
+def test_offline_events_are_spooled(tmp_path):
+    """Messages that can't be sent are saved and sent at the next start"""
+    spool = str(tmp_path / "spool.jsonl")
+    server = FakeServer(online=False)
+    aqueue = AnalyticsQueue(server.post, spool, flush_interval=0, max_spooled=2)
+    aqueue.start()
+    for i in range(3):
+        aqueue.put(lambda i=i: [{"n": i}])
+    aqueue.stop(5)
+    assert not server.batches
+    assert os.path.exists(spool)
+
+    server.online = True
+    aqueue = AnalyticsQueue(server.post, spool, flush_interval=0)
+    aqueue.start()
+    aqueue.stop(5)
+    # The oldest message was dropped to stay w/in max_spooled
+    assert server.batches == [[{"n": 1}, {"n": 2}]]
+    assert not os.path.exists(spool)
+
+
+def test_producer_errors_are_contained():
+    """A failing producer doesn't stop the other messages"""
+    server = FakeServer()
+    aqueue = AnalyticsQueue(server.post, None)
+    aqueue.start()
+
+    def broken() -> List[Message]:
+        raise ValueError("broken")
+
+    aqueue.put(broken)
+    aqueue.put(lambda: [{"n": 1}])
+    aqueue.stop(5)
+    assert server.batches == [[{"n": 1}]]
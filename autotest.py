@@ -32,19 +32,12 @@ from functools import reduce
 from tkinter import DoubleVar, IntVar, StringVar
 from typing import Callable, List
 
+import meetgen
 from model import Model
 
-TESTING = False
-
 logger = logging.getLogger(__name__)
 
 
-def set_test_mode() -> None:
-    """Set the application to test mode"""
-    global TESTING  # pylint: disable=global-statement
-    TESTING = True
-
-
 class Scenario(abc.ABC):  # pylint: disable=too-few-public-methods
     """Base class for test actions"""
 
@@ -79,9 +72,13 @@ def build_scenario(model: Model, test: str) -> Scenario:
         [seconds] = test.split(":")[1:]
         return _build_scripted_scenario(model, float(seconds))
     if test_name == "random":
-        [delay, seconds, operations] = test.split(":")[1:]
+        [delay, seconds, operations, *events] = test.split(":")[1:]
         return _build_random_scenario(
-            model, float(delay), float(seconds), int(operations)
+            model,
+            float(delay),
+            float(seconds),
+            int(operations),
+            int(events[0]) if events else 0,
         )
     raise ValueError(f"Unknown test: {test}")
 
@@ -328,10 +325,19 @@ def _build_scripted_scenario(model: Model, seconds: float) -> Scenario:
     )
 
 
-def _build_random_scenario(
-    model: Model, delay: float, seconds: float = 0, operations: int = 0
+def _build_random_scenario(  # pylint: disable=too-many-locals
+    model: Model,
+    delay: float,
+    seconds: float = 0,
+    operations: int = 0,
+    events: int = 0,
 ) -> Scenario:
-    """Builds a test scenario that executes actions randomly"""
+    """
+    Builds a test scenario that executes actions randomly
+
+    :param events: If non-zero, use a generated meet w/ this many events
+        instead of the files in the testdata directory
+    """
 
     # Prepare test data directories & result scenarios
     startlist_scenarios: List[Scenario] = []
@@ -340,6 +346,9 @@ def _build_random_scenario(
     testdata_exists = os.path.exists(testdatadir)
     tmp_startlist = os.path.join(testdatadir, "tmp_startlists")
     tmp_result = os.path.join(testdatadir, "tmp_result")
+    sourcedir = testdatadir
+    if testdata_exists and events > 0:
+        sourcedir = generate_meet(testdatadir, events)
 
     latest_result_counter = Counter(model.latest_result)
     scoreboard_counter = Counter(model.scoreboard)
@@ -350,13 +359,13 @@ def _build_random_scenario(
         model.enqueue(lambda: model.dir_startlist.set(tmp_startlist))
         model.enqueue(lambda: model.dir_results.set(tmp_result))
         startlist_scenarios = [
-            AddStartlist(testdatadir, tmp_startlist),
+            AddStartlist(sourcedir, tmp_startlist),
             RemoveStartlist(tmp_startlist),
             GenDolphinCSV(model, tmp_startlist),
         ]
         result_scenarios = [
             AddRandomDO4(
-                testdatadir, tmp_result, [latest_result_counter, scoreboard_counter]
+                sourcedir, tmp_result, [latest_result_counter, scoreboard_counter]
             ),
             RemoveRandomDO4(tmp_result),
         ]
@@ -400,6 +409,24 @@ def _build_random_scenario(
     )
 
 
+def generate_meet(testdatadir: str, events: int) -> str:
+    """
+    Generate a meet to use in place of the test data
+
+    :param testdatadir: the directory containing the main test data
+    :param events: the number of events in the meet
+    :returns: the directory containing the meet's start lists & results
+    """
+    meetdir = os.path.join(testdatadir, "tmp_meet")
+    shutil.rmtree(meetdir, ignore_errors=True)
+    os.makedirs(meetdir)
+    meet = meetgen.generate(meetgen.MeetSpec(events=events))
+    meet.write_startlists(meetdir)
+    meet.write_results(meetdir)
+    logger.info("Generated a meet w/ %d results", len(meet.races))
+    return meetdir
+
+
 def eventually(bool_fn: Callable[[], bool], interval_secs: float, tries: int) -> bool:
     """Check a boolean function until it returns true or we run out of tries"""
     for i in range(tries):
@@ -0,0 +1,172 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmarks for the scoreboard image encoding profiles.
+
+Renders the scoreboard template and each of the heats in the testdata
+directory, then reports the encode time and size of the images for each of
+the encoding profiles:
+
+    python benchmark.py [--background IMAGE] [--repeat N]
+
+The overhead of each of the tracing modes can be measured instead:
+
+    python benchmark.py --tracing
+
+These are reports for choosing the settings. To check for regressions
+against a saved baseline, use benchsuite.py instead.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import sentry_sdk
+from PIL import Image
+
+import tracing
+from coremodel import CoreModel
+from encoder import EncodingProfile, encode
+from pipeline import load_result
+from racetimes import RaceTimes
+from rendercache import IMAGE_SIZE
+from scoreboard import ScoreboardImage
+from template import get_template
+
+TESTDATA_DIR = "testdata"
+
+
+@dataclass
+class EncodeResult:
+    """Encode measurements for a single profile"""
+
+    profile: EncodingProfile
+    seconds: List[float] = field(default_factory=list)  # Time per encode
+    sizes: List[int] = field(default_factory=list)  # Bytes per image
+
+    def report(self) -> str:
+        """
+        A line summarizing the result
+
+        >>> r = EncodeResult(EncodingProfile.JPEG, [0.010, 0.030], [1000, 3000])
+        >>> r.report()
+        'jpeg            20.0 ms    30.0 ms      2.0 KiB'
+        """
+        return (
+            f"{self.profile.value:<12}"
+            f"{statistics.mean(self.seconds) * 1000:>8.1f} ms"
+            f"{max(self.seconds) * 1000:>8.1f} ms"
+            f"{statistics.mean(self.sizes) / 1024:>9.1f} KiB"
+        )
+
+
+def load_races(model: CoreModel, directory: str) -> List[RaceTimes]:
+    """The template race followed by each of the heats in a directory"""
+    races = [get_template()]
+    model.dir_startlist.set(directory)
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".do4"):
+            race = load_result(model, os.path.join(directory, name))
+            if race is not None:
+                races.append(race)
+    return races
+
+
+def bench_encode(images: List[Image.Image], repeat: int) -> List[EncodeResult]:
+    """Encode each of the images w/ every profile"""
+    results: List[EncodeResult] = []
+    for profile in EncodingProfile:
+        result = EncodeResult(profile)
+        for image in images:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                encoded = encode(image, profile)
+                result.seconds.append(time.perf_counter() - start)
+            result.sizes.append(len(encoded.data))
+        results.append(result)
+    return results
+
+
+def bench_tracing(iterations: int) -> List[Tuple[str, float]]:
+    """
+    The time (seconds) per traced result, a transaction containing a few
+    spans, for each of the tracing modes. Nothing is uploaded to Sentry.
+    """
+    configs = [
+        ("off", tracing.TraceMode.OFF, 0.0),
+        ("local 100%", tracing.TraceMode.LOCAL, 1.0),
+        ("local 10%", tracing.TraceMode.LOCAL, 0.1),
+        ("sentry 100%", tracing.TraceMode.SENTRY, 1.0),
+        ("sentry 10%", tracing.TraceMode.SENTRY, 0.1),
+    ]
+    results: List[Tuple[str, float]] = []
+    for name, mode, rate in configs:
+        sentry_sdk.init(traces_sample_rate=rate)  # No DSN, so no uploads
+        tracing.configure(mode, rate)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with tracing.transaction("new_result", "New race result"):
+                with tracing.span("render_image", "Render image"):
+                    pass
+                with tracing.span("encode_image", "png"):
+                    pass
+                with tracing.span("publish_one"):
+                    pass
+        results.append((name, (time.perf_counter() - start) / iterations))
+    tracing.configure(tracing.TraceMode.OFF, 0.0)
+    return results
+
+
+def main() -> None:
+    """Run the benchmarks"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--background", type=str, default="", help="Background image for the theme"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of times to encode each image"
+    )
+    parser.add_argument(
+        "--tracing",
+        action="store_true",
+        help="Measure the overhead of the tracing modes instead",
+    )
+    args = parser.parse_args()
+
+    if args.tracing:
+        print(f"{'tracing':<12}{'per result':>14}")
+        for name, seconds in bench_tracing(20000):
+            print(f"{name:<12}{seconds * 1e6:>11.1f} us")
+        return
+
+    model = CoreModel()
+    model.load("")  # Use the default theme
+    model.image_bg.set(args.background)
+
+    races = load_races(model, TESTDATA_DIR)
+    images = [ScoreboardImage(IMAGE_SIZE, race, model).image for race in races]
+    print(f"Encoding {len(images)} images of {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}")
+    print(f"{'profile':<12}{'mean':>11}{'max':>11}{'size':>13}")
+    for result in bench_encode(images, args.repeat):
+        print(result.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Microbenchmarks for the stages of processing a result.
+
+Each stage (parsing, start lists, placing, name formatting, rendering, and
+encoding) is timed against the testdata directory and a larger synthetic
+meet. The results can be saved as a baseline, and later runs compared to it:
+
+    python benchsuite.py --save baseline.json
+    python benchsuite.py --compare baseline.json [--tolerance 0.25]
+
+When comparing, the exit status is 1 if any benchmark is slower than the
+baseline by more than the tolerance. Baselines are specific to a computer.
+
+This is for catching regressions. To choose an encoding profile (time vs.
+size) or a tracing mode (overhead), use benchmark.py instead.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image
+
+from coremodel import CoreModel
+from encoder import EncodingProfile, encode
+from meetgen import MeetSpec, generate
+from racetimes import RaceTimes, RawTime, from_do4
+from rendercache import IMAGE_SIZE
+from scoreboard import ScoreboardImage
+from startlist import NameMode, StartList, format_name, from_scb, load_all_scb
+from wahoo_results import summarize_racedir
+
+TESTDATA_DIR = "testdata"
+
+BenchFn = Callable[[], object]
+
+
+@dataclass
+class Comparison:
+    """A benchmark's result compared to the baseline"""
+
+    name: str
+    baseline: Optional[float]  # seconds
+    current: float  # seconds
+    tolerance: float  # Allowed slowdown, as a fraction of the baseline
+
+    @property
+    def change(self) -> Optional[float]:
+        """The change in time, as a fraction of the baseline"""
+        if self.baseline is None or self.baseline == 0:
+            return None
+        return self.current / self.baseline - 1
+
+    @property
+    def regressed(self) -> bool:
+        """Whether it's slower than the tolerance allows"""
+        change = self.change
+        return change is not None and change > self.tolerance
+
+    def report(self) -> str:
+        """
+        A line summarizing the comparison
+
+        >>> print(Comparison("testdata/render", 0.010, 0.015, 0.25).report())
+        testdata/render                 10.000 ms   15.000 ms   +50.0%  REGRESSION
+        >>> print(Comparison("synthetic/encode", None, 0.002, 0.25).report())
+        synthetic/encode                        -    2.000 ms        -  new
+        """
+        baseline = "-" if self.baseline is None else f"{self.baseline * 1000:.3f} ms"
+        change = self.change
+        change_text = "-" if change is None else f"{change * 100:+.1f}%"
+        status = "new" if self.baseline is None else ""
+        if self.regressed:
+            status = "REGRESSION"
+        return (
+            f"{self.name:<28}{baseline:>13}{self.current * 1000:>9.3f} ms"
+            f"{change_text:>9}  {status}"
+        ).rstrip()
+
+
+def measure(func: BenchFn, repeat: int) -> float:
+    """
+    The best time (seconds) of a function, after a warm-up call. The minimum
+    is less affected by other activity on the computer than the mean.
+    """
+    func()
+    times: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _background_image(directory: str) -> str:
+    """A photo-like background image for rendering"""
+    filename = os.path.join(directory, "background.png")
+    noise = Image.effect_noise(IMAGE_SIZE, 64).convert("RGB")
+    noise.save(filename)
+    return filename
+
+
+def suite(model: CoreModel, directory: str, background: str) -> Dict[str, BenchFn]:
+    """The benchmarks for the results & start lists in a directory"""
+    # The background benchmark of a previous directory leaves its image set
+    model.image_bg.set("")
+    do4_files = sorted(
+        os.path.join(directory, x) for x in os.listdir(directory) if x.endswith(".do4")
+    )
+    scb_files = sorted(
+        os.path.join(directory, x) for x in os.listdir(directory) if x.endswith(".scb")
+    )
+    threshold = RawTime(model.time_threshold.get())
+    min_times = model.min_times.get()
+    races: List[RaceTimes] = [from_do4(x, min_times, threshold) for x in do4_files]
+    startlists: List[StartList] = [from_scb(x) for x in scb_files]
+    names = [
+        startlist.name(heat, lane)
+        for startlist in startlists
+        for heat in range(1, startlist.heats + 1)
+        for lane in range(1, 11)
+    ]
+    race = races[0]
+    image = ScoreboardImage(IMAGE_SIZE, race, model).image
+
+    def place_and_final() -> None:
+        for each in races:
+            for lane in range(1, 11):
+                each.place(lane)
+                each.final_time(lane)
+
+    def render(image_bg: str) -> BenchFn:
+        def func() -> None:
+            model.image_bg.set(image_bg)
+            ScoreboardImage(IMAGE_SIZE, race, model)
+
+        return func
+
+    return {
+        "do4_parse": lambda: [from_do4(x, min_times, threshold) for x in do4_files],
+        "scb_parse": lambda: [from_scb(x) for x in scb_files],
+        "load_all_scb": lambda: load_all_scb(directory),
+        "summarize_racedir": lambda: summarize_racedir(directory),
+        "place_final_time": place_and_final,
+        "format_name": lambda: [
+            format_name(mode, name) for mode in NameMode for name in names
+        ],
+        "render": render(""),
+        "render_background": render(background),
+        "encode_png": lambda: encode(image, EncodingProfile.PNG),
+    }
+
+
+def run(repeat: int) -> Dict[str, float]:
+    """Run the benchmarks, returning the time (seconds) for each"""
+    model = CoreModel()
+    model.load("")  # Use the default theme
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        background = _background_image(tmpdir)
+        synthetic = os.path.join(tmpdir, "meet")
+        os.mkdir(synthetic)
+        meet = generate(MeetSpec(events=20, heats=8, lanes=10))
+        meet.write_startlists(synthetic)
+        meet.write_results(synthetic)
+        for dataset, directory in [
+            ("testdata", TESTDATA_DIR),
+            ("synthetic", synthetic),
+        ]:
+            for name, func in suite(model, directory, background).items():
+                results[f"{dataset}/{name}"] = measure(func, repeat)
+                print(
+                    f"{dataset}/{name:<22}{results[f'{dataset}/{name}'] * 1000:>10.3f} ms"
+                )
+    return results
+
+
+def save_baseline(filename: str, results: Dict[str, float]) -> None:
+    """Save the results as the baseline for later comparisons"""
+    with open(filename, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            },
+            file,
+            indent=2,
+            sort_keys=True,
+        )
+
+
+def compare(
+    baseline: Dict[str, float], results: Dict[str, float], tolerance: float
+) -> List[Comparison]:
+    """
+    Compare the results to the baseline
+
+    >>> comparisons = compare({"a": 1.0, "b": 1.0}, {"a": 1.1, "b": 1.5}, 0.25)
+    >>> [(x.name, x.regressed) for x in comparisons]
+    [('a', False), ('b', True)]
+    """
+    return [
+        Comparison(name, baseline.get(name), seconds, tolerance)
+        for name, seconds in sorted(results.items())
+    ]
+
+
+def main() -> None:
+    """Run the benchmark suite"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=7, help="Number of times to run each benchmark"
+    )
+    parser.add_argument("--save", type=str, help="Save the results as a baseline")
+    parser.add_argument("--compare", type=str, help="Compare to a saved baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown vs. the baseline, as a fraction (default: 0.25)",
+    )
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.save:
+        save_baseline(args.save, results)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("python") != platform.python_version():
+            print(f"Note: The baseline was recorded w/ Python {baseline.get('python')}")
+        print()
+        print(f"{'benchmark':<28}{'baseline':>13}{'current':>12}{'change':>9}")
+        comparisons = compare(baseline["results"], results, args.tolerance)
+        for comparison in comparisons:
+            print(comparison.report())
+        regressions = [x for x in comparisons if x.regressed]
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
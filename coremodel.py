@@ -0,0 +1,368 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Core data model that doesn't depend on tkinter.
+
+The CoreModel holds the settings and state needed to turn race results into
+scoreboard images for the Chromecasts. The Tk user interface extends it
+(model.Model), replacing the variables w/ their tkinter equivalents so they
+can be bound to widgets.
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+import uuid
+from configparser import ConfigParser
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Literal,
+    Optional,
+    Protocol,
+    Set,
+    TypeVar,
+)
+
+import PIL.Image as PILImage
+
+import metrics
+from encoder import EncodingProfile
+from keepalive import REFRESH_INTERVAL, REFRESH_JITTER
+from knowndevices import DeviceStatus
+from latency import LatencyTracker, StageSummary
+from racetimes import RaceTimes
+from taskqueue import Overflow, QueuedTask, TaskQueue
+
+CallbackFn = Callable[[], None]
+# Variable trace callback: (variable name, index, operation)
+TraceFn = Callable[[str, str, str], object]
+
+_INI_HEADING = "wahoo-results"
+# The most functions that may wait for the main thread before the overflow
+# policy applies (by default, the background threads wait for room)
+EVENT_QUEUE_SIZE = 500
+
+_T = TypeVar("_T")
+
+TESTING = False
+
+logger = logging.getLogger(__name__)
+
+
+def set_test_mode() -> None:
+    """Set the application to test mode"""
+    global TESTING  # pylint: disable=global-statement
+    TESTING = True
+
+
+class Value(Protocol[_T]):
+    """
+    The part of the tkinter Variable interface that the core uses, so it
+    works w/ both Var and the tkinter variables.
+    """
+
+    def get(self) -> _T:
+        """Returns the value of the variable."""
+
+    def set(self, value: _T) -> None:
+        """Sets the variable to a new value."""
+
+    def trace_add(self, mode: Literal["write"], callback: TraceFn) -> str:
+        """Call a function whenever the variable is written."""
+
+
+class Var(Generic[_T]):
+    """
+    A value holder w/ the same interface as the tkinter variables (StringVar,
+    IntVar, etc.), but w/o needing Tk. Like the tkinter variables, it should
+    only be used from the thread that runs the event loop.
+
+    >>> var = Var(1)
+    >>> _ = var.trace_add("write", lambda *_: print("now", var.get()))
+    >>> var.set(2)
+    now 2
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, value: _T, name: Optional[str] = None):
+        self._value = value
+        self._name = name if name is not None else f"VAR{next(self._ids)}"
+        self._traces: Dict[str, TraceFn] = {}
+
+    def get(self) -> _T:
+        """Returns the value of the variable."""
+        return self._value
+
+    def set(self, value: _T) -> None:
+        """Sets the variable to a new value."""
+        self._value = value
+        for callback in list(self._traces.values()):
+            callback(self._name, "", "write")
+
+    # pylint: disable-next=unused-argument
+    def trace_add(self, mode: Literal["write"], callback: TraceFn) -> str:
+        """Call a function whenever the variable is written."""
+        cbname = f"{self._name}_trace{next(self._ids)}"
+        self._traces[cbname] = callback
+        return cbname
+
+    # pylint: disable-next=unused-argument
+    def trace_remove(self, mode: Literal["write"], cbname: str) -> None:
+        """Remove a callback added w/ trace_add()"""
+        self._traces.pop(cbname, None)
+
+
+class CallbackList:
+    """A list of callback functions"""
+
+    _callbacks: Set[CallbackFn]
+
+    def __init__(self):
+        self._callbacks = set()
+
+    def run(self) -> None:
+        """Invoke all registered callback functions"""
+        for func in self._callbacks:
+            func()
+
+    def add(self, callback) -> None:
+        """Add a callback function to the set"""
+        self._callbacks.add(callback)
+
+    def remove(self, callback) -> None:
+        """Remove a callback function from the set"""
+        self._callbacks.discard(callback)
+
+
+class CoreModel:  # pylint: disable=too-many-instance-attributes
+    """The settings and state used to produce and cast the scoreboard"""
+
+    ## Colors from USA-S visual identity standards
+    PANTONE282_DKBLUE = "#041e42"  # Primary
+    PANTONE200_RED = "#ba0c2f"  # Primary
+    BLACK = "#000000"  # Secondary
+    PANTONE428_LTGRAY = "#c1c6c8"  # Secondary
+    PANTONE877METALIC_MDGRAY = "#8a8d8f"  # Secondary
+    PANTONE281_MDBLUE = "#00205b"  # Tertiary
+    PANTONE306_LTBLUE = "#00b3e4"  # Tertiary
+    PANTONE871METALICGOLD = "#85754e"  # Tertiary
+    PANTONE4505FLATGOLD = "#b1953a"  # Tertiary
+
+    def __init__(self) -> None:
+        self._event_queue = TaskQueue(EVENT_QUEUE_SIZE, Overflow.BLOCK)
+        self._stopped = threading.Event()
+
+        ## Appearance
+        self.font_normal: Value[str] = Var("")
+        self.font_time: Value[str] = Var("")
+        self.text_spacing: Value[float] = Var(0.0)
+        self.title: Value[str] = Var("")
+        # colors
+        self.image_bg: Value[str] = Var("")
+        self.color_title: Value[str] = Var("")
+        self.color_event: Value[str] = Var("")
+        self.color_even: Value[str] = Var("")
+        self.color_odd: Value[str] = Var("")
+        self.color_first: Value[str] = Var("")
+        self.color_second: Value[str] = Var("")
+        self.color_third: Value[str] = Var("")
+        self.color_bg: Value[str] = Var("")
+        self.brightness_bg: Value[int] = Var(0)
+        # features
+        self.num_lanes: Value[int] = Var(0)
+        self.min_times: Value[int] = Var(0)
+        self.time_threshold: Value[float] = Var(0.0)
+        # Directories
+        self.dir_startlist: Value[str] = Var("")
+        self.dir_results: Value[str] = Var("")
+        # Chromecasts
+        self.cc_status: Value[List[DeviceStatus]] = Var([])
+        self.cc_refresh_interval: Value[int] = Var(0)
+        self.cc_refresh_jitter: Value[int] = Var(0)
+        self.cc_encoding: Value[str] = Var("")
+        # Work waiting for the main thread
+        self.event_queue_size: Value[int] = Var(0)
+        self.event_queue_overflow: Value[str] = Var("")
+        self.scoreboard: Value[PILImage.Image] = Var(PILImage.Image())
+        self.latest_result: Value[Optional[RaceTimes]] = Var(None)
+        # Time taken by each stage of getting results to the displays
+        self.latency = LatencyTracker()
+        self.latency_summary: Value[List[StageSummary]] = Var([])
+        # misc
+        self.client_id: Value[str] = Var("")
+        self.analytics: Value[bool] = Var(False)
+        self.update_check_hours: Value[int] = Var(0)
+        self.tracing: Value[str] = Var("")
+        self.trace_sample_rate: Value[float] = Var(0.0)
+        self.version: Value[str] = Var("")
+
+    def load(self, filename: str) -> None:
+        """Load user's preferences"""
+        config = ConfigParser(interpolation=None)
+        config.read(filename, encoding="utf-8")
+        if _INI_HEADING not in config:
+            config.add_section(_INI_HEADING)
+        data = config[_INI_HEADING]
+        # Calibri (sans serif) is standard since Vista
+        # It's also part of USA-S visual identity standards
+        # https://www.usaswimming.org/docs/default-source/marketingdocuments/usa-swimming-logo-standards-manual.pdf
+        self.font_normal.set(data.get("font_normal", "Calibri"))
+        # Consolas (monospace) is standard since Vista
+        self.font_time.set(data.get("font_time", "Consolas"))
+        self.text_spacing.set(data.getfloat("text_spacing", 1.1))
+        self.title.set(data.get("title", "Wahoo! Results"))
+        self.image_bg.set(data.get("image_bg", ""))
+        self.color_title.set(data.get("color_title", self.PANTONE200_RED))
+        self.color_event.set(data.get("color_event", self.PANTONE4505FLATGOLD))
+        self.color_even.set(data.get("color_even", self.PANTONE877METALIC_MDGRAY))
+        self.color_odd.set(data.get("color_odd", self.PANTONE428_LTGRAY))
+        self.color_first.set(data.get("color_first", self.PANTONE306_LTBLUE))
+        self.color_second.set(data.get("color_second", self.PANTONE200_RED))
+        self.color_third.set(data.get("color_third", self.PANTONE4505FLATGOLD))
+        self.color_bg.set(data.get("color_bg", self.BLACK))
+        self.brightness_bg.set(data.getint("brightness_bg", 100))
+        self.num_lanes.set(data.getint("num_lanes", 10))
+        self.min_times.set(data.getint("min_times", 2))
+        self.time_threshold.set(data.getfloat("time_threshold", 0.30))
+        self.dir_startlist.set(data.get("dir_startlist", "C:\\swmeets8"))
+        self.dir_results.set(data.get("dir_results", "C:\\CTSDolphin"))
+        self.cc_refresh_interval.set(
+            data.getint("cc_refresh_interval", REFRESH_INTERVAL)
+        )
+        self.cc_refresh_jitter.set(data.getint("cc_refresh_jitter", REFRESH_JITTER))
+        self.cc_encoding.set(data.get("cc_encoding", EncodingProfile.PNG.value))
+        self.event_queue_size.set(
+            max(data.getint("event_queue_size", EVENT_QUEUE_SIZE), 0)
+        )
+        overflow = data.get("event_queue_overflow", Overflow.BLOCK.value)
+        if overflow not in [x.value for x in Overflow]:
+            logger.warning("Unknown event_queue_overflow: %s", overflow)
+            overflow = Overflow.BLOCK.value
+        self.event_queue_overflow.set(overflow)
+        self._event_queue.configure(
+            self.event_queue_size.get(), Overflow(self.event_queue_overflow.get())
+        )
+        client_id = data.get("client_id")
+        if client_id is None or len(client_id) == 0:
+            client_id = str(uuid.uuid4())
+        try:
+            uuid.UUID(client_id)
+        except ValueError:
+            client_id = str(uuid.uuid4())
+        self.client_id.set(client_id)
+        self.analytics.set(data.getboolean("analytics", True))
+        self.update_check_hours.set(data.getint("update_check_hours", 24))
+        self.tracing.set(data.get("tracing", "sentry"))
+        self.trace_sample_rate.set(data.getfloat("trace_sample_rate", 0.1))
+
+    def save(self, filename: str) -> None:
+        """Save user's preferences"""
+        config = ConfigParser(interpolation=None)
+        config[_INI_HEADING] = {
+            "font_normal": self.font_normal.get(),
+            "font_time": self.font_time.get(),
+            "text_spacing": str(self.text_spacing.get()),
+            "title": self.title.get(),
+            "image_bg": self.image_bg.get(),
+            "color_title": self.color_title.get(),
+            "color_event": self.color_event.get(),
+            "color_even": self.color_even.get(),
+            "color_odd": self.color_odd.get(),
+            "color_first": self.color_first.get(),
+            "color_second": self.color_second.get(),
+            "color_third": self.color_third.get(),
+            "color_bg": self.color_bg.get(),
+            "brightness_bg": str(self.brightness_bg.get()),
+            "num_lanes": str(self.num_lanes.get()),
+            "min_times": str(self.min_times.get()),
+            "time_threshold": str(self.time_threshold.get()),
+            "dir_startlist": self.dir_startlist.get(),
+            "dir_results": self.dir_results.get(),
+            "cc_refresh_interval": str(self.cc_refresh_interval.get()),
+            "cc_refresh_jitter": str(self.cc_refresh_jitter.get()),
+            "cc_encoding": self.cc_encoding.get(),
+            "event_queue_size": str(self.event_queue_size.get()),
+            "event_queue_overflow": self.event_queue_overflow.get(),
+            "client_id": self.client_id.get(),
+            "analytics": str(self.analytics.get()),
+            "update_check_hours": str(self.update_check_hours.get()),
+            "tracing": self.tracing.get(),
+            "trace_sample_rate": str(self.trace_sample_rate.get()),
+        }
+        with open(filename, "w", encoding="utf-8") as file:
+            config.write(file)
+
+    def enqueue(self, func: Callable[[], None], key: Optional[Hashable] = None) -> None:
+        """
+        Enqueue a function to be executed by the main thread. If a function
+        w/ the same key is still waiting, it's replaced by this one, so only
+        use a key for work where the newest request supersedes the others.
+        When the queue is full, event_queue_overflow decides whether the
+        background threads wait for room or work is dropped.
+        """
+        outcome = self._event_queue.put(func, key)
+        metrics.EVENT_QUEUE_TASKS.inc(outcome.value)
+        self._wakeup()
+
+    def _wakeup(self) -> None:
+        """
+        Let the main thread know there's work in the queue. run() is already
+        waiting on the queue, but subclasses w/ another event loop need to
+        wake it.
+        """
+
+    def _run_queued(self, item: QueuedTask) -> None:
+        """Execute a function from the queue, recording how long it waited"""
+        func, enqueued = item
+        metrics.EVENT_QUEUE_WAIT.observe(time.monotonic() - enqueued)
+        logger.debug("Dispatching function from queue: %s", func.__name__)
+        func()
+
+    def queue_depth(self) -> int:
+        """The number of functions waiting to be executed by the main thread"""
+        return self._event_queue.qsize()
+
+    def run(self) -> None:
+        """
+        Execute the enqueued functions until stop() is called. This is the
+        event loop when there's no tkinter mainloop.
+
+        >>> model = CoreModel()
+        >>> model.enqueue(lambda: print("hello"))
+        >>> model.enqueue(model.stop)
+        >>> model.run()
+        hello
+        """
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            try:
+                # Time out periodically so that signals get handled
+                item = self._event_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._run_queued(item)
+
+    def stop(self) -> None:
+        """Cause run() to return. It may be called from any thread."""
+        self._stopped.set()
@@ -0,0 +1,148 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Encoding of scoreboard images for transmission to the displays.
+"""
+
+import io
+from dataclasses import dataclass
+from enum import Enum, unique
+
+from PIL import Image
+
+# If an image has at most this many distinct colors, it's considered "flat"
+# (i.e., no photographic background) and is a good fit for a palette image
+_FLAT_MAX_COLORS = 4096
+
+# JPEG/WebP quality setting (0-100)
+_LOSSY_QUALITY = 85
+
+
+@unique
+class EncodingProfile(Enum):
+    """The ways in which a scoreboard image can be encoded"""
+
+    PNG = "png"
+    """32-bit RGBA PNG, optimized for size (slow)"""
+    FAST_PNG = "fast-png"
+    """PNG w/ a low compression level"""
+    PALETTE_PNG = "palette-png"
+    """8-bit palette PNG, good for themes without a background image"""
+    JPEG = "jpeg"
+    """JPEG, good for themes w/ a photographic background (drops transparency)"""
+    WEBP = "webp"
+    """Lossy WebP, good for themes w/ a photographic background"""
+    AUTO = "auto"
+    """Palette PNG for flat images, JPEG for opaque photos, otherwise PNG"""
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """An image that has been encoded for transmission"""
+
+    data: bytes  # The encoded image
+    mime_type: str  # The MIME type of the data
+    extension: str  # File extension corresponding to the MIME type
+
+
+def encode(image: Image.Image, profile: EncodingProfile) -> EncodedImage:
+    """
+    Encode an image according to the requested profile. Transparency is
+    preserved by all profiles except JPEG.
+
+    >>> img = Image.new("RGBA", (64, 36), "#041e42")
+    >>> encode(img, EncodingProfile.PALETTE_PNG).mime_type
+    'image/png'
+    >>> encode(img, EncodingProfile.JPEG).extension
+    'jpg'
+    >>> encode(img, EncodingProfile.AUTO).mime_type  # Only 1 color
+    'image/png'
+    >>> clear = Image.new("RGBA", (64, 36), (0, 0, 0, 0))
+    >>> Image.open(io.BytesIO(encode(clear, EncodingProfile.WEBP).data)).mode
+    'RGBA'
+    """
+    if profile == EncodingProfile.AUTO:
+        if is_flat(image):
+            profile = EncodingProfile.PALETTE_PNG
+        elif is_opaque(image):
+            profile = EncodingProfile.JPEG
+        else:
+            profile = EncodingProfile.PNG
+    # Only carry an alpha channel if it's actually used
+    mode = "RGB" if is_opaque(image) else "RGBA"
+    buffer = io.BytesIO()
+    if profile == EncodingProfile.FAST_PNG:
+        image.convert(mode).save(buffer, "PNG", compress_level=1)
+        return EncodedImage(buffer.getvalue(), "image/png", "png")
+    if profile == EncodingProfile.PALETTE_PNG:
+        paletted = image.convert(mode).quantize(
+            colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE
+        )
+        paletted.save(buffer, "PNG")
+        return EncodedImage(buffer.getvalue(), "image/png", "png")
+    if profile == EncodingProfile.JPEG:
+        image.convert("RGB").save(buffer, "JPEG", quality=_LOSSY_QUALITY)
+        return EncodedImage(buffer.getvalue(), "image/jpeg", "jpg")
+    if profile == EncodingProfile.WEBP:
+        image.convert(mode).save(buffer, "WEBP", quality=_LOSSY_QUALITY)
+        return EncodedImage(buffer.getvalue(), "image/webp", "webp")
+    # default is EncodingProfile.PNG
+    image.save(buffer, "PNG", optimize=True)
+    return EncodedImage(buffer.getvalue(), "image/png", "png")
+
+
+def is_flat(image: Image.Image) -> bool:
+    """
+    Returns True if the image is made up of a limited number of colors.
+
+    >>> is_flat(Image.new("RGB", (16, 16), "red"))
+    True
+    >>> noise = [Image.effect_noise((128, 128), 64) for _ in range(3)]
+    >>> is_flat(Image.merge("RGB", noise))
+    False
+    """
+    return image.getcolors(maxcolors=_FLAT_MAX_COLORS) is not None
+
+
+def is_opaque(image: Image.Image) -> bool:
+    """
+    Returns True if the image has no transparent or translucent pixels.
+
+    >>> is_opaque(Image.new("RGBA", (16, 16), "red"))
+    True
+    >>> is_opaque(Image.new("RGBA", (16, 16), (255, 0, 0, 128)))
+    False
+    """
+    if "A" not in image.getbands():
+        return True
+    return image.getchannel("A").getextrema()[0] == 255
+
+
+def profile_from_name(name: str) -> EncodingProfile:
+    """
+    Look up an encoding profile by name, falling back to PNG if the name is
+    not recognized.
+
+    >>> profile_from_name("webp")
+    <EncodingProfile.WEBP: 'webp'>
+    >>> profile_from_name("bogus")
+    <EncodingProfile.PNG: 'png'>
+    """
+    try:
+        return EncodingProfile(name)
+    except ValueError:
+        return EncodingProfile.PNG
@@ -0,0 +1,654 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A fleet of fake Chromecasts for load testing the casting of the scoreboard.
+
+Each fake device listens for the cast protocol on its own loopback address
+(127.0.1.N, port 8009) and is advertised via mDNS. It implements enough of
+the protocol for ImageCast: heartbeats, receiver status, launching &
+stopping an app, and loading media. Like the receiver app on a real TV, it
+downloads each image it is told to load. Latency, lost messages, and dropped
+connections can be added.
+
+The fleet can be used to benchmark ImageCast's fan-out, keepalive, and
+reconnection w/o any real devices:
+
+    python fakecast.py --devices 20 --publishes 10 [--latency 0.05]
+
+The loopback addresses other than 127.0.0.1 work on Linux and Windows. On
+macOS, they need to be added w/ "ifconfig lo0 alias".
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import socket
+import ssl
+import statistics
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import zeroconf
+from PIL import Image, ImageDraw
+
+# pylint: disable-next=no-name-in-module
+from pychromecast.generated.cast_channel_pb2 import CastMessage  # type: ignore
+
+from knowndevices import KnownDevice, save_known_devices
+from rendercache import IMAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+CAST_PORT = 8009
+MDNS_SERVICE_TYPE = "_googlecast._tcp.local."
+# How long (seconds) a new connection has to complete the TLS handshake
+_HANDSHAKE_TIMEOUT = 5
+
+NS_CONNECTION = "urn:x-cast:com.google.cast.tp.connection"
+NS_HEARTBEAT = "urn:x-cast:com.google.cast.tp.heartbeat"
+NS_RECEIVER = "urn:x-cast:com.google.cast.receiver"
+NS_MEDIA = "urn:x-cast:com.google.cast.media"
+
+Message = Dict[str, Any]
+
+
+@dataclass
+class Faults:
+    """The misbehavior of the fake devices"""
+
+    latency: float = 0.0  # Seconds before each reply and image download
+    jitter: float = 0.0  # Maximum seconds randomly added to the latency
+    loss: float = 0.0  # Chance that a request goes unanswered
+    disconnect: float = 0.0  # Chance that a device drops the connection on LOAD
+
+
+@dataclass
+class DeviceStats:
+    """What happened to a fake device"""
+
+    connections: int = 0
+    launches: int = 0
+    loads: int = 0
+    downloads: int = 0
+    download_errors: int = 0
+    bytes: int = 0
+
+
+def _read_exactly(conn: ssl.SSLSocket, length: int) -> Optional[bytes]:
+    data = b""
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class FakeCast:  # pylint: disable=too-many-instance-attributes
+    """A fake Chromecast"""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        host: str,
+        port: int = CAST_PORT,
+        faults: Optional[Faults] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Parameters:
+        - name: The friendly name of the device
+        - host: The (loopback) address to listen on
+        - port: The port for the cast protocol
+        - faults: How the device misbehaves
+        - seed: Seed for the random faults
+        """
+        self.name = name
+        self.host = host
+        self.port = port
+        self.uuid = uuid.uuid5(uuid.NAMESPACE_DNS, f"{name}.fakecast")
+        self.faults = faults or Faults()
+        self.stats = DeviceStats()
+        self._rng = random.Random(seed)
+        self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self._lock = threading.Lock()  # Protects the following
+        self._connections: List[ssl.SSLSocket] = []
+        self._app: Optional[Message] = None
+        self._media_session = 0
+        self._listener: Optional[socket.socket] = None
+
+    def start(self, certfile: str) -> None:
+        """
+        Start accepting connections
+
+        Parameters:
+        - certfile: The certificate & key for the TLS connections (see
+          make_certificate())
+        """
+        self._context.load_cert_chain(certfile)
+        self._listener = socket.create_server((self.host, self.port))
+        self.port = self._listener.getsockname()[1]  # In case it was 0 (any)
+        threading.Thread(
+            target=self._accept, args=(self._listener,), daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        """Stop accepting connections and close the current ones"""
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        self.disconnect()
+
+    def disconnect(self) -> None:
+        """
+        Drop the current connections, as if the device lost its network
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    @property
+    def connected(self) -> bool:
+        """Whether a client is connected"""
+        with self._lock:
+            return bool(self._connections)
+
+    def known_device(self, enabled: bool = True) -> KnownDevice:
+        """The device, as it would be remembered by ImageCast"""
+        return KnownDevice(self.uuid, self.host, self.port, self.name, enabled)
+
+    def service_info(self) -> zeroconf.ServiceInfo:
+        """The mDNS advertisement of the device"""
+        return zeroconf.ServiceInfo(
+            MDNS_SERVICE_TYPE,
+            f"Chromecast-{self.uuid.hex}.{MDNS_SERVICE_TYPE}",
+            addresses=[socket.inet_aton(self.host)],
+            port=self.port,
+            properties={
+                "id": self.uuid.hex,
+                "md": "Chromecast",
+                "fn": self.name,
+                "ca": "4101",  # Video output
+                "st": "0",
+                "rs": "",
+            },
+            server=f"{self.uuid.hex}.local.",
+        )
+
+    def _accept(self, listener: socket.socket) -> None:
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:  # The listener was closed
+                return
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock: socket.socket) -> None:
+        try:
+            sock.settimeout(_HANDSHAKE_TIMEOUT)
+            conn = self._context.wrap_socket(sock, server_side=True)
+            conn.settimeout(None)
+        except OSError as err:
+            logger.debug("%s: Handshake failed: %s", self.name, err)
+            sock.close()
+            return
+        with self._lock:
+            self._connections.append(conn)
+            self.stats.connections += 1
+        try:
+            while True:
+                header = _read_exactly(conn, 4)
+                if header is None:
+                    break
+                payload = _read_exactly(conn, struct.unpack(">I", header)[0])
+                if payload is None:
+                    break
+                request = CastMessage()
+                request.ParseFromString(payload)
+                if not self._handle(conn, request):
+                    break
+        except (OSError, ValueError) as err:  # Connection closed underneath us
+            logger.debug("%s: Connection closed: %s", self.name, err)
+        finally:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def _delay(self) -> None:
+        delay = self.faults.latency + self._rng.uniform(0, self.faults.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _handle(self, conn: ssl.SSLSocket, request: CastMessage) -> bool:
+        """Respond to a message. Returns False to drop the connection."""
+        data: Message = json.loads(request.payload_utf8)
+        kind = data.get("type")
+        handlers: Dict[str, Dict[str, Callable[[Message], Optional[Message]]]] = {
+            NS_HEARTBEAT: {"PING": lambda _: {"type": "PONG"}},
+            NS_RECEIVER: {
+                "GET_STATUS": self._receiver_status,
+                "LAUNCH": self._launch,
+                "STOP": self._stop_app,
+            },
+            NS_MEDIA: {"GET_STATUS": self._media_status, "LOAD": self._load},
+        }
+        handler = handlers.get(request.namespace, {}).get(str(kind))
+        if handler is None:  # e.g., CONNECT & CLOSE, which need no reply
+            return True
+        if request.namespace != NS_HEARTBEAT:
+            if kind == "LOAD" and self._rng.random() < self.faults.disconnect:
+                logger.debug("%s: Dropping the connection", self.name)
+                return False
+            self._delay()
+        if self._rng.random() < self.faults.loss:
+            logger.debug("%s: Losing %s", self.name, kind)
+            return True
+        response = handler(data)
+        if response is None:
+            return True
+        if "requestId" in data:
+            response["requestId"] = data["requestId"]
+        reply = CastMessage()
+        reply.protocol_version = request.protocol_version
+        reply.source_id = request.destination_id
+        reply.destination_id = request.source_id
+        reply.namespace = request.namespace
+        reply.payload_type = CastMessage.STRING
+        reply.payload_utf8 = json.dumps(response)
+        with self._lock:
+            conn.sendall(
+                struct.pack(">I", reply.ByteSize()) + reply.SerializeToString()
+            )
+        return True
+
+    def _receiver_status(self, _: Message) -> Message:
+        with self._lock:
+            applications = [self._app] if self._app is not None else []
+        return {
+            "type": "RECEIVER_STATUS",
+            "status": {
+                "applications": applications,
+                "volume": {"level": 1.0, "muted": False},
+                "isActiveInput": True,
+                "isStandBy": False,
+            },
+        }
+
+    def _launch(self, data: Message) -> Message:
+        with self._lock:
+            self.stats.launches += 1
+            session = str(uuid.uuid4())
+            self._app = {
+                "appId": data.get("appId"),
+                "displayName": "Fake receiver",
+                "namespaces": [{"name": NS_MEDIA}],
+                "sessionId": session,
+                "transportId": session,
+                "statusText": "",
+            }
+        return self._receiver_status(data)
+
+    def _stop_app(self, data: Message) -> Message:
+        with self._lock:
+            self._app = None
+        return self._receiver_status(data)
+
+    def _media_status(self, _: Message, media: Optional[Message] = None) -> Message:
+        status = []
+        if media is not None:
+            status.append(
+                {
+                    "mediaSessionId": self._media_session,
+                    "playbackRate": 1,
+                    "playerState": "PLAYING",
+                    "currentTime": 0,
+                    "supportedMediaCommands": 0,
+                    "volume": {"level": 1, "muted": False},
+                    "media": media,
+                }
+            )
+        return {"type": "MEDIA_STATUS", "status": status}
+
+    def _load(self, data: Message) -> Message:
+        """Download the image, then report that it's showing"""
+        media = data.get("media", {})
+        url = media.get("contentId", "")
+        with self._lock:
+            self.stats.loads += 1
+            self._media_session += 1
+        self._delay()
+        self._download(url)
+        return self._media_status(data, media)
+
+    def _download(self, url: str) -> None:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                size = len(response.read())
+            with self._lock:
+                self.stats.downloads += 1
+                self.stats.bytes += size
+        except OSError as err:
+            logger.debug("%s: Unable to download %s: %s", self.name, url, err)
+            with self._lock:
+                self.stats.download_errors += 1
+
+
+class FakeFleet:
+    """A set of fake Chromecasts on the loopback interface"""
+
+    def __init__(
+        self, count: int, faults: Optional[Faults] = None, advertise: bool = True
+    ) -> None:
+        """
+        Parameters:
+        - count: The number of devices (up to 254)
+        - faults: How the devices misbehave
+        - advertise: Whether to advertise the devices via mDNS
+        """
+        self.devices = [
+            FakeCast(f"Fake TV {i + 1}", f"127.0.1.{i + 1}", faults=faults, seed=i)
+            for i in range(count)
+        ]
+        self._advertise = advertise
+        self._zconf: Optional[zeroconf.Zeroconf] = None
+
+    def start(self) -> None:
+        """Start the devices and advertise them"""
+        # The certificate is only needed until it's loaded by the devices
+        with tempfile.TemporaryDirectory() as tmpdir:
+            certfile = make_certificate(tmpdir)
+            for device in self.devices:
+                device.start(certfile)
+        if not self._advertise:
+            return
+        try:
+            self._zconf = zeroconf.Zeroconf(interfaces=["127.0.0.1"])
+            # Each registration waits for its name to be probed, so they're
+            # done in parallel
+            with ThreadPoolExecutor(max_workers=32) as pool:
+                list(pool.map(self._register, self.devices))
+        except OSError as err:
+            logger.warning("Unable to advertise the devices via mDNS: %s", err)
+
+    def _register(self, device: FakeCast) -> None:
+        assert self._zconf is not None
+        self._zconf.register_service(device.service_info())
+
+    def stop(self) -> None:
+        """Stop advertising and shut down the devices"""
+        if self._zconf is not None:
+            self._zconf.unregister_all_services()
+            self._zconf.close()
+            self._zconf = None
+        for device in self.devices:
+            device.stop()
+
+    def total(self, stat: str) -> int:
+        """The sum of a statistic (e.g., "loads") over the devices"""
+        return sum(getattr(x.stats, stat) for x in self.devices)
+
+    def wait_for(self, stat: str, target: int, timeout: float) -> bool:
+        """Wait for the total of a statistic to reach the target"""
+        return wait_for(lambda: self.total(stat) >= target, timeout)
+
+    def write_device_cache(self, filename: str) -> None:
+        """Save the devices (enabled) as ImageCast's known devices"""
+        save_known_devices(filename, [x.known_device() for x in self.devices])
+
+
+def make_certificate(directory: str) -> str:
+    """
+    Create a throwaway self-signed certificate & key for the devices' TLS
+    connections, returning the name of the file that holds them. The cast
+    client doesn't verify the certificate. This uses the cryptography package
+    if it's installed, otherwise the openssl command.
+    """
+    certfile = os.path.join(directory, "fakecast.pem")
+    try:
+        pem = _python_certificate()
+    except ImportError:
+        pem = _openssl_certificate(directory)
+    with open(certfile, "wb") as file:
+        file.write(pem)
+    return certfile
+
+
+def _python_certificate() -> bytes:
+    """A self-signed certificate & key in PEM format, via cryptography"""
+    # pylint: disable=import-outside-toplevel
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fakecast")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return cert.public_bytes(serialization.Encoding.PEM) + key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+
+def _openssl_certificate(directory: str) -> bytes:
+    """A self-signed certificate & key in PEM format, via the openssl command"""
+    certfile = os.path.join(directory, "openssl.pem")
+    keyfile = os.path.join(directory, "openssl.key")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-nodes",
+            "-days",
+            "1",
+            "-newkey",
+            "ec",
+            "-pkeyopt",
+            "ec_paramgen_curve:prime256v1",
+            "-subj",
+            "/CN=fakecast",
+            "-keyout",
+            keyfile,
+            "-out",
+            certfile,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    with open(certfile, "rb") as cert, open(keyfile, "rb") as key:
+        pem = cert.read() + key.read()
+    os.remove(certfile)
+    os.remove(keyfile)
+    return pem
+
+
+def numbered_image(number: int) -> Image.Image:
+    """A distinct image for each publish"""
+    image = Image.new("RGB", IMAGE_SIZE, "#041e42")
+    ImageDraw.Draw(image).text((100, 100), f"Publish {number}", fill="white")
+    return image
+
+
+def wait_for(check: Callable[[], bool], timeout: float) -> bool:
+    """Wait up to timeout seconds for check() to be true, returning whether it is"""
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def benchmark(  # pylint: disable=too-many-locals
+    fleet: FakeFleet, publishes: int, server_port: int, refresh: float, soak: float
+) -> None:
+    """Measure ImageCast's fan-out, reconnection, and keepalive w/ the fleet"""
+    # pylint: disable-next=import-outside-toplevel
+    from imagecast import ImageCast
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = os.path.join(tmpdir, "devices.json")
+        fleet.write_device_cache(cache)
+        icast = ImageCast(
+            server_port, refresh_interval=refresh, refresh_jitter=0, device_cache=cache
+        )
+        start = time.monotonic()
+        icast.start()
+        wait_for(lambda: len(icast.get_devices()) >= len(fleet.devices), 60)
+        # Devices that didn't answer while connecting are left out
+        count = len(icast.get_devices())
+        print(
+            f"Connected to {count} of {len(fleet.devices)} devices in "
+            f"{time.monotonic() - start:.2f} s"
+        )
+        if count == 0:
+            icast.stop()
+            return
+
+        publish_times: List[float] = []
+        display_times: List[float] = []
+        for number in range(publishes):
+            downloads = fleet.total("downloads")
+            start = time.monotonic()
+            icast.publish(numbered_image(number))
+            publish_times.append(time.monotonic() - start)
+            fleet.wait_for("downloads", downloads + count, 30)
+            display_times.append(time.monotonic() - start)
+        print(
+            f"Publish to {count} devices: {statistics.median(publish_times) * 1000:.0f} ms "
+            f"median, {max(publish_times) * 1000:.0f} ms max; all displays "
+            f"loaded: {statistics.median(display_times) * 1000:.0f} ms median"
+        )
+
+        # Reconnection: every device drops its connections at once
+        start = time.monotonic()
+        for device in fleet.devices:
+            device.disconnect()
+        time.sleep(0.1)  # Let the closed connections be noticed
+        recovered = wait_for(
+            lambda: sum(x.connected for x in fleet.devices) >= count, 120
+        )
+        print(
+            f"Reconnected {'all' if recovered else 'only some'} devices in "
+            f"{time.monotonic() - start:.2f} s"
+        )
+        downloads = fleet.total("downloads")
+        start = time.monotonic()
+        icast.publish(numbered_image(publishes))
+        fleet.wait_for("downloads", downloads + count, 30)
+        print(
+            f"First publish after reconnecting: all displays loaded in "
+            f"{(time.monotonic() - start) * 1000:.0f} ms"
+        )
+
+        if soak > 0:
+            loads = fleet.total("loads")
+            time.sleep(soak)
+            refreshes = fleet.total("loads") - loads
+            print(
+                f"Keepalive: {refreshes} refreshes in {soak:.0f} s "
+                f"({refreshes / count:.1f} per device, interval {refresh:g} s)"
+            )
+        print(
+            f"Loads: {icast.stats.loads}, downloads: "
+            f"{fleet.total('downloads')}, failed downloads: "
+            f"{fleet.total('download_errors')}"
+        )
+        icast.stop()
+
+
+def main() -> None:
+    """Run a fleet of fake Chromecasts"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--devices", type=int, default=5, help="Number of devices")
+    parser.add_argument("--latency", type=float, default=0.0, help="Reply delay (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Added delay (s)")
+    parser.add_argument(
+        "--loss", type=float, default=0.0, help="Chance a request is unanswered"
+    )
+    parser.add_argument(
+        "--disconnect", type=float, default=0.0, help="Chance of a drop on LOAD"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Only run the devices (e.g., for the app), until interrupted",
+    )
+    parser.add_argument(
+        "--publishes", type=int, default=10, help="Images to publish (benchmark)"
+    )
+    parser.add_argument(
+        "--server-port", type=int, default=9997, help="ImageCast port (benchmark)"
+    )
+    parser.add_argument(
+        "--refresh", type=float, default=30.0, help="Keepalive interval (benchmark)"
+    )
+    parser.add_argument(
+        "--soak", type=float, default=0.0, help="Seconds to watch keepalives"
+    )
+    args = parser.parse_args()
+
+    # The cast client logs an error each time a device drops its connection
+    logging.getLogger("pychromecast").setLevel(logging.CRITICAL)
+    faults = Faults(args.latency, args.jitter, args.loss, args.disconnect)
+    fleet = FakeFleet(args.devices, faults)
+    fleet.start()
+    try:
+        if args.serve:
+            print(f"Running {args.devices} fake Chromecasts. Press Ctrl-C to stop.")
+            while True:
+                time.sleep(1)
+        benchmark(fleet, args.publishes, args.server_port, args.refresh, args.soak)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the fake Chromecasts"""
+
+import os
+import socket
+import subprocess
+
+import pytest
+
+from fakecast import FakeCast, make_certificate, numbered_image, wait_for
+from imagecast import ImageCast
+from knowndevices import save_known_devices
+from latency import LatencyTracker, Stage
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(name="certfile")
+def fixture_certfile(tmp_path) -> str:
+    """A throwaway certificate for the fake devices"""
+    try:
+        return make_certificate(str(tmp_path))
+    except (OSError, subprocess.CalledProcessError) as err:
+        # CI must run these tests, so a missing tool is an error there
+        if os.environ.get("CI"):
+            raise
+        pytest.skip(f"Unable to create the certificate: {err}")
+
+
+def test_publish_to_fake(tmp_path, certfile):
+    """ImageCast connects to a fake device, which downloads what's published"""
+    device = FakeCast("Test TV", "127.0.0.1", port=0)
+    device.start(certfile)
+    cache = str(tmp_path / "devices.json")
+    save_known_devices(cache, [device.known_device()])
+    icast = ImageCast(_free_port(), device_cache=cache)
+    try:
+        icast.start()
+        assert wait_for(lambda: len(icast.get_devices()) == 1, 10)
+        icast.publish(numbered_image(1))
+        assert wait_for(lambda: device.stats.downloads >= 1, 10)
+        assert device.stats.launches >= 1
+        assert device.stats.download_errors == 0
+    finally:
+        icast.stop()
+        device.stop()
+
+
+def test_latency_per_device(tmp_path, certfile):
+    """Sending and serving an image are recorded for the same device"""
+    device = FakeCast("Test TV", "127.0.0.1", port=0)
+    device.start(certfile)
+    cache = str(tmp_path / "devices.json")
+    save_known_devices(cache, [device.known_device()])
+    latency = LatencyTracker()
+    icast = ImageCast(_free_port(), device_cache=cache, latency=latency)
+    try:
+        icast.start()
+        assert wait_for(lambda: len(icast.get_devices()) == 1, 10)
+        latency.start("1-001-001A-0001.do4")
+        latency.mark("1-001-001A-0001.do4", Stage.RENDERED)
+        icast.publish(numbered_image(1))
+        heat = latency.heats()[0]
+        assert wait_for(lambda: len(heat.elapsed(Stage.SENT)) == 1, 10)
+        assert wait_for(lambda: len(heat.elapsed(Stage.SERVED)) == 1, 10)
+        assert list(heat.devices) == ["Test TV"]
+        assert set(heat.devices["Test TV"]) == {Stage.SENT, Stage.SERVED}
+        assert len(latency.to_csv().splitlines()) == 2  # Header + 1 device
+    finally:
+        icast.stop()
+        device.stop()
@@ -0,0 +1,193 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Distribution of the latest scoreboard image to its consumers.
+
+A FrameChannel holds the most recent image of a sequence (e.g., the
+scoreboard), encodes it at most once, and wakes up any viewers that are
+streaming it. Viewers only ever see the latest frame; if a viewer falls
+behind, the frames it missed are dropped instead of being queued.
+"""
+
+import hashlib
+import threading
+from typing import Generic, Optional, Set, Tuple, TypeVar
+
+from PIL import Image
+
+import metrics
+import tracing
+from encoder import EncodedImage, EncodingProfile, encode
+
+T = TypeVar("T")
+
+
+def frame_fingerprint(image: Image.Image) -> str:
+    """
+    Compute a cheap fingerprint of an image's pixels so that identical frames
+    can be detected.
+
+    >>> red = Image.new("RGBA", (4, 4), "red")
+    >>> frame_fingerprint(red) == frame_fingerprint(red.copy())
+    True
+    >>> frame_fingerprint(red) == frame_fingerprint(Image.new("RGBA", (4, 4)))
+    False
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}:{image.size}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class LatestSlot(Generic[T]):
+    """
+    A single-item mailbox. Putting an item replaces any item that hasn't been
+    taken yet.
+
+    >>> slot: LatestSlot[int] = LatestSlot()
+    >>> slot.put(1)
+    >>> slot.put(2)
+    >>> slot.get(0), slot.dropped
+    (2, 1)
+    >>> slot.get(0) is None
+    True
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._item: Optional[T] = None
+        self.dropped = 0  # Number of items replaced before they were taken
+
+    def put(self, item: T) -> None:
+        """Replace the contents of the slot"""
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify_all()
+
+    def get(self, timeout: float) -> Optional[T]:
+        """Take the item, waiting up to timeout seconds for one to arrive"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None, timeout)
+            item, self._item = self._item, None
+            return item
+
+
+class FrameChannel:
+    """
+    The latest image of a sequence of images, along with its encoded form and
+    the viewers that are waiting for new frames.
+    """
+
+    def __init__(self, encoding: EncodingProfile):
+        """
+        Parameters:
+        - encoding: How the images are encoded
+        """
+        self._lock = threading.Lock()
+        self._image: Optional[Image.Image] = None
+        self._frame: Optional[str] = None
+        self._encoding = encoding
+        self._encoded: Optional[Tuple[str, EncodedImage]] = None
+        self._encode_lock = threading.Lock()  # Serializes encoding
+        self._viewers: Set[LatestSlot[str]] = set()
+
+    @property
+    def image(self) -> Optional[Image.Image]:
+        """The current image"""
+        return self._image
+
+    @property
+    def frame(self) -> Optional[str]:
+        """The fingerprint of the current image"""
+        return self._frame
+
+    @property
+    def viewers(self) -> int:
+        """The number of attached viewers"""
+        with self._lock:
+            return len(self._viewers)
+
+    def set_image(self, image: Image.Image, frame: Optional[str] = None) -> str:
+        """
+        Make an image the current one and notify the viewers. Returns the
+        image's fingerprint.
+
+        Parameters:
+        - image: The new image
+        - frame: The image's fingerprint, if it has already been computed
+        """
+        if frame is None:
+            frame = frame_fingerprint(image)
+        with self._lock:
+            self._image = image
+            self._frame = frame
+            viewers = list(self._viewers)
+        for viewer in viewers:
+            viewer.put(frame)
+        return frame
+
+    def set_encoding(self, encoding: EncodingProfile) -> None:
+        """Change how images are encoded"""
+        with self._encode_lock:
+            self._encoding = encoding
+            self._encoded = None
+
+    def encoded(self) -> Optional[Tuple[str, EncodedImage]]:
+        """
+        The fingerprint and encoded form of the current image. Each image is
+        only encoded once, no matter how many times it is requested.
+
+        >>> chan = FrameChannel(EncodingProfile.FAST_PNG)
+        >>> chan.encoded() is None
+        True
+        >>> frame = chan.set_image(Image.new("RGBA", (4, 4), "red"))
+        >>> first = chan.encoded()
+        >>> first[0] == frame, first[1].mime_type
+        (True, 'image/png')
+        >>> chan.encoded() is first
+        True
+        """
+        with self._lock:
+            image = self._image
+            frame = self._frame
+        if image is None or frame is None:
+            return None
+        with self._encode_lock:
+            if self._encoded is None or self._encoded[0] != frame:
+                with tracing.span(op="encode_image", description=self._encoding.value):
+                    with metrics.ENCODE_SECONDS.time(self._encoding.value):
+                        self._encoded = (frame, encode(image, self._encoding))
+            return self._encoded
+
+    def add_viewer(self) -> LatestSlot[str]:
+        """
+        Attach a viewer. The returned slot receives the fingerprint of each
+        new frame, starting w/ the current one.
+        """
+        slot: LatestSlot[str] = LatestSlot()
+        with self._lock:
+            self._viewers.add(slot)
+            if self._frame is not None:
+                slot.put(self._frame)
+        return slot
+
+    def remove_viewer(self, slot: LatestSlot[str]) -> None:
+        """Detach a viewer"""
+        with self._lock:
+            self._viewers.discard(slot)
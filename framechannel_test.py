@@ -0,0 +1,79 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for FrameChannel"""
+
+import threading
+
+from PIL import Image
+
+from encoder import EncodingProfile
+from framechannel import FrameChannel
+
+
+def _image(color: str) -> Image.Image:
+    return Image.new("RGBA", (8, 8), color)
+
+
+def test_new_viewer_gets_current_frame():
+    """A viewer that attaches late starts w/ the current frame"""
+    chan = FrameChannel(EncodingProfile.FAST_PNG)
+    frame = chan.set_image(_image("red"))
+    viewer = chan.add_viewer()
+    assert viewer.get(0) == frame
+
+
+def test_slow_viewer_only_sees_latest():
+    """Frames a viewer didn't take in time are dropped, not queued"""
+    chan = FrameChannel(EncodingProfile.FAST_PNG)
+    viewer = chan.add_viewer()
+    for color in ["red", "green", "blue"]:
+        last = chan.set_image(_image(color))
+    assert viewer.get(0) == last
+    assert viewer.dropped == 2
+    assert viewer.get(0) is None
+
+
+def test_viewer_woken_by_new_frame():
+    """A waiting viewer wakes up when a frame is published"""
+    chan = FrameChannel(EncodingProfile.FAST_PNG)
+    viewer = chan.add_viewer()
+    timer = threading.Timer(0.05, lambda: chan.set_image(_image("red")))
+    timer.start()
+    assert viewer.get(5) is not None
+    timer.join()
+
+
+def test_removed_viewer_not_notified():
+    """Detached viewers stop receiving frames"""
+    chan = FrameChannel(EncodingProfile.FAST_PNG)
+    viewer = chan.add_viewer()
+    chan.remove_viewer(viewer)
+    chan.set_image(_image("red"))
+    assert viewer.get(0) is None
+    assert chan.viewers == 0
+
+
+def test_encoding_change_reencodes():
+    """Changing the encoding invalidates the cached image"""
+    chan = FrameChannel(EncodingProfile.FAST_PNG)
+    chan.set_image(_image("red"))
+    png = chan.encoded()
+    chan.set_encoding(EncodingProfile.JPEG)
+    jpeg = chan.encoded()
+    assert png is not None and jpeg is not None
+    assert png[0] == jpeg[0]
+    assert jpeg[1].mime_type == "image/jpeg"
@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Run Wahoo! Results w/o a user interface.
+
+The settings are read from wahoo-results.ini, and the Chromecasts that were
+enabled the last time (recorded in wahoo-results-cc.json) are used. Neither
+tkinter nor a display is needed, so this can run on a headless PC or in a
+container.
+"""
+
+import argparse
+import logging
+import signal
+import threading
+
+import sentry_sdk
+from watchdog.observers import Observer
+
+import wh_analytics
+from coremodel import CoreModel
+from pipeline import (
+    ANALYTICS_SPOOL_FILE,
+    CONFIG_FILE,
+    add_logging_args,
+    initialize_sentry,
+    setup_do4_watcher,
+    setup_logging,
+    shutdown_sentry,
+    start_cast,
+)
+from version import WAHOO_RESULTS_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+def run() -> None:
+    """Run the pipeline until interrupted (SIGINT or SIGTERM)"""
+    model = CoreModel()
+    model.load(CONFIG_FILE)
+    model.version.set(WAHOO_RESULTS_VERSION)
+
+    hub = initialize_sentry(model)
+    # There's no screen
+    wh_analytics.application_start(model, (0, 0), ANALYTICS_SPOOL_FILE)
+    sentry_sdk.set_context("display", {"size": "headless"})
+
+    do4_observer = Observer()
+    do4_observer.start()
+    setup_do4_watcher(model, do4_observer)
+
+    icast = start_cast(model)
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, lambda *_: model.stop())
+        signal.signal(signal.SIGTERM, lambda *_: model.stop())
+    logger.info("Watching %s for results", model.dir_results.get())
+    model.run()
+
+    logger.debug("Stopping watcher")
+    do4_observer.unschedule_all()
+    do4_observer.stop()
+    icast.stop()
+    try:
+        model.save(CONFIG_FILE)
+    except PermissionError as err:
+        logger.warning("Unable to save configuration: %s", err)
+    wh_analytics.application_stop(model)
+    shutdown_sentry(hub)
+
+
+def main() -> None:
+    """Main program for headless mode"""
+    arg_parser = argparse.ArgumentParser()
+    add_logging_args(arg_parser)
+    setup_logging(arg_parser.parse_args())
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,46 +15,101 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
-This file provides the ImageCast class that can be used to publish static PNG
+This file provides the ImageCast class that can be used to publish static
 images to Chromecast devices. It abstracts the interactions with the Chromecast
 devices by managing connections and providing an integrated web server.
 """
 
+import json
 import logging
+import queue
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from typing import Any, Callable, Dict, List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
 from uuid import UUID
 
 import pychromecast  # type: ignore
-import sentry_sdk
 import zeroconf
 from PIL import Image  # type: ignore
 from pychromecast.controllers.media import BaseMediaPlayer  # type: ignore
-from pychromecast.error import NotConnected  # type: ignore
-
-# Resolution of images for the Chromecast
-IMAGE_SIZE = (1280, 720)
-
-# Chromecast image refresh interval (seconds)
-# Newer versions of the Chromecast firmware seem to have a 10 minute timeout
-_REFRESH_INTERVAL = 7 * 60
+from pychromecast.error import NotConnected, RequestTimeout  # type: ignore
+from pychromecast.models import HostServiceInfo  # type: ignore
+from pychromecast.socket_client import (  # type: ignore
+    CONNECTION_STATUS_CONNECTED,
+    ConnectionStatus,
+    ConnectionStatusListener,
+)
+
+import metrics
+import tracing
+from encoder import EncodingProfile
+from framechannel import FrameChannel, LatestSlot, frame_fingerprint
+from keepalive import REFRESH_INTERVAL, REFRESH_JITTER, KeepaliveScheduler
+from knowndevices import (
+    DeviceStatus,
+    KnownDevice,
+    load_known_devices,
+    save_known_devices,
+)
+from latency import LatencyTracker, Stage
+from rendercache import (
+    IMAGE_SIZE,
+    RenderCache,
+    RenderFn,
+    ScheduleFn,
+    Size,
+    format_size,
+    parse_size,
+)
+
+# Maximum time (seconds) the refresh thread sleeps before checking whether a
+# device needs to be refreshed
+_REFRESH_MAX_SLEEP = 10
 
 # Chomecast application id
 _WAHOO_RESULTS_APP_ID = "34B218B6"
 
+# Number of Chromecast connections that may be set up in parallel
+_CONNECT_WORKERS = 4
+# How long to wait (seconds) for a new Chromecast connection to come up
+_CONNECT_TIMEOUT = 2
+
+# How often (seconds) to send a comment on idle event streams so that dead
+# connections get noticed
+_EVENT_PING_INTERVAL = 15
+
+# Boundary between the images of a multipart stream
+_STREAM_BOUNDARY = "wahoo-frame"
+
+# mDNS service type advertised by the Chromecasts
+_MDNS_SERVICE_TYPE = "_googlecast._tcp.local."
+# Bit in the mDNS "ca" (capabilities) TXT record indicating video output
+_CAPABILITY_VIDEO_OUT = 0x01
+
 logger = logging.getLogger(__name__)
 
 
 @dataclass
-class DeviceStatus:
-    """The status of a Chromecast device"""
+class PublishStats:
+    """Counters describing the work done (and avoided) when publishing"""
 
-    uuid: UUID  # UUID for the device
-    name: str  # Friendly name for the device
-    enabled: bool  # Whether the device is enabled
+    publishes: int = 0  # Calls to publish()
+    skipped_publishes: int = 0  # Publishes where no device needed the frame
+    loads: int = 0  # Images loaded onto devices
+    skipped_loads: int = 0  # Device loads avoided because the frame matched
+
+
+@dataclass
+class WebContent:
+    """A document served by the embedded web server"""
+
+    data: bytes  # The document
+    mime_type: str  # The MIME type of the document
+    immutable: bool  # Whether the document at this path will never change
 
 
 DiscoveryCallbackFn = Callable[[], None]
@@ -78,6 +133,18 @@ class ICController(BaseMediaPlayer):
         )
 
 
+# pylint: disable-next=too-few-public-methods
+class _ReconnectListener(ConnectionStatusListener):
+    """Calls a function each time a device's connection is re-established"""
+
+    def __init__(self, on_reconnect: Callable[[], None]):
+        self._on_reconnect = on_reconnect
+
+    def new_connection_status(self, status: ConnectionStatus) -> None:
+        if status.status == CONNECTION_STATUS_CONNECTED:
+            self._on_reconnect()
+
+
 class ImageCast:  # pylint: disable=too-many-instance-attributes
     """
     The ImageCast class encapsulates everything necessary to cast images to a
@@ -88,25 +155,78 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
     # _devices maps the chromecast uuid to a map of:
     #    "cast" -> its chromecast object
     #    "enabled" -> boolean indicating whether we should cast to this device
+    #    "frame" -> fingerprint of the last frame the device loaded (or None)
+    #    "size" -> image size for the device (None for IMAGE_SIZE)
     devices: Dict[UUID, Dict[str, Any]]
     _webserver_thread: Optional[threading.Thread]
     _refresh_thread: Optional[threading.Thread]
-    image: Optional[Image.Image]
+    _channel: FrameChannel  # The published scoreboard images (IMAGE_SIZE)
+    _renders: RenderCache  # The scoreboard at other sizes / w/o background
+    stats: PublishStats
     callback_fn: Optional[DiscoveryCallbackFn]
     browser: Optional[pychromecast.CastBrowser]
     zconf: Optional[zeroconf.Zeroconf]
-
-    def __init__(self, server_port: int) -> None:
+    _keepalive: KeepaliveScheduler
+    _lock: threading.Lock  # Protects devices and _pending
+    _pending: Set[UUID]  # Devices with a connection attempt in progress
+    _connect_pool: ThreadPoolExecutor
+    _device_cache: Optional[str]  # File used to persist the known devices
+    _save_lock: threading.Lock  # Keeps the saves of _known in order
+    _known: Dict[UUID, KnownDevice]  # Devices we've seen before
+    # Event streams of the browsers. Protected by _lock.
+    _subscribers: Set["queue.Queue[str]"]
+    _content: Dict[str, WebContent]  # Additional documents, by path
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(
+        self,
+        server_port: int,
+        refresh_interval: float = REFRESH_INTERVAL,
+        refresh_jitter: float = REFRESH_JITTER,
+        device_cache: Optional[str] = None,
+        encoding: EncodingProfile = EncodingProfile.PNG,
+        latency: Optional[LatencyTracker] = None,
+    ) -> None:
         """
         Create an instance to communicate with a set of Chromecast devices.
 
         Parameters:
             - server_port: The port on the local machine that will host the
-              embedded web server for the Chromecast(s) to connect to.
+              embedded web server for the Chromecast(s) to connect to. 0
+              uses any free port.
+            - refresh_interval: How often (seconds) each device is refreshed
+              to keep it from timing out
+            - refresh_jitter: The maximum amount (seconds) by which each
+              refresh interval is randomly shortened
+            - device_cache: File in which to remember the Chromecasts we've
+              seen so they can be reconnected immediately on the next start
+            - encoding: How the images are encoded when sent to the devices
+            - latency: Records when each result is encoded, sent to the
+              devices, and downloaded by them
         """
         self._server_port = server_port
+        self._keepalive = KeepaliveScheduler(refresh_interval, refresh_jitter)
         self.devices = {}
-        self.image = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._subscribers = set()
+        self._content = {}
+        self._connect_pool = ThreadPoolExecutor(
+            max_workers=_CONNECT_WORKERS, thread_name_prefix="cc-connect"
+        )
+        self._device_cache = device_cache
+        self._save_lock = threading.Lock()
+        self._known = {}
+        self._channel = FrameChannel(encoding)
+        self._renders = RenderCache(
+            self._channel,
+            IMAGE_SIZE,
+            encoding,
+            pinned=self._device_sizes,
+            on_rendered=self._reload_sized_devices,
+        )
+        self.stats = PublishStats()
+        self._latency = latency if latency is not None else LatencyTracker()
         self.callback_fn = None
         self._webserver_thread = None
         self._refresh_thread = None
@@ -119,6 +239,7 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
         images.
         """
         self._start_webserver()
+        self._connect_known()
         self._start_listener()
         self._start_refresh()
 
@@ -128,10 +249,11 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
         Chromecast(s).
         """
         logger.debug("Stopping ImageCast and disconnecting from Chromecasts")
+        self._connect_pool.shutdown(wait=False, cancel_futures=True)
         # Separate generating the list from disconnecting becase disconnecting
         # can alter the list
         to_disconnect: list[pychromecast.Chromecast] = []
-        for state in self.devices.values():
+        for state in self._device_states():
             if state["enabled"]:
                 to_disconnect.append(state["cast"])
         for cast in to_disconnect:
@@ -143,11 +265,11 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
 
     @classmethod
     def _disconnect(cls, cast: pychromecast.Chromecast) -> None:
-        with sentry_sdk.start_span(op="disconnect"):
+        with tracing.span(op="disconnect"):
             logger.debug("Disconnecting from %s", cast.name)
             try:
                 cast.quit_app()
-            except NotConnected:
+            except pychromecast.PyChromecastError:  # Not connected or no reply
                 pass
 
     def set_discovery_callback(self, func: DiscoveryCallbackFn) -> None:
@@ -162,26 +284,83 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
         Set whether to include or exclude a specific Chromecast device from
         receiving the published images.
         """
-        with sentry_sdk.start_transaction(
-            op="enable_cc", name="Enable/disable Chromecast"
-        ):
+        with tracing.transaction(op="enable_cc", name="Enable/disable Chromecast"):
             if self.devices[uuid] is not None:
                 previous = self.devices[uuid]["enabled"]
                 self.devices[uuid]["enabled"] = enabled
+                if previous != enabled:
+                    self._remember(self.devices[uuid]["cast"], enabled)
                 if enabled and not previous:  # enabling: send the latest image
                     logger.debug("Enabling %s", self.devices[uuid]["cast"].name)
+                    self._renders.render_stale()
                     self._publish_one(self.devices[uuid]["cast"])
                 elif previous and not enabled:  # disabling: disconnect
                     logger.debug("Disabling %s", self.devices[uuid]["cast"].name)
+                    self._keepalive.forget(uuid)
+                    self.devices[uuid]["frame"] = None
                     self._disconnect(self.devices[uuid]["cast"])
 
+    @property
+    def image(self) -> Optional[Image.Image]:
+        """The most recently published image"""
+        return self._channel.image
+
+    def set_encoding(self, encoding: EncodingProfile) -> None:
+        """
+        Set how images are encoded. This takes effect the next time an image
+        is sent to a device.
+        """
+        self._renders.set_encoding(encoding)
+
+    def set_renderer(self, render: RenderFn, schedule: ScheduleFn) -> None:
+        """
+        Set the function used to render the scoreboard at sizes other than
+        IMAGE_SIZE and w/o its background. Without it, only the published
+        images are available.
+
+        Parameters:
+            - render: Renders the current scoreboard. It is called from
+              enable() and from the functions passed to schedule().
+            - schedule: Arranges for a function to be called on the thread
+              that calls publish(). It may be called from any thread.
+        """
+        self._renders.set_renderer(render, schedule)
+
+    def set_content(
+        self, path: str, data: bytes, mime_type: str, immutable: bool = False
+    ) -> None:
+        """
+        Serve a document from the embedded web server and notify the event
+        stream subscribers that it has changed.
+
+        Parameters:
+            - path: The URL path of the document (e.g., "/result.json")
+            - data: The contents of the document
+            - mime_type: The MIME type of the document
+            - immutable: True if the document at this path will never change,
+              allowing clients to cache it indefinitely
+        """
+        with self._lock:
+            self._content[path] = WebContent(data, mime_type, immutable)
+            streams = list(self._subscribers)
+        message = _sse_event("content", {"path": path})
+        for events in streams:
+            events.put(message)
+
+    def remove_content(self, path: str) -> None:
+        """Stop serving a document that was added via set_content()"""
+        with self._lock:
+            self._content.pop(path, None)
+
     def get_devices(self) -> List[DeviceStatus]:
         """
         Get the current list of known Chromecast devices and whether they are
         currently enabled.
         """
         devs: List[DeviceStatus] = []
-        for uuid, state in self.devices.items():
+        with self._lock:
+            states = list(self.devices.items())
+        for uuid, state in states:
             devs.append(
                 DeviceStatus(
                     uuid, state["cast"].cast_info.friendly_name, state["enabled"]
@@ -192,81 +371,380 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
     def publish(self, image: Image.Image) -> None:
         """
         Publish a new image to the currently enabled Chromecast devices.
+
+        Devices that have already loaded an identical image are skipped.
+        Browsers subscribed to the event stream are told about new images.
         """
-        with sentry_sdk.start_transaction(
-            op="publish_image", name="Publish image"
-        ) as txn:
-            num = len([x for x in self.devices.values() if x["enabled"]])
-            txn.set_tag("enabled_cc", num)
-            self.image = image
-            for state in self.devices.values():
-                if state["enabled"]:
+        with tracing.transaction(op="publish_image", name="Publish image") as txn:
+            frame = frame_fingerprint(image)
+            states = [x for x in self._device_states() if x["enabled"]]
+            txn.set_tag("enabled_cc", len(states))
+            self._latency.link_latest(frame)
+            changed = frame != self._channel.frame
+            self._channel.set_image(image, frame)
+            if changed:
+                with self._lock:
+                    streams = list(self._subscribers)
+                message = _sse_event("frame", {"frame": frame})
+                for events in streams:
+                    events.put(message)
+            # The other sizes are rendered separately, so the devices using
+            # the published image don't wait for them
+            self._renders.request_render()
+            self.stats.publishes += 1
+            stale = [x for x in states if x["frame"] != frame]
+            skipped = len(states) - len(stale)
+            self.stats.skipped_loads += skipped
+            metrics.LOADS_SKIPPED.inc(amount=skipped)
+            txn.set_tag("skipped_cc", skipped)
+            if states and not stale:
+                self.stats.skipped_publishes += 1
+                metrics.PUBLISHES_SKIPPED.inc()
+                logger.info("Frame unchanged, skipping publish")
+                return
+            if skipped:
+                logger.info("Frame unchanged on %d device(s), skipping them", skipped)
+            self._keepalive.published()
+            for state in stale:
+                # Devices w/ their own size are loaded once it's rendered
+                if self._size_ready(state["size"]):
                     self._publish_one(state["cast"])
 
+    def _device_states(self) -> List[Dict[str, Any]]:
+        """A snapshot of the device states that is safe to iterate"""
+        with self._lock:
+            return list(self.devices.values())
+
+    def _device_name(self, uuid: Optional[UUID]) -> Optional[str]:
+        """The label of a device, or None if it's not known"""
+        if uuid is None:
+            return None
+        with self._lock:
+            state = self.devices.get(uuid)
+        if state is None:
+            return None
+        return _device_label(state["cast"])
+
+    def _device_sizes(self) -> Set[Size]:
+        """The image sizes used by the devices"""
+        with self._lock:
+            return {x["size"] for x in self.devices.values() if x["size"]}
+
+    def _device_channel(self, uuid: UUID) -> Tuple[FrameChannel, Optional[Size], bool]:
+        """
+        The channel to use for a device, along w/ the image size to request
+        (None for IMAGE_SIZE). If the image for the device's size hasn't been
+        rendered yet, a render is requested and the default image is used in
+        the meantime. The returned bool is False in that case.
+        """
+        with self._lock:
+            size = self.devices.get(uuid, {}).get("size")
+        if size is None or size == IMAGE_SIZE:
+            return (self._channel, None, True)
+        channel = self._renders.channel(True, size)
+        if channel is None or channel is self._channel:  # Can't be rendered
+            return (self._channel, None, True)
+        if not self._renders.is_current(True, size):
+            self._renders.request_render()
+            return (self._channel, None, False)
+        return (channel, size, True)
+
+    def _size_ready(self, size: Optional[Size]) -> bool:
+        """
+        Whether the image for a device's size can be sent now, either because
+        it's been rendered or because the device gets the default image.
+        """
+        if size is None or size == IMAGE_SIZE:
+            return True
+        if self._renders.channel(True, size) is None:
+            return True
+        return self._renders.is_current(True, size)
+
+    def _reload_sized_devices(self) -> None:
+        """
+        Send the newly rendered images to the devices w/ their own size that
+        got the default image while waiting for them.
+        """
+        frame = self._channel.frame
+        for state in self._device_states():
+            if state["enabled"] and state["size"] and state["frame"] != frame:
+                self._publish_one(state["cast"])
+
+    def _subscribe(self, events: "queue.Queue[str]") -> None:
+        """Attach a browser's event stream"""
+        logger.debug("Event stream subscribed")
+        with self._lock:
+            self._subscribers.add(events)
+
+    def _unsubscribe(self, events: "queue.Queue[str]") -> None:
+        """Detach a browser's event stream"""
+        logger.debug("Event stream closed")
+        with self._lock:
+            self._subscribers.discard(events)
+
     def _publish_one(self, cast: pychromecast.Chromecast) -> None:
-        with sentry_sdk.start_span(op="publish_one"):
-            if self.image is None:
+        with tracing.span(op="publish_one"):
+            channel, size, final = self._device_channel(cast.uuid)
+            current = channel.encoded()
+            # If the device didn't get the image for its size, leave it
+            # marked as needing the frame
+            frame = self._channel.frame if final else None
+            if current is None:
                 return
+            self._latency.mark_frame(frame, Stage.ENCODED)
+            encoded = current[1]
             # Use the local address of the socket to handle environments with
             # multiple NICs and cases where the host IP changes.
-            sock = cast.socket_client.get_socket()
+            sock = cast.socket_client.socket
             if sock is None:
+                self._keepalive.failed(cast.uuid)
                 return
             try:
                 local_addr = sock.getsockname()[0]
             except OSError:  # Socket is closed or not connected. Nothing to do.
+                self._keepalive.failed(cast.uuid)
                 return
             # Use the current time as the URL to force the CC to refresh the image
-            sec = int(time.time())
-            url = f"http://{local_addr}:{self._server_port}/image-{sec}.png"
+            # The device id lets the server attribute the download to it
+            query = {"device": str(cast.uuid)}
+            if size is not None:
+                query["size"] = format_size(size)
+            url = (
+                f"http://{local_addr}:{self._server_port}/"
+                f"image-{int(time.time())}.{encoded.extension}?{urlencode(query)}"
+            )
             # Set media controller to use our app
             controller = ICController()
             cast.register_handler(controller)
             logger.debug("Publishing to %s", cast.name)
+            label = _device_label(cast)
+            start = time.perf_counter()
             try:
-                controller.quick_play(url, "image/png")
+                controller.quick_play(url, encoded.mime_type)
+                metrics.PUBLISH_SECONDS.observe(time.perf_counter() - start, label)
+                metrics.PUBLISHES.inc(label, "success")
+                self._latency.mark_frame(frame, Stage.SENT, label)
+                self._keepalive.loaded(cast.uuid)
+                self.stats.loads += 1
+                with self._lock:
+                    if cast.uuid in self.devices:
+                        self.devices[cast.uuid]["frame"] = frame
             except NotConnected:
                 logger.debug("Error: NotConnected while publishing to %s", cast.name)
+                metrics.PUBLISHES.inc(label, "failure")
+                self._keepalive.failed(cast.uuid)
             except pychromecast.PyChromecastError:
                 logger.debug(
                     "Error: PyChromecastError while publishing to %s", cast.name
                 )
+                metrics.PUBLISHES.inc(label, "failure")
+                self._keepalive.failed(cast.uuid)
             finally:
                 cast.unregister_handler(controller)
 
-    def _start_webserver(self) -> None:
+    def _start_webserver(self) -> None:  # pylint: disable=too-many-statements
         parent = self
 
+        # The handler is part of ImageCast, so it uses the internal state
+        # pylint: disable=protected-access
         class WSHandler(BaseHTTPRequestHandler):
             """Handle web requests coming from the CCs"""
 
             def do_GET(self):  # pylint: disable=invalid-name
-                """Respond to CC w/ the current image"""
-                with sentry_sdk.start_transaction(op="http", name="GET"):
+                """Respond to CC w/ the current image or the event stream"""
+                request = urlsplit(self.path)
+                if request.path == "/events":
+                    self._serve_events()
+                    return
+                if request.path == "/stream":
+                    self._serve_stream(parse_qs(request.query))
+                    return
+                if request.path == "/metrics":
+                    self._serve_metrics()
+                    return
+                with parent._lock:
+                    content = parent._content.get(request.path)
+                if content is not None:
+                    self._serve_content(content)
+                    return
+                with tracing.transaction(op="http", name="GET"):
+                    query = parse_qs(request.query)
+                    channel = self._requested_channel(query)
+                    if channel is None:
+                        return
+                    current = channel.encoded()
+                    if current is None:
+                        self.send_error(404)
+                        return
+                    frame = parent._channel.frame
+                    parent._latency.mark_frame(frame, Stage.ENCODED)
+                    encoded = current[1]
+                    self.send_response(200)
+                    self.send_header("Content-type", encoded.mime_type)
+                    self.send_header("Content-Length", str(len(encoded.data)))
+                    self.end_headers()
+                    self.wfile.write(encoded.data)
+                    metrics.BYTES_SERVED.inc("image", amount=len(encoded.data))
+                    parent._latency.mark_frame(
+                        frame, Stage.SERVED, self._viewer_name(query)
+                    )
+
+            def _viewer_name(self, query: Dict[str, List[str]]) -> str:
+                """The device that sent a request, or its address if unknown"""
+                try:
+                    uuid = UUID(query["device"][0]) if "device" in query else None
+                except ValueError:
+                    uuid = None
+                name = parent._device_name(uuid)
+                return name if name is not None else self.client_address[0]
+
+            def _requested_channel(
+                self, query: Dict[str, List[str]]
+            ) -> Optional[FrameChannel]:
+                """
+                The channel for the image requested via the query parameters:
+                - size=WIDTHxHEIGHT: Render the image at this size
+                - transparent=1: Render the image w/o its background
+                Sends an error and returns None if the request is invalid or
+                the image can't be rendered.
+                """
+                size: Optional[Size] = IMAGE_SIZE
+                if "size" in query:
+                    size = parse_size(query["size"][0])
+                if size is None:
+                    self.send_error(400, "Invalid size")
+                    return None
+                background = query.get("transparent", ["0"])[0] in ["0", ""]
+                channel = parent._renders.wait_for(background, size)
+                if channel is None:
+                    self.send_error(503, "Too many image sizes in use")
+                return channel
+
+            def _serve_content(self, content: WebContent) -> None:
+                """Respond w/ a document added via set_content()"""
+                self.send_response(200)
+                self.send_header("Content-type", content.mime_type)
+                self.send_header("Content-Length", str(len(content.data)))
+                if content.immutable:
+                    self.send_header("Cache-Control", "max-age=31536000, immutable")
+                else:
+                    self.send_header("Cache-Control", "no-cache")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(content.data)
+                metrics.BYTES_SERVED.inc("content", amount=len(content.data))
+
+            def _serve_metrics(self) -> None:
+                """Respond w/ the metrics in the Prometheus text format"""
+                data = metrics.REGISTRY.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-type", metrics.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _serve_events(self) -> None:
+                """Stream updates to a browser as Server-Sent Events"""
+                events: "queue.Queue[str]" = queue.Queue()
+                parent._subscribe(events)
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("Access-Control-Allow-Origin", "*")
+                    self.end_headers()
+                    while True:
+                        try:
+                            message = events.get(timeout=_EVENT_PING_INTERVAL)
+                        except queue.Empty:
+                            message = ": ping\n\n"
+                        data = message.encode("utf-8")
+                        self.wfile.write(data)
+                        metrics.BYTES_SERVED.inc("events", amount=len(data))
+                        self.wfile.flush()
+                except OSError:  # The browser went away
+                    pass
+                finally:
+                    parent._unsubscribe(events)
+
+            def _serve_stream(self, query: Dict[str, List[str]]) -> None:
+                """
+                Stream the images as multipart/x-mixed-replace (e.g., for OBS
+                or a browser). A viewer that can't keep up only gets the
+                latest image.
+                """
+                channel = self._requested_channel(query)
+                if channel is None:
+                    return
+                viewer = channel.add_viewer()
+                try:
                     self.send_response(200)
-                    self.send_header("Content-type", "image/png")
+                    self.send_header(
+                        "Content-type",
+                        f"multipart/x-mixed-replace; boundary={_STREAM_BOUNDARY}",
+                    )
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("Access-Control-Allow-Origin", "*")
                     self.end_headers()
-                    if parent.image is not None:
-                        parent.image.save(self.wfile, "PNG", optimize=True)
+                    self._stream_frames(channel, viewer)
+                except OSError:  # The viewer went away
+                    pass
+                finally:
+                    channel.remove_viewer(viewer)
+
+            def _stream_frames(
+                self, channel: FrameChannel, viewer: LatestSlot[str]
+            ) -> None:
+                while True:
+                    # Re-send the current image periodically so that dead
+                    # connections get noticed
+                    viewer.get(timeout=_EVENT_PING_INTERVAL)
+                    current = channel.encoded()
+                    if current is None:
+                        continue
+                    encoded = current[1]
+                    self.wfile.write(
+                        f"--{_STREAM_BOUNDARY}\r\n"
+                        f"Content-Type: {encoded.mime_type}\r\n"
+                        f"Content-Length: {len(encoded.data)}\r\n\r\n".encode()
+                    )
+                    self.wfile.write(encoded.data)
+                    self.wfile.write(b"\r\n")
+                    self.wfile.flush()
+                    metrics.BYTES_SERVED.inc("stream", amount=len(encoded.data))
+                    parent._latency.mark_frame(
+                        parent._channel.frame, Stage.SERVED, self.client_address[0]
+                    )
 
             def log_message(self, format, *args):  # pylint: disable=redefined-builtin
                 logger.debug(format, *args)
 
-        def _webserver_run():
-            web_server = HTTPServer(("", self._server_port), WSHandler)
-            web_server.serve_forever()
-
-        self._webserver_thread = threading.Thread(target=_webserver_run, daemon=True)
+        web_server = ThreadingHTTPServer(("", self._server_port), WSHandler)
+        # Port 0 is replaced by the one that was assigned
+        self._server_port = web_server.server_address[1]
+        self._webserver_thread = threading.Thread(
+            target=web_server.serve_forever, daemon=True
+        )
         self._webserver_thread.start()
 
-    # The refresh thread periodically re-publishes the current image to ensure
-    # the Chromecast devices don't timeout.
+    # The refresh thread re-publishes the current image to each device as it
+    # approaches its idle timeout. The scheduler spaces the refreshes out and
+    # keeps them away from real publishes.
     def _start_refresh(self) -> None:
         def _refresh_run():
             while True:
-                time.sleep(_REFRESH_INTERVAL)
-                if self.image is not None:
-                    self.publish(self.image)
+                time.sleep(min(self._keepalive.next_wakeup(), _REFRESH_MAX_SLEEP))
+                uuid = self._keepalive.next_due()
+                if uuid is None:
+                    continue
+                with self._lock:
+                    state = self.devices.get(uuid)
+                if state is None or not state["enabled"]:
+                    self._keepalive.forget(uuid)
+                    continue
+                logger.debug("Refreshing %s", state["cast"].name)
+                self._publish_one(state["cast"])
 
         self._refresh_thread = threading.Thread(target=_refresh_run, daemon=True)
         self._refresh_thread.start()
@@ -276,6 +754,8 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
     def _start_listener(self) -> None:
         parent = self
 
+        # The listener is part of ImageCast, so it manages the internal state
+        # pylint: disable=protected-access
         class Listener(pychromecast.discovery.AbstractCastListener):
             """Receive chromecast discovery updates"""
 
@@ -287,50 +767,204 @@ class ImageCast:  # pylint: disable=too-many-instance-attributes
 
             def remove_cast(self, uuid: UUID, service, cast_info):
                 logger.debug("Got remove cast: %s", str(uuid))
-                try:
-                    del parent.devices[uuid]
-                except KeyError:
-                    # received a removal message for a CC we weren't tracking.
-                    # Ignore it.
-                    pass
-                if parent.callback_fn is not None:
+                parent._keepalive.forget(uuid)
+                with parent._lock:
+                    # It's ok to receive a removal message for a CC we weren't
+                    # tracking.
+                    removed = parent.devices.pop(uuid, None)
+                if removed is not None and parent.callback_fn is not None:
                     parent.callback_fn()
 
             def update_cast(self, uuid: UUID, service) -> None:
-                with sentry_sdk.start_transaction(
+                with tracing.transaction(
                     op="cc_update", name="Chromecast update recieved"
                 ):
                     logger.debug("Got update cast: %s", str(uuid))
-                    if uuid not in parent.devices:  # new device
-                        if parent.browser is None:
-                            return
-                        svcs = parent.browser.services
-                        cast = pychromecast.get_chromecast_from_cast_info(
-                            svcs[uuid], parent.zconf
-                        )
-                        cast.wait(timeout=2)
-                        # We only care about devices that we can cast to (i.e., not
-                        # audio devices)
-                        if (
-                            cast.cast_info.cast_type
-                            != pychromecast.CAST_TYPE_CHROMECAST
-                        ):
-                            logger.debug("Not cast-able. Ignoring: %s", cast.name)
-                            cast.disconnect(timeout=0)  # don't block
-                            return
-                        logger.debug("Adding to device list: %s", cast.name)
-                        parent.devices[uuid] = {"cast": cast, "enabled": False}
-                    if parent.callback_fn is not None:
+                    with parent._lock:
+                        known = uuid in parent.devices
+                    if known:
+                        if parent.callback_fn is not None:
+                            logger.debug("Triggering callback for: %s", str(uuid))
+                            parent.callback_fn()
+                        return
+                    if parent.browser is None:
+                        return
+                    cast_info = parent.browser.services.get(uuid)
+                    if cast_info is None:
+                        return
+                    # We only care about devices that we can cast to (i.e., not
+                    # audio devices). Weed those out before connecting.
+                    if not _is_video_capable(parent.zconf, cast_info, service):
                         logger.debug(
-                            "Triggering callback for: %s",
-                            parent.devices[uuid]["cast"].name,
+                            "Not cast-able. Ignoring: %s", cast_info.friendly_name
                         )
-                        parent.callback_fn()
+                        return
+                    # Connecting can take a while, so it's handed off to the
+                    # worker pool to keep discovery moving.
+                    parent._connect_async(uuid, cast_info)
 
         self.zconf = zeroconf.Zeroconf()
         self.browser = pychromecast.discovery.CastBrowser(Listener(), self.zconf)
         self.browser.start_discovery()
 
+    def _connect_async(self, uuid: UUID, cast_info: pychromecast.CastInfo) -> None:
+        """Set up the connection to a newly discovered device in the background"""
+        with self._lock:
+            if uuid in self.devices or uuid in self._pending:
+                return
+            self._pending.add(uuid)
+        try:
+            self._connect_pool.submit(self._connect, uuid, cast_info)
+        except RuntimeError:  # The pool has been shut down
+            with self._lock:
+                self._pending.discard(uuid)
+
+    def _connect(self, uuid: UUID, cast_info: pychromecast.CastInfo) -> None:
+        with tracing.transaction(op="cc_connect", name="Connect Chromecast"):
+            try:
+                logger.debug("Connecting to %s", cast_info.friendly_name)
+                cast = pychromecast.get_chromecast_from_cast_info(cast_info, self.zconf)
+                try:
+                    cast.wait(timeout=_CONNECT_TIMEOUT)
+                except RequestTimeout:
+                    # We'll try again when discovery next reports the device
+                    logger.debug("Timeout connecting to %s", cast_info.friendly_name)
+                    cast.disconnect(timeout=0)  # don't block
+                    return
+                # The cast type may not have been known until we connected
+                if cast.cast_info.cast_type != pychromecast.CAST_TYPE_CHROMECAST:
+                    logger.debug("Not cast-able. Ignoring: %s", cast.name)
+                    cast.disconnect(timeout=0)  # don't block
+                    return
+                known = self._known.get(uuid)
+                enabled = known is not None and known.enabled
+                with self._lock:
+                    logger.debug("Adding to device list: %s", cast.name)
+                    self.devices[uuid] = {
+                        "cast": cast,
+                        "enabled": enabled,
+                        "frame": None,
+                        "size": known.size if known is not None else None,
+                    }
+                cast.register_connection_listener(
+                    _ReconnectListener(lambda: self._reconnected(cast))
+                )
+            finally:
+                with self._lock:
+                    self._pending.discard(uuid)
+            self._remember(cast, enabled)
+            if enabled:  # It was enabled last time, so send it the latest image
+                logger.debug("Re-enabling %s", cast.name)
+                self._publish_one(cast)
+            if self.callback_fn is not None:
+                logger.debug("Triggering callback for: %s", cast.name)
+                self.callback_fn()
+
+    def _reconnected(self, cast: pychromecast.Chromecast) -> None:
+        """
+        Resend the latest image to a device whose connection was reset (e.g.,
+        in the middle of a load) instead of waiting for its next refresh.
+        This is called from the device's socket thread, which must not wait
+        on the device, so the image is sent from the worker pool.
+        """
+        with self._lock:
+            state = self.devices.get(cast.uuid)
+            stale = (
+                state is not None
+                and state["enabled"]
+                and state["frame"] != self._channel.frame
+            )
+        if not stale:
+            return
+        logger.debug("Reconnected to %s, resending the image", cast.name)
+        try:
+            self._connect_pool.submit(self._publish_one, cast)
+        except RuntimeError:  # The pool has been shut down
+            pass
+
+    def _connect_known(self) -> None:
+        """Connect directly to the devices remembered from last time"""
+        if self._device_cache is None:
+            return
+        self._known = load_known_devices(self._device_cache)
+        for device in self._known.values():
+            logger.debug("Connecting to cached device: %s", device.name)
+            cast_info = pychromecast.CastInfo(
+                {HostServiceInfo(device.host, device.port)},
+                device.uuid,
+                None,
+                device.name,
+                device.host,
+                device.port,
+                # We only remember devices we're able to cast to
+                pychromecast.CAST_TYPE_CHROMECAST,
+                None,
+            )
+            self._connect_async(device.uuid, cast_info)
+
+    def _remember(self, cast: pychromecast.Chromecast, enabled: bool) -> None:
+        """Update the cache of known devices"""
+        if self._device_cache is None:
+            return
+        # The file is written w/o holding _lock so that publishing and
+        # discovery don't wait for the disk
+        with self._save_lock:
+            with self._lock:
+                self._known[cast.uuid] = KnownDevice(
+                    cast.uuid,
+                    cast.cast_info.host,
+                    cast.cast_info.port,
+                    cast.cast_info.friendly_name or "",
+                    enabled,
+                    self.devices.get(cast.uuid, {}).get("size"),
+                )
+                known = list(self._known.values())
+            save_known_devices(self._device_cache, known)
+
+
+def _sse_event(name: str, data: Dict[str, Any]) -> str:
+    """
+    Format a Server-Sent Event
+
+    >>> _sse_event("content", {"path": "/result.json"}).splitlines()
+    ['event: content', 'data: {"path": "/result.json"}', '']
+    """
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def _device_label(cast: pychromecast.Chromecast) -> str:
+    """
+    The name used for a device in the metrics and latency records. Devices
+    that haven't reported a friendly name use their UUID.
+    """
+    return str(cast.name or cast.uuid)
+
+
+def _is_video_capable(
+    zconf: Optional[zeroconf.Zeroconf], cast_info: pychromecast.CastInfo, service: str
+) -> bool:
+    """
+    Determine from the discovery information whether a device is able to
+    display images. When the type can't be determined from the mDNS data, the
+    device is assumed to be capable so that a connection will be attempted.
+    """
+    if cast_info.cast_type is not None:  # Known model or cast group
+        return cast_info.cast_type == pychromecast.CAST_TYPE_CHROMECAST
+    if zconf is None:
+        return True
+    # Check the capabilities bitmask from the TXT record. This only looks at
+    # the zeroconf cache, so it doesn't generate any network traffic.
+    info = zeroconf.ServiceInfo(_MDNS_SERVICE_TYPE, service)
+    if not info.load_from_cache(zconf):
+        return True
+    capabilities = info.properties.get(b"ca")
+    if capabilities is None:
+        return True
+    try:
+        return bool(int(capabilities) & _CAPABILITY_VIDEO_OUT)
+    except ValueError:
+        return True
+
 
 def _main():
     """Simple test of the ImageCast class."""
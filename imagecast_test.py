@@ -0,0 +1,162 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for publishing images to Chromecasts"""
+
+import queue
+import socket
+import time
+import urllib.request
+import uuid
+from types import SimpleNamespace
+
+from PIL import Image
+
+import imagecast
+import metrics
+from imagecast import ImageCast
+from latency import LatencyTracker, Stage
+
+
+def _fake_cast(sock: socket.socket) -> SimpleNamespace:
+    """Just enough of a Chromecast to publish to"""
+    return SimpleNamespace(
+        uuid=uuid.uuid4(),
+        name="Pool TV",
+        socket_client=SimpleNamespace(socket=sock),
+        register_handler=lambda _: None,
+        unregister_handler=lambda _: None,
+    )
+
+
+def _wait_for(check, timeout: float = 5) -> bool:
+    """Wait for a condition to become true"""
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _download(url: str) -> None:
+    """Fetch a URL like a Chromecast would, once the server is up"""
+    for _ in range(50):
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                response.read()
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+        except urllib.error.URLError as err:
+            if not isinstance(err.reason, ConnectionRefusedError):
+                raise
+            time.sleep(0.1)
+
+
+def test_unchanged_frame_is_not_reloaded(monkeypatch):
+    """A device is only sent an image when it differs from the last one"""
+    loads = []
+    monkeypatch.setattr(
+        imagecast.ICController,
+        "quick_play",
+        lambda _self, url, mime_type: loads.append(url),
+    )
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        cast = _fake_cast(sock)
+        icast = ImageCast(0)
+        icast.devices[cast.uuid] = {
+            "cast": cast,
+            "enabled": True,
+            "frame": None,
+            "size": None,
+        }
+        skipped = metrics.LOADS_SKIPPED.value()
+
+        icast.publish(Image.new("RGBA", (16, 9), "red"))
+        assert len(loads) == 1
+        icast.publish(Image.new("RGBA", (16, 9), "red"))
+        assert len(loads) == 1
+        assert icast.stats.skipped_publishes == 1
+        assert metrics.LOADS_SKIPPED.value() == skipped + 1
+        icast.publish(Image.new("RGBA", (16, 9), "blue"))
+        assert len(loads) == 2
+        assert icast.stats.loads == 2
+
+
+def test_new_frames_are_announced():
+    """Browsers on the event stream are told when the image changes"""
+    icast = ImageCast(0)
+    events = queue.Queue()
+    icast._subscribe(events)  # pylint: disable=protected-access
+    icast.publish(Image.new("RGBA", (16, 9), "red"))
+    icast.publish(Image.new("RGBA", (16, 9), "red"))
+    assert events.get_nowait().startswith("event: frame\n")
+    assert events.empty()
+
+
+def test_latency_is_recorded_per_device(monkeypatch):
+    """Loading an image on a device and its download are in the same row"""
+    monkeypatch.setattr(
+        imagecast.ICController,
+        "quick_play",
+        lambda _self, url, mime_type: _download(url),
+    )
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        cast = _fake_cast(sock)
+        latency = LatencyTracker()
+        with socket.socket() as probe:  # Find a free port for the server
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        icast = ImageCast(port, latency=latency)
+        icast.devices[cast.uuid] = {
+            "cast": cast,
+            "enabled": True,
+            "frame": None,
+            "size": None,
+        }
+        icast._start_webserver()  # pylint: disable=protected-access
+        latency.start("1-001-001A-0001.do4")
+        latency.mark("1-001-001A-0001.do4", Stage.RENDERED)
+        icast.publish(Image.new("RGBA", (16, 9), "red"))
+        heat = latency.heats()[0]
+        assert _wait_for(lambda: len(heat.elapsed(Stage.SERVED)) == 1)
+        assert list(heat.devices) == ["Pool TV"]
+        assert set(heat.devices["Pool TV"]) == {Stage.SENT, Stage.SERVED}
+        assert len(latency.to_csv().splitlines()) == 2  # Header + 1 device
+
+
+def test_unnamed_device_is_labelled_by_uuid(monkeypatch):
+    """A device w/o a friendly name is counted in the metrics under its UUID"""
+    monkeypatch.setattr(
+        imagecast.ICController, "quick_play", lambda _self, url, mime_type: None
+    )
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        cast = _fake_cast(sock)
+        cast.name = None
+        icast = ImageCast(0)
+        icast.devices[cast.uuid] = {
+            "cast": cast,
+            "enabled": True,
+            "frame": None,
+            "size": None,
+        }
+        icast.publish(Image.new("RGBA", (16, 9), "red"))
+        assert metrics.PUBLISHES.value(str(cast.uuid), "success") == 1
+        assert str(cast.uuid) in metrics.REGISTRY.render()
@@ -0,0 +1,163 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Scheduling of keepalive refreshes for the Chromecast devices.
+
+The Chromecasts drop our app if they go too long without loading new media.
+Instead of refreshing every device at a fixed interval, the scheduler tracks
+when each device last loaded an image and only refreshes the ones that are
+getting close to their idle timeout.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+ClockFn = Callable[[], float]
+RandomFn = Callable[[], float]
+
+# Chromecast image refresh interval (seconds)
+# Newer versions of the Chromecast firmware seem to have a 10 minute timeout
+REFRESH_INTERVAL = 7 * 60
+# Maximum random reduction of the refresh interval (seconds) so that devices
+# enabled at the same time don't all get refreshed together
+REFRESH_JITTER = 60
+
+
+class KeepaliveScheduler:  # pylint: disable=too-many-instance-attributes
+    """
+    Decides which device (if any) should be refreshed next.
+
+    A device is due for a refresh once ``interval`` seconds, less a random
+    amount of up to ``jitter`` seconds, have passed since its last successful
+    load. Due devices are handed out one at a time, at least ``spacing``
+    seconds apart, and never within ``quiet`` seconds of a real publish.
+
+    >>> now = 0.0
+    >>> sched = KeepaliveScheduler(100, 0, spacing=10, quiet=5,
+    ...                            clock=lambda: now)
+    >>> sched.loaded("a")
+    >>> now = 50.0
+    >>> sched.loaded("b")
+    >>> sched.next_due() is None
+    True
+    >>> now = 100.0
+    >>> sched.next_due()
+    'a'
+    >>> now = 150.0
+    >>> sched.published()
+    >>> sched.next_due() is None  # b is due, but a result was just published
+    True
+    >>> now = 156.0
+    >>> sched.next_due()
+    'b'
+    """
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(
+        self,
+        interval: float,
+        jitter: float,
+        spacing: float = 5,
+        quiet: float = 5,
+        retry: float = 60,
+        clock: ClockFn = time.monotonic,
+        rng: RandomFn = random.random,
+    ):
+        """
+        Parameters:
+        - interval: Seconds between refreshes of a device
+        - jitter: Maximum number of seconds to randomly shorten each interval
+          so that devices loaded together drift apart
+        - spacing: Minimum number of seconds between two refreshes
+        - quiet: Number of seconds after a real publish during which no
+          refreshes are handed out
+        - retry: Seconds to wait before retrying a device whose load failed
+        - clock: Source of the current (monotonic) time
+        - rng: Source of random numbers in [0, 1)
+        """
+        self.interval = interval
+        self.jitter = min(max(jitter, 0), interval)
+        self.spacing = spacing
+        self.quiet = quiet
+        self.retry = retry
+        self._clock = clock
+        self._rng = rng
+        self._lock = threading.Lock()
+        self._deadlines: Dict[Hashable, float] = {}
+        self._last_publish = float("-inf")
+        self._last_refresh = float("-inf")
+
+    def loaded(self, device: Hashable) -> None:
+        """Record that a device has successfully loaded an image"""
+        now = self._clock()
+        with self._lock:
+            self._deadlines[device] = now + self.interval - self._rng() * self.jitter
+
+    def failed(self, device: Hashable) -> None:
+        """Record that a device failed to load an image"""
+        now = self._clock()
+        with self._lock:
+            self._deadlines[device] = now + self.retry
+
+    def forget(self, device: Hashable) -> None:
+        """Stop tracking a device (e.g., it was disabled or removed)"""
+        with self._lock:
+            self._deadlines.pop(device, None)
+
+    def published(self) -> None:
+        """Record that a new result is being published to the devices"""
+        now = self._clock()
+        with self._lock:
+            self._last_publish = now
+
+    def next_due(self) -> Optional[Hashable]:
+        """
+        Return the device that should be refreshed now, or None if no refresh
+        should happen at this time. The returned device is considered to be in
+        progress until loaded(), failed(), or forget() is called for it.
+        """
+        now = self._clock()
+        with self._lock:
+            if now < self._not_before():
+                return None
+            device: Optional[Hashable] = None
+            for candidate, deadline in self._deadlines.items():
+                if deadline <= now and (
+                    device is None or deadline < self._deadlines[device]
+                ):
+                    device = candidate
+            if device is None:
+                return None
+            self._last_refresh = now
+            # Push the deadline out so the device isn't handed out again while
+            # the refresh is in flight
+            self._deadlines[device] = now + self.retry
+            return device
+
+    def next_wakeup(self) -> float:
+        """Number of seconds until a device may next become due"""
+        now = self._clock()
+        with self._lock:
+            if not self._deadlines:
+                return self.interval
+            earliest = max(min(self._deadlines.values()), self._not_before())
+        return max(earliest - now, 0)
+
+    def _not_before(self) -> float:
+        return max(self._last_refresh + self.spacing, self._last_publish + self.quiet)
@@ -0,0 +1,107 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for KeepaliveScheduler"""
+
+import pytest
+
+from keepalive import KeepaliveScheduler
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A controllable clock"""
+    return FakeClock()
+
+
+def test_recently_loaded_not_refreshed(clock):
+    """A device that was just published to doesn't get refreshed"""
+    sched = KeepaliveScheduler(100, 0, clock=clock)
+    sched.loaded("a")
+    clock.now = 99
+    assert sched.next_due() is None
+    clock.now = 100
+    assert sched.next_due() == "a"
+
+
+def test_refreshes_are_staggered(clock):
+    """Devices that come due together are refreshed one at a time"""
+    sched = KeepaliveScheduler(100, 0, spacing=10, quiet=0, clock=clock)
+    for dev in ["a", "b", "c"]:
+        sched.loaded(dev)
+    clock.now = 100
+    first = sched.next_due()
+    assert first is not None
+    assert sched.next_due() is None
+    assert sched.next_wakeup() == 10
+    clock.now = 110
+    second = sched.next_due()
+    assert second not in [None, first]
+    clock.now = 120
+    third = sched.next_due()
+    assert third not in [None, first, second]
+
+
+def test_no_refresh_near_publish(clock):
+    """Refreshes are held off right after a real publish"""
+    sched = KeepaliveScheduler(100, 0, spacing=0, quiet=5, clock=clock)
+    sched.loaded("a")
+    clock.now = 200
+    sched.published()
+    assert sched.next_due() is None
+    assert sched.next_wakeup() == 5
+    clock.now = 205
+    assert sched.next_due() == "a"
+
+
+def test_jitter_shortens_interval(clock):
+    """Jitter pulls the deadline earlier, but never past the last load"""
+    sched = KeepaliveScheduler(100, 30, clock=clock, rng=lambda: 0.5)
+    sched.loaded("a")
+    clock.now = 84
+    assert sched.next_due() is None
+    clock.now = 85
+    assert sched.next_due() == "a"
+
+
+def test_failed_device_retried(clock):
+    """A device whose load failed is retried after the retry interval"""
+    sched = KeepaliveScheduler(100, 0, retry=20, clock=clock)
+    sched.failed("a")
+    clock.now = 19
+    assert sched.next_due() is None
+    clock.now = 20
+    assert sched.next_due() == "a"
+
+
+def test_forgotten_device_not_refreshed(clock):
+    """Disabled/removed devices are never handed out"""
+    sched = KeepaliveScheduler(100, 0, clock=clock)
+    sched.loaded("a")
+    sched.forget("a")
+    clock.now = 1000
+    assert sched.next_due() is None
+    assert sched.next_wakeup() == 100
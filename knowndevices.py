@@ -0,0 +1,124 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Persistence of the Chromecasts that have been seen before, so they can be
+reconnected directly (w/o waiting for discovery) the next time.
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from rendercache import Size, format_size, parse_size
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeviceStatus:
+    """The status of a Chromecast device"""
+
+    uuid: UUID  # UUID for the device
+    name: str  # Friendly name for the device
+    enabled: bool  # Whether the device is enabled
+
+
+@dataclass
+class KnownDevice:
+    """A previously seen Chromecast that we can reconnect to directly"""
+
+    uuid: UUID  # UUID for the device
+    host: str  # IP address of the device
+    port: int  # Port of the cast protocol on the device
+    name: str  # Friendly name for the device
+    enabled: bool  # Whether the device was enabled
+    size: Optional[Size] = None  # Image size for the device, if not IMAGE_SIZE
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Convert to a JSON-compatible dict
+
+        >>> KnownDevice(UUID(int=1), "10.0.0.2", 8009, "TV", True).to_json()
+        {'uuid': '00000000-0000-0000-0000-000000000001', 'host': '10.0.0.2', \
+'port': 8009, 'name': 'TV', 'enabled': True}
+        >>> KnownDevice(UUID(int=1), "10.0.0.2", 8009, "TV", True,
+        ...             (3840, 2160)).to_json()["size"]
+        '3840x2160'
+        """
+        data: Dict[str, Any] = {
+            "uuid": str(self.uuid),
+            "host": self.host,
+            "port": self.port,
+            "name": self.name,
+            "enabled": self.enabled,
+        }
+        if self.size is not None:
+            data["size"] = format_size(self.size)
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "KnownDevice":
+        """
+        Create from a dict produced by to_json()
+
+        >>> KnownDevice.from_json({"uuid": "00000000-0000-0000-0000-000000000001",
+        ...     "host": "10.0.0.2", "port": 8009, "name": "TV", "enabled": True})
+        KnownDevice(uuid=UUID('00000000-0000-0000-0000-000000000001'), \
+host='10.0.0.2', port=8009, name='TV', enabled=True, size=None)
+        """
+        return cls(
+            UUID(data["uuid"]),
+            str(data["host"]),
+            int(data["port"]),
+            str(data["name"]),
+            bool(data["enabled"]),
+            parse_size(str(data.get("size", ""))),
+        )
+
+
+def load_known_devices(filename: str) -> Dict[UUID, KnownDevice]:
+    """Load the known devices from a file, returning them by uuid"""
+    known: Dict[UUID, KnownDevice] = {}
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            entries = json.load(file)
+        for entry in entries:
+            device = KnownDevice.from_json(entry)
+            known[device.uuid] = device
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as err:
+        logger.warning("Unable to load Chromecast cache: %s", err)
+        return {}
+    return known
+
+
+def save_known_devices(filename: str, devices: List[KnownDevice]) -> None:
+    """Save the known devices to a file"""
+    entries = [device.to_json() for device in devices]
+    # Write to a temp file and rename so a crash can't leave a partially
+    # written cache
+    tmpfile = filename + ".tmp"
+    try:
+        with open(tmpfile, "w", encoding="utf-8") as file:
+            json.dump(entries, file, indent=2)
+        os.replace(tmpfile, filename)
+    except OSError as err:
+        logger.warning("Unable to save Chromecast cache: %s", err)
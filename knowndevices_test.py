@@ -0,0 +1,47 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for remembering the known Chromecasts"""
+
+import os
+from uuid import UUID
+
+from knowndevices import KnownDevice, load_known_devices, save_known_devices
+
+_TV = KnownDevice(UUID(int=1), "10.0.0.2", 8009, "Pool TV", True)
+_LOBBY = KnownDevice(UUID(int=2), "10.0.0.3", 8009, "Lobby", False, (1920, 1080))
+
+
+def test_round_trip(tmp_path):
+    """Saved devices are loaded back unchanged"""
+    cache = str(tmp_path / "devices.json")
+    save_known_devices(cache, [_TV, _LOBBY])
+    assert load_known_devices(cache) == {_TV.uuid: _TV, _LOBBY.uuid: _LOBBY}
+    assert not os.path.exists(cache + ".tmp")
+
+
+def test_missing_cache(tmp_path):
+    """There are no known devices before the cache is first saved"""
+    assert not load_known_devices(str(tmp_path / "devices.json"))
+
+
+def test_corrupt_cache(tmp_path):
+    """A damaged cache is ignored rather than stopping the startup"""
+    cache = tmp_path / "devices.json"
+    cache.write_text('[{"uuid": "not-a-uuid", "host": "10.0.0.2"}', encoding="utf-8")
+    assert not load_known_devices(str(cache))
+    cache.write_text('[{"uuid": "not-a-uuid"}]', encoding="utf-8")
+    assert not load_known_devices(str(cache))
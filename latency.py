@@ -0,0 +1,275 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Latency of each result, from the .do4 file appearing to the displays
+showing it.
+
+Each heat is timestamped as it passes through the stages of the pipeline.
+The stages after rendering are tracked by the fingerprint of the published
+scoreboard image, and the ones that happen per display are recorded for each
+device.
+"""
+
+import csv
+import enum
+import io
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+ClockFn = Callable[[], float]
+ChangeFn = Callable[[], None]
+
+
+class Stage(enum.Enum):
+    """The stages of processing a result, in order"""
+
+    CREATED = "created"  # The .do4 file was noticed by the watcher
+    PARSED = "parsed"  # The file was read (after any retries) and parsed
+    NAMED = "named"  # The names from the start list were linked
+    RENDERED = "rendered"  # The scoreboard image was rendered
+    READY = "ready"  # The result was updated and the image is ready to publish
+    ENCODED = "encoded"  # The image was encoded for the displays
+    SENT = "sent"  # A device was told to load the image (per device)
+    SERVED = "served"  # A device downloaded the image (per device)
+
+
+PER_DEVICE = [Stage.SENT, Stage.SERVED]
+
+
+@dataclass
+class HeatLatency:
+    """The times (clock seconds) at which a heat reached each stage"""
+
+    file: str
+    event: str = ""
+    heat: int = 0
+    frame: Optional[str] = None  # Fingerprint of the published scoreboard
+    stamps: Dict[Stage, float] = field(default_factory=dict)
+    # Per-device stamps, by device name
+    devices: Dict[str, Dict[Stage, float]] = field(default_factory=dict)
+
+    def elapsed(self, stage: Stage) -> List[float]:
+        """
+        The time (seconds) from the file appearing until the heat reached a
+        stage. Per-device stages have a value for each device.
+        """
+        start = self.stamps.get(Stage.CREATED)
+        if start is None:
+            return []
+        if stage in PER_DEVICE:
+            stamps = [x[stage] for x in self.devices.values() if stage in x]
+        else:
+            stamps = [self.stamps[stage]] if stage in self.stamps else []
+        return [stamp - start for stamp in stamps]
+
+
+@dataclass
+class StageSummary:
+    """The distribution of the latency (ms) to reach a stage"""
+
+    stage: Stage
+    count: int
+    p50: float
+    p95: float
+    max: float
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    The nearest-rank percentile of a list of values
+
+    >>> percentile([5, 1, 4, 2, 3], 50)
+    3
+    >>> percentile([5, 1, 4, 2, 3], 95)
+    5
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyTracker:
+    """
+    Records the stages of the most recent heats. It may be used from any
+    thread.
+
+    >>> now = 0.0
+    >>> tracker = LatencyTracker(clock=lambda: now)
+    >>> tracker.start("1-001-001A-0001.do4")
+    >>> now = 0.5
+    >>> tracker.mark("1-001-001A-0001.do4", Stage.RENDERED)
+    >>> tracker.link_latest("frame1")
+    >>> now = 1.25
+    >>> tracker.mark_frame("frame1", Stage.SENT, "Pool TV")
+    >>> [(s.stage.value, s.p50) for s in tracker.summary()]
+    [('rendered', 500.0), ('sent', 1250.0)]
+    """
+
+    def __init__(self, capacity: int = 500, clock: ClockFn = time.time):
+        """
+        Parameters:
+        - capacity: The number of heats to keep
+        - clock: Source of the current time (seconds)
+        """
+        self._capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._heats: "OrderedDict[str, HeatLatency]" = OrderedDict()
+        self._frames: Dict[str, HeatLatency] = {}
+        self._on_change: ChangeFn = lambda: None
+
+    def set_change_callback(self, func: ChangeFn) -> None:
+        """Set a function to call (from any thread) when a stage is recorded"""
+        self._on_change = func
+
+    def start(self, file: str) -> None:
+        """A new result file was noticed"""
+        with self._lock:
+            self._heats.pop(file, None)
+            self._heats[file] = HeatLatency(file, stamps={Stage.CREATED: self._clock()})
+            while len(self._heats) > self._capacity:
+                _, old = self._heats.popitem(last=False)
+                # A later heat w/ an identical scoreboard may own the frame now
+                if old.frame is not None and self._frames.get(old.frame) is old:
+                    del self._frames[old.frame]
+        self._on_change()
+
+    def describe(self, file: str, event: str, heat: int) -> None:
+        """Set the event and heat of a result file"""
+        with self._lock:
+            latency = self._heats.get(file)
+            if latency is not None:
+                latency.event = event
+                latency.heat = heat
+
+    def mark(self, file: str, stage: Stage) -> None:
+        """A result file reached a stage"""
+        with self._lock:
+            latency = self._heats.get(file)
+            if latency is None or stage in latency.stamps:
+                return
+            latency.stamps[stage] = self._clock()
+        self._on_change()
+
+    def link_latest(self, frame: str) -> None:
+        """
+        A scoreboard image was published. If it's the first one since the
+        latest heat was rendered, it shows that heat.
+        """
+        with self._lock:
+            if not self._heats:
+                return
+            latency = next(reversed(self._heats.values()))
+            if latency.frame is not None or Stage.RENDERED not in latency.stamps:
+                return
+            latency.frame = frame
+            self._frames[frame] = latency
+
+    def mark_frame(
+        self, frame: Optional[str], stage: Stage, device: Optional[str] = None
+    ) -> None:
+        """
+        The heat shown by a scoreboard image reached a stage. Only the first
+        time is recorded, so refreshing a display doesn't count.
+        """
+        with self._lock:
+            latency = self._frames.get(frame) if frame is not None else None
+            if latency is None:
+                return
+            if stage in PER_DEVICE:
+                stamps = latency.devices.setdefault(device or "", {})
+            else:
+                stamps = latency.stamps
+            if stage in stamps:
+                return
+            stamps[stage] = self._clock()
+        self._on_change()
+
+    def heats(self) -> List[HeatLatency]:
+        """The recorded heats, oldest first"""
+        with self._lock:
+            return list(self._heats.values())
+
+    def summary(self) -> List[StageSummary]:
+        """The latency to reach each stage that has been recorded"""
+        heats = self.heats()
+        with self._lock:  # The stamps may be updated by other threads
+            elapsed = {
+                stage: [x * 1000 for heat in heats for x in heat.elapsed(stage)]
+                for stage in Stage
+                if stage != Stage.CREATED
+            }
+        return [
+            StageSummary(
+                stage,
+                len(values),
+                percentile(values, 50),
+                percentile(values, 95),
+                max(values),
+            )
+            for stage, values in elapsed.items()
+            if values
+        ]
+
+    def to_csv(self) -> str:
+        """
+        The latency (ms) of each stage, with a row per heat and device
+
+        >>> now = 0.0
+        >>> tracker = LatencyTracker(clock=lambda: now)
+        >>> tracker.start("1-001-001A-0001.do4")
+        >>> now = 0.5
+        >>> tracker.mark("1-001-001A-0001.do4", Stage.RENDERED)
+        >>> print(tracker.to_csv())
+        file,event,heat,device,parsed,named,rendered,ready,encoded,sent,served
+        1-001-001A-0001.do4,,0,,,,500,,,,
+        <BLANKLINE>
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        stages = [stage for stage in Stage if stage != Stage.CREATED]
+        writer.writerow(
+            ["file", "event", "heat", "device"] + [stage.value for stage in stages]
+        )
+        heats = self.heats()
+        with self._lock:
+            for heat in heats:
+                start = heat.stamps[Stage.CREATED]
+                for device, device_stamps in heat.devices.items() or [("", {})]:
+                    stamps = {**heat.stamps, **device_stamps}
+                    writer.writerow(
+                        [os.path.basename(heat.file), heat.event, heat.heat, device]
+                        + [
+                            (
+                                round((stamps[stage] - start) * 1000)
+                                if stage in stamps
+                                else ""
+                            )
+                            for stage in stages
+                        ]
+                    )
+        return buffer.getvalue()
+
+    def write_csv(self, filename: str) -> None:
+        """Save the per-heat latency in a CSV file"""
+        with open(filename, "w", encoding="utf-8", newline="") as file:
+            file.write(self.to_csv())
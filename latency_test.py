@@ -0,0 +1,79 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the result latency tracking"""
+
+from latency import LatencyTracker, Stage
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    """A clock that advances 100 ms each time it's read"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        self.now += 0.1
+        return self.now
+
+
+def test_devices_are_tracked_separately():
+    """Each device gets its own row, and only its first download counts"""
+    tracker = LatencyTracker(clock=FakeClock())
+    tracker.start("heat.do4")  # 0.1
+    tracker.mark("heat.do4", Stage.RENDERED)  # 0.2
+    tracker.link_latest("frame")
+    tracker.mark_frame("frame", Stage.SENT, "Pool TV")  # 0.3
+    tracker.mark_frame("frame", Stage.SERVED, "Pool TV")  # 0.4
+    tracker.mark_frame("frame", Stage.SERVED, "Lobby")  # 0.5
+    tracker.mark_frame("frame", Stage.SERVED, "Pool TV")  # Refresh, ignored
+    served = [s for s in tracker.summary() if s.stage == Stage.SERVED][0]
+    assert served.count == 2
+    assert round(served.max) == 400
+    rows = tracker.to_csv().splitlines()[1:]
+    assert [row.split(",")[3] for row in rows] == ["Pool TV", "Lobby"]
+
+
+def test_republishing_does_not_relink():
+    """Images published after a heat's first one don't belong to it"""
+    tracker = LatencyTracker(clock=FakeClock())
+    tracker.start("heat.do4")
+    tracker.mark("heat.do4", Stage.RENDERED)
+    tracker.link_latest("frame")
+    tracker.link_latest("cleared")
+    tracker.mark_frame("cleared", Stage.ENCODED)
+    assert Stage.ENCODED not in tracker.heats()[0].stamps
+
+
+def test_oldest_heats_are_dropped():
+    """Only the most recent heats are kept"""
+    tracker = LatencyTracker(capacity=2, clock=FakeClock())
+    for name in ["1.do4", "2.do4", "3.do4"]:
+        tracker.start(name)
+    assert [heat.file for heat in tracker.heats()] == ["2.do4", "3.do4"]
+
+
+def test_dropping_a_heat_keeps_a_shared_frame():
+    """A newer heat w/ the same image still gets its stages recorded"""
+    tracker = LatencyTracker(capacity=2, clock=FakeClock())
+    for name in ["1.do4", "2.do4"]:
+        tracker.start(name)
+        tracker.mark(name, Stage.RENDERED)
+        tracker.link_latest("frame")  # Same scoreboard for both heats
+    tracker.start("3.do4")  # Drops 1.do4
+    tracker.mark_frame("frame", Stage.SENT, "Pool TV")
+    assert tracker.heats()[0].file == "2.do4"
+    assert "Pool TV" in tracker.heats()[0].devices
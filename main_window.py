@@ -406,9 +406,12 @@ class _dirsTab(ttk.Frame):
         widgets.DirSelection(frame, self._vm.dir_results).grid(
             column=0, row=0, sticky="news", padx=1, pady=1
         )
-        widgets.RaceResultTreeView(frame, self._vm.results_contents).grid(
-            column=0, row=1, sticky="news", padx=1, pady=1
-        )
+        widgets.RaceResultList(
+            frame,
+            self._vm.results_contents,
+            self._vm.history_file,
+            self._vm.history_preview,
+        ).grid(column=0, row=1, sticky="news", padx=1, pady=1)
         frame.columnconfigure(0, weight=1)
         frame.rowconfigure(1, weight=1)
         return frame
@@ -426,6 +429,7 @@ class _runTab(ttk.Frame):
         latestres = widgets.RaceResultView(self, self._vm.latest_result)
         latestres.grid(column=0, row=0, rowspan=2, sticky="news")
         ToolTip(latestres, "Raw data from the latest race result")
+        self._latency(self).grid(column=0, row=2, columnspan=2, sticky="news")
 
     def clear_time(self):
         race_times = self._vm.latest_result.get()
@@ -441,6 +445,24 @@ class _runTab(ttk.Frame):
         ToolTip(ccs, "Chromecasts that have been detected. Click to toggle.")
         return frame
 
+    def _latency(self, parent: Widget) -> Widget:
+        frame = ttk.LabelFrame(parent, text="Result latency")
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+        view = widgets.LatencyView(frame, self._vm.latency_summary)
+        view.grid(column=0, row=0, sticky="news")
+        ToolTip(
+            view,
+            "Time from the result file appearing until each stage of showing it",
+        )
+        ttk.Button(
+            frame,
+            padding=(8, 0),
+            text="Export CSV...",
+            command=self._vm.latency_export.run,
+        ).grid(column=1, row=0, sticky="s", padx=1, pady=1)
+        return frame
+
     def _preview(self, parent: Widget) -> Widget:
         frame = ttk.LabelFrame(parent, text="Scoreboard preview")
         frame.columnconfigure(0, weight=1)
@@ -0,0 +1,355 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Generator for synthetic swim meets.
+
+A meet is a set of start lists (E###.scb) and the matching race results
+(MMM-EEE-HHHA-RRRR.do4) in the formats written by Meet Manager and the CTS
+Dolphin. The results include the awkward cases seen at real meets: no-shows,
+missing watch times, watch times outside the threshold, ties, and empty
+heats. The same spec & seed always produce the same meet.
+
+    python meetgen.py --events 60 --heats 8 DIRECTORY
+"""
+
+import argparse
+import hashlib
+import os
+import random
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+# The lanes in the file formats, regardless of the lanes in use
+FILE_LANES = 10
+
+_FIRST = [
+    "Alex",
+    "Avery",
+    "Blake",
+    "Casey",
+    "Charlie",
+    "Dakota",
+    "Emerson",
+    "Finley",
+    "Harper",
+    "Jamie",
+    "Jordan",
+    "Kai",
+    "Logan",
+    "Morgan",
+    "Parker",
+    "Quinn",
+    "Reese",
+    "Riley",
+    "Rowan",
+    "Sam",
+    "Skyler",
+    "Taylor",
+]
+_LAST = [
+    "Anderson",
+    "Brown",
+    "Chen",
+    "Davis",
+    "Garcia",
+    "Hernandez",
+    "Hill",
+    "Johnson",
+    "Kowalski",
+    "Lee",
+    "Martinez",
+    "Nguyen",
+    "O'Brien",
+    "Patel",
+    "Robinson",
+    "Smith",
+    "Thompson",
+    "Van Der Berg",
+    "Walker",
+    "Williams",
+    "Yamamoto",
+]
+_TEAMS = ["AQUA", "BLUE", "DOLPHINS", "GOLD", "MARLINS", "RED", "SHARKS", "WAVE"]
+_AGES = ["8&U", "9-10", "11-12", "13-14", "15-18", "OPEN"]
+_GENDERS = ["GIRLS", "BOYS", "MIXED"]
+# Stroke and the time (seconds per 50) of an average swimmer
+_STROKES = [("FREE", 32.0), ("BACK", 37.0), ("BREAST", 41.0), ("FLY", 36.0)]
+_DISTANCES = [50, 100, 200]
+
+
+@dataclass
+class MeetSpec:  # pylint: disable=too-many-instance-attributes
+    """
+    The shape of a meet to generate. The rates are the chance of each edge
+    case for a lane (or a heat, for empty heats).
+    """
+
+    events: int = 20
+    heats: int = 6  # Heats per event
+    lanes: int = 8  # Lanes used in the pool
+    swimmers: int = 300  # Size of the roster
+    meet_id: int = 1
+    first_event: int = 1  # So each pool of a multi-pool meet has its own events
+    seed: int = 1
+    no_show_rate: float = 0.03
+    missing_watch_rate: float = 0.05
+    outlier_rate: float = 0.02  # A watch time outside of the threshold
+    tie_rate: float = 0.03
+    empty_heat_rate: float = 0.02
+
+
+# The name & team of a swimmer, ("", "") for an empty lane
+Entry = Tuple[str, str]
+
+
+@dataclass
+class Event:
+    """An event and the entries in each of its heats"""
+
+    number: int
+    name: str
+    heats: List[List[Entry]] = field(default_factory=list)
+
+    @property
+    def filename(self) -> str:
+        """The name of the start list file"""
+        return f"E{self.number:03}.scb"
+
+    def scb(self) -> str:
+        """
+        The start list in CTS (.scb) format
+
+        >>> event = Event(7, "GIRLS 9-10 50 FREE", [[("Lee, Sam", "RED")]])
+        >>> event.scb().splitlines()[:2]
+        ['#7 GIRLS 9-10 50 FREE', 'Lee, Sam            --RED             ']
+        """
+        lines = [f"#{self.number} {self.name}"]
+        for heat in self.heats:
+            entries = heat + [("", "")] * (FILE_LANES - len(heat))
+            lines.extend(f"{name[:20]:<20}--{team[:16]:<16}" for name, team in entries)
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class Race:
+    """The watch times (seconds, 0 if missing) of a heat, for each lane"""
+
+    meet_id: int
+    event: int
+    heat: int
+    number: int  # Race number, counting up through the meet
+    lanes: List[List[float]] = field(default_factory=list)
+
+    @property
+    def filename(self) -> str:
+        """
+        The name of the result file
+
+        >>> Race(1, 12, 3, 45).filename
+        '001-012-003A-0045.do4'
+        """
+        return f"{self.meet_id:03}-{self.event:03}-{self.heat:03}A-{self.number:04}.do4"
+
+    def do4(self) -> str:
+        """
+        The result in CTS Dolphin (.do4) format. Empty lanes have times of 0,
+        and missing watch times are left blank.
+
+        >>> race = Race(1, 12, 3, 45, [[61.5, 61.47, 0.0], [0.0, 0.0, 0.0]])
+        >>> race.do4().splitlines()[:3]
+        ['12;3;1;All', 'Lane1;61.50;61.47;', 'Lane2;0;0;0']
+        """
+        lanes = self.lanes + [[0.0] * 3] * (FILE_LANES - len(self.lanes))
+        lines = [f"{self.event};{self.heat};1;All"]
+        for lane, watches in enumerate(lanes, start=1):
+            if any(watches):
+                times = ";".join(f"{x:.2f}" if x else "" for x in watches)
+            else:
+                times = "0;0;0"
+            lines.append(f"Lane{lane};{times}")
+        body = "\n".join(lines) + "\n"
+        checksum = hashlib.md5(body.encode("cp1252")).hexdigest()[:16].upper()
+        return body + checksum + "\n"
+
+
+@dataclass
+class Meet:
+    """The start lists and race results of a meet, in the order swum"""
+
+    events: List[Event]
+    races: List[Race]
+
+    def write_startlists(self, directory: str) -> List[str]:
+        """Write the start lists into a directory, returning the paths"""
+        paths = []
+        for event in self.events:
+            paths.append(_write(directory, event.filename, event.scb()))
+        return paths
+
+    def write_race(self, race: Race, directory: str) -> str:
+        """Write the result of a race into a directory, returning the path"""
+        return _write(directory, race.filename, race.do4())
+
+    def write_results(self, directory: str) -> List[str]:
+        """Write all the race results into a directory, returning the paths"""
+        return [self.write_race(race, directory) for race in self.races]
+
+
+def _write(directory: str, filename: str, contents: str) -> str:
+    path = os.path.join(directory, filename)
+    with open(path, "w", encoding="cp1252") as file:
+        file.write(contents)
+    return path
+
+
+def _event_name(rng: random.Random) -> Tuple[str, float]:
+    """The name and average time (seconds) of a random event"""
+    stroke, per_50 = rng.choice(_STROKES)
+    distance = rng.choice(_DISTANCES)
+    name = f"{rng.choice(_GENDERS)} {rng.choice(_AGES)} {distance} {stroke}"
+    # Longer races are swum at a slower pace
+    return name, per_50 * distance / 50 * (1 + 0.05 * (distance // 100))
+
+
+def _roster(rng: random.Random, size: int) -> List[Entry]:
+    roster = []
+    for _ in range(size):
+        name = f"{rng.choice(_LAST)}, {rng.choice(_FIRST)}"
+        if rng.random() < 0.3:
+            name += f" {rng.choice('ABCDEFGHJKLMNPRSTW')}"
+        roster.append((name, rng.choice(_TEAMS)))
+    return roster
+
+
+def _seed_heats(
+    rng: random.Random, swimmers: List[Entry], heats: int, lanes: int
+) -> List[List[Entry]]:
+    """
+    Place the swimmers into heats, filling the center lanes of each heat
+    first. The first heat is usually only partly full.
+    """
+    center = (lanes + 1) / 2
+    lane_order = sorted(range(lanes), key=lambda x: (abs(x + 1 - center), -x))
+    result: List[List[Entry]] = []
+    for heat in range(heats):
+        entries: List[Entry] = [("", "")] * lanes
+        group = swimmers[heat * lanes : (heat + 1) * lanes]
+        for lane, swimmer in zip(lane_order, group):
+            entries[lane] = swimmer
+        result.append(entries)
+    if heats > 1:
+        missing = rng.randint(0, lanes - 1)
+        for lane in lane_order[lanes - missing :]:
+            result[0][lane] = ("", "")
+    return result
+
+
+def _watches(rng: random.Random, spec: MeetSpec, final: float) -> List[float]:
+    """Three watch times for a swim, possibly w/ missing or bad times"""
+    watches = [round(final + rng.gauss(0, 0.04), 2) for _ in range(3)]
+    if rng.random() < spec.missing_watch_rate:
+        for index in rng.sample(range(3), rng.choice([1, 1, 2])):
+            watches[index] = 0.0
+    if rng.random() < spec.outlier_rate:
+        index = rng.randrange(3)
+        watches[index] = round(final + rng.choice([-1, 1]) * rng.uniform(0.5, 3), 2)
+    return watches
+
+
+def _race(
+    rng: random.Random,
+    spec: MeetSpec,
+    number: Tuple[int, int, int],
+    entries: List[Entry],
+    average: float,
+) -> Race:
+    """The results of a heat. Lanes w/o a swimmer have no times."""
+    event, heat, race_num = number
+    race = Race(spec.meet_id, event, heat, race_num)
+    for name, _ in entries:
+        if not name or rng.random() < spec.no_show_rate:
+            race.lanes.append([0.0, 0.0, 0.0])
+            continue
+        final = average * rng.uniform(0.8, 1.25)
+        race.lanes.append(_watches(rng, spec, final))
+    swum = [lane for lane in race.lanes if all(lane)]
+    if len(swum) >= 2 and rng.random() < spec.tie_rate:
+        first, second = rng.sample(swum, 2)
+        second[:] = first
+    return race
+
+
+def generate(spec: MeetSpec) -> Meet:
+    """Generate a meet"""
+    rng = random.Random(spec.seed)
+    lanes = max(1, min(spec.lanes, FILE_LANES))
+    roster = _roster(rng, max(spec.swimmers, 1))
+    events: List[Event] = []
+    races: List[Race] = []
+    for number in range(spec.first_event, spec.first_event + spec.events):
+        name, average = _event_name(rng)
+        count = min(len(roster), spec.heats * lanes)
+        heats = _seed_heats(rng, rng.sample(roster, count), spec.heats, lanes)
+        # A scratched heat has no one in it
+        heats = [
+            [("", "")] * lanes if rng.random() < spec.empty_heat_rate else heat
+            for heat in heats
+        ]
+        event = Event(number, name, heats)
+        events.append(event)
+        for heat, entries in enumerate(event.heats, start=1):
+            race_id = (number, heat, len(races) + 1)
+            races.append(_race(rng, spec, race_id, entries, average))
+    return Meet(events, races)
+
+
+def main() -> None:
+    """Write a generated meet into a directory"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    defaults = MeetSpec()
+    parser.add_argument("--events", type=int, default=defaults.events)
+    parser.add_argument("--heats", type=int, default=defaults.heats)
+    parser.add_argument("--lanes", type=int, default=defaults.lanes)
+    parser.add_argument("--swimmers", type=int, default=defaults.swimmers)
+    parser.add_argument("--meet-id", type=int, default=defaults.meet_id)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("directory", type=str, help="Where to write the files")
+    args = parser.parse_args()
+
+    meet = generate(
+        MeetSpec(
+            events=args.events,
+            heats=args.heats,
+            lanes=args.lanes,
+            swimmers=args.swimmers,
+            meet_id=args.meet_id,
+            seed=args.seed,
+        )
+    )
+    os.makedirs(args.directory, exist_ok=True)
+    meet.write_startlists(args.directory)
+    meet.write_results(args.directory)
+    print(
+        f"Wrote {len(meet.events)} start lists & {len(meet.races)} results "
+        f"to {args.directory}"
+    )
+
+
+if __name__ == "__main__":
+    main()
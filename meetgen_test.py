@@ -0,0 +1,82 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the synthetic meet generator"""
+
+import os
+
+from meetgen import MeetSpec, generate
+from racetimes import RawTime, from_do4
+from startlist import load_all_scb
+
+
+def test_files_can_be_loaded(tmp_path):
+    """The start lists & results parse, and the names match the heats"""
+    meet = generate(MeetSpec(events=5, heats=3, lanes=6))
+    meet.write_startlists(str(tmp_path))
+    paths = meet.write_results(str(tmp_path))
+    startlists = load_all_scb(str(tmp_path))
+    assert [s.event_num for s in startlists] == [1, 2, 3, 4, 5]
+    assert all(s.heats == 3 for s in startlists)
+    assert len(paths) == 15
+    race = from_do4(paths[-1], 2, RawTime("0.30"))
+    assert (race.event, race.heat) == (5, 3)
+    assert os.path.basename(paths[-1]) == "001-005-003A-0015.do4"
+    # Lanes 7-10 aren't used
+    assert startlists[-1].name(3, 7) == ""
+    assert race.final_time(7).value == 0
+
+
+def test_edge_cases_are_generated():
+    """No-shows, missing watches, bad times, ties, and empty heats all occur"""
+    meet = generate(
+        MeetSpec(
+            events=10,
+            no_show_rate=0.2,
+            missing_watch_rate=0.2,
+            outlier_rate=0.2,
+            tie_rate=0.5,
+            empty_heat_rate=0.1,
+        )
+    )
+    entries = {
+        (event.number, heat): entry
+        for event in meet.events
+        for heat, entry in enumerate(event.heats, start=1)
+    }
+    lanes = [
+        (entries[(race.event, race.heat)][index][0], watches)
+        for race in meet.races
+        for index, watches in enumerate(race.lanes)
+    ]
+    assert any(name and not any(watches) for name, watches in lanes)  # No-show
+    assert any(any(watches) and not all(watches) for _, watches in lanes)
+    assert any(
+        max(watches) - min(watches) > 0.3 for _, watches in lanes if all(watches)
+    )
+    assert any(not any(name for name, _ in heat) for heat in entries.values())
+    finals = [
+        sorted(lane)[1] for race in meet.races for lane in race.lanes if all(lane)
+    ]
+    assert len(finals) > len(set(finals))  # Ties
+
+
+def test_generation_is_repeatable():
+    """The same spec always produces the same meet"""
+    first = generate(MeetSpec(events=3))
+    second = generate(MeetSpec(events=3))
+    assert [r.do4() for r in first.races] == [r.do4() for r in second.races]
+    assert [e.scb() for e in first.events] == [e.scb() for e in second.events]
@@ -0,0 +1,308 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Operational metrics in the Prometheus text format.
+
+The metrics are served at /metrics by the embedded web server so a local
+Prometheus can scrape the scoreboard computer over a long meet. Only the
+small subset of the format that's needed is implemented: counters, gauges,
+and histograms w/ optional labels.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+GaugeFn = Callable[[], float]
+
+# Bucket boundaries (seconds) for the duration histograms
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    r"""
+    Escape a label value
+
+    >>> print(_escape('Pool "A"\n'))
+    Pool \"A\"\n
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    """
+    Format a sample value
+
+    >>> _format_value(3.0), _format_value(0.25), _format_value(float("inf"))
+    ('3', '0.25', '+Inf')
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """The parts common to all the metric types"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> LabelValues:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+        return tuple(labels)
+
+    def _sample(
+        self, suffix: str, key: LabelValues, value: float, extra: str = ""
+    ) -> str:
+        pairs = [f'{name}="{_escape(v)}"' for name, v in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+        return f"{self.name}{suffix}{label_text} {_format_value(value)}"
+
+    def samples(self) -> List[str]:
+        """The current values, as lines of the text format"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """The metric in the text format, including its description"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        return "\n".join(lines + self.samples()) + "\n"
+
+
+class Counter(_Metric):
+    """
+    A value that only increases
+
+    >>> loads = Counter("loads_total", "Images loaded", ["device"])
+    >>> loads.inc("Pool TV")
+    >>> print(loads.render(), end="")
+    # HELP loads_total Images loaded
+    # TYPE loads_total counter
+    loads_total{device="Pool TV"} 1
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Increase the counter"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        """The current value"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labels:
+            values = [((), 0)]
+        return [self._sample("", key, value) for key, value in values]
+
+
+class Gauge(_Metric):
+    """A value that is read when the metrics are collected"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._function: Optional[GaugeFn] = None
+
+    def set_function(self, function: Optional[GaugeFn]) -> None:
+        """Set the function that provides the value"""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        function = self._function
+        if function is None:
+            return []
+        return [self._sample("", (), function())]
+
+
+class Histogram(_Metric):
+    """
+    The distribution of a set of observations
+
+    >>> hist = Histogram("render_seconds", "Render time", buckets=(0.1, 1))
+    >>> hist.observe(0.05)
+    >>> hist.observe(0.5)
+    >>> print(hist.render(), end="")
+    # HELP render_seconds Render time
+    # TYPE render_seconds histogram
+    render_seconds_bucket{le="0.1"} 1
+    render_seconds_bucket{le="1"} 2
+    render_seconds_bucket{le="+Inf"} 2
+    render_seconds_sum 0.55
+    render_seconds_count 2
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self._buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label values: the count in each bucket (not cumulative) and the sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record an observation"""
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self._buckets) if value <= bound)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self._buckets))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the duration (seconds) of a block of code"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [
+                (key, list(counts), self._sums[key])
+                for key, counts in sorted(self._counts.items())
+            ]
+        lines: List[str] = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(self._sample("_bucket", key, cumulative, le))
+            lines.append(self._sample("_sum", key, round(total, 6)))
+            lines.append(self._sample("_count", key, cumulative))
+        return lines
+
+
+class Registry:
+    """A collection of metrics that are rendered together"""
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add a metric to the collection"""
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All the metrics in the text format"""
+        return "".join(metric.render() for metric in self._metrics)
+
+
+REGISTRY = Registry()
+# The MIME type of the text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+RESULTS_PROCESSED = Counter(
+    "wahoo_results_processed_total", "Race results that were displayed"
+)
+PARSE_FAILURES = Counter(
+    "wahoo_parse_failures_total", "Race result files that couldn't be read"
+)
+RENDER_SECONDS = Histogram(
+    "wahoo_render_seconds", "Time to render a scoreboard image", ["background"]
+)
+ENCODE_SECONDS = Histogram(
+    "wahoo_encode_seconds", "Time to encode a scoreboard image", ["encoding"]
+)
+BYTES_SERVED = Counter(
+    "wahoo_http_bytes_served_total", "Bytes sent by the web server", ["kind"]
+)
+PUBLISHES = Counter(
+    "wahoo_publishes_total",
+    "Images sent to each device, by outcome (success or failure)",
+    ["device", "outcome"],
+)
+PUBLISHES_SKIPPED = Counter(
+    "wahoo_publishes_skipped_total",
+    "Scoreboard images that no device needed because they were unchanged",
+)
+LOADS_SKIPPED = Counter(
+    "wahoo_publish_loads_skipped_total",
+    "Device loads avoided because the device already had the image",
+)
+PUBLISH_SECONDS = Histogram(
+    "wahoo_publish_seconds", "Time to send an image to a device", ["device"]
+)
+EVENT_QUEUE_DEPTH = Gauge("wahoo_event_queue_depth", "Work waiting for the main thread")
+EVENT_QUEUE_WAIT = Histogram(
+    "wahoo_event_queue_wait_seconds",
+    "Time work waited in the queue for the main thread",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+EVENT_QUEUE_TASKS = Counter(
+    "wahoo_event_queue_tasks_total",
+    "Work handed to the main thread, by outcome (added, merged, or dropped)",
+    ["outcome"],
+)
+WATCHER_EVENTS = Counter(
+    "wahoo_watcher_events_total",
+    "File system events seen by the directory watchers",
+    ["watcher", "event"],
+)
+
+for _metric in [
+    RESULTS_PROCESSED,
+    PARSE_FAILURES,
+    RENDER_SECONDS,
+    ENCODE_SECONDS,
+    BYTES_SERVED,
+    PUBLISHES,
+    PUBLISHES_SKIPPED,
+    LOADS_SKIPPED,
+    PUBLISH_SECONDS,
+    EVENT_QUEUE_DEPTH,
+    EVENT_QUEUE_WAIT,
+    EVENT_QUEUE_TASKS,
+    WATCHER_EVENTS,
+]:
+    REGISTRY.register(_metric)
@@ -0,0 +1,46 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the Prometheus metrics"""
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_labels_must_match():
+    """Using the wrong number of labels is an error"""
+    publishes = Counter("publishes_total", "Publishes", ["device", "outcome"])
+    with pytest.raises(ValueError):
+        publishes.inc("Pool TV")
+
+
+def test_registry_renders_all_metrics():
+    """The registry output has every metric, w/ the gauge read at render time"""
+    registry = Registry()
+    depth = [3]
+    gauge = Gauge("queue_depth", "Queue depth")
+    gauge.set_function(lambda: depth[0])
+    hist = Histogram("encode_seconds", "Encode time", ["encoding"], buckets=[1])
+    registry.register(gauge)
+    registry.register(hist)
+    hist.observe(2, "png")
+    depth[0] = 5
+    lines = registry.render().splitlines()
+    assert "queue_depth 5" in lines
+    assert 'encode_seconds_bucket{encoding="png",le="1"} 0' in lines
+    assert 'encode_seconds_bucket{encoding="png",le="+Inf"} 1' in lines
+    assert 'encode_seconds_count{encoding="png"} 1' in lines
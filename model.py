@@ -14,29 +14,34 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-"""Data model"""
+"""Data model for the Tk user interface"""
 
 import logging
 import queue
-import uuid
-from configparser import ConfigParser
-from tkinter import BooleanVar, DoubleVar, IntVar, StringVar, Tk, Variable
-from typing import Callable, Generic, List, Optional, Set, TypeVar
+import threading
+import time
+from tkinter import BooleanVar, DoubleVar, IntVar, StringVar, TclError, Tk, Variable
+from typing import Generic, List, Optional, TypeVar
 
 import PIL.Image as PILImage
 
-from imagecast import DeviceStatus
+from coremodel import CallbackList, CoreModel
+from knowndevices import DeviceStatus
+from latency import StageSummary
 from racetimes import RaceTimes
+from resultindex import ResultIndex
 from startlist import StartList
 
-CallbackFn = Callable[[], None]
-
-_INI_HEADING = "wahoo-results"
-
 _T = TypeVar("_T")
 
 logger = logging.getLogger(__name__)
 
+# The longest time (seconds) to spend running queued work before letting
+# tkinter handle its own events
+DISPATCH_SLICE = 0.02
+# How often (ms) to check the queue if Tcl can't be woken from other threads
+POLL_INTERVAL_MS = 10
+
 
 class GVar(Variable, Generic[_T]):
     """
@@ -69,60 +74,49 @@ class ImageVar(GVar[PILImage.Image]):
     """Value holder for PhotoImage variables."""
 
 
-class CallbackList:
-    """A list of callback functions"""
-
-    _callbacks: Set[CallbackFn]
-
-    def __init__(self):
-        self._callbacks = set()
-
-    def run(self) -> None:
-        """Invoke all registered callback functions"""
-        for func in self._callbacks:
-            func()
-
-    def add(self, callback) -> None:
-        """Add a callback function to the set"""
-        self._callbacks.add(callback)
-
-    def remove(self, callback) -> None:
-        """Remove a callback function from the set"""
-        self._callbacks.discard(callback)
-
-
 class StartListVar(GVar[List[StartList]]):
     """An ordered list of start lists"""
 
 
-class RaceResultListVar(GVar[List[RaceTimes]]):
-    """Holds an ordered list of race results."""
+class ResultIndexVar(GVar[ResultIndex]):
+    """
+    Holds the index of the race results. The index is changed in place, and
+    then set again to notify the watchers.
+    """
 
 
 class RaceResultVar(GVar[Optional[RaceTimes]]):
     """A race result"""
 
 
-class Model:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
-    """Defines the state variables (model) for the main UI"""
+class LatencySummaryVar(GVar[List[StageSummary]]):
+    """The latency to reach each stage of getting results to the displays"""
 
-    ## Colors from USA-S visual identity standards
-    PANTONE282_DKBLUE = "#041e42"  # Primary
-    PANTONE200_RED = "#ba0c2f"  # Primary
-    BLACK = "#000000"  # Secondary
-    PANTONE428_LTGRAY = "#c1c6c8"  # Secondary
-    PANTONE877METALIC_MDGRAY = "#8a8d8f"  # Secondary
-    PANTONE281_MDBLUE = "#00205b"  # Tertiary
-    PANTONE306_LTBLUE = "#00b3e4"  # Tertiary
-    PANTONE871METALICGOLD = "#85754e"  # Tertiary
-    PANTONE4505FLATGOLD = "#b1953a"  # Tertiary
 
-    def __init__(self, root: Tk):
+class Model(CoreModel):  # pylint: disable=too-many-instance-attributes
+    """
+    Defines the state variables (model) for the main UI. The variables of the
+    CoreModel are replaced w/ tkinter variables so they can be bound to the
+    widgets.
+    """
+
+    def __init__(self, root: Tk):  # pylint: disable=too-many-statements
+        super().__init__()
         self.root = root
 
-        # Initialize the event queue and start the dispatch loop
-        self._event_queue: queue.Queue[Callable[[], None]] = queue.Queue()
+        # The dispatcher only runs when there's work in the event queue. Other
+        # threads wake it via the waker thread, since tkinter can only pass
+        # calls to the main thread once the mainloop is running.
+        self._main_thread = threading.get_ident()
+        self._threaded = bool(root.tk.call("info", "exists", "tcl_platform(threaded)"))
+        self._wake_lock = threading.Lock()
+        self._wake = threading.Event()
+        # Whether the dispatcher is scheduled (or running), so it won't miss
+        # the work that's enqueued
+        self._dispatch_scheduled = True
         root.after_idle(self._dispatch_event)
+        if self._threaded:
+            threading.Thread(target=self._waker, name="tk-waker", daemon=True).start()
 
         ########################################
         ## Dropdown menu items
@@ -136,126 +130,111 @@ class Model:  # pylint: disable=too-many-instance-attributes,too-few-public-meth
         self.bg_import = CallbackList()
         self.bg_clear = CallbackList()
         self.dolphin_export = CallbackList()
+        self.latency_export = CallbackList()
         ########################################
         ## Entry fields
-        self.font_normal = StringVar(name="font_normal")
-        self.font_time = StringVar(name="font_time")
-        self.text_spacing = DoubleVar(name="text_spacing")
-        self.title = StringVar(name="title")
+        self.font_normal: StringVar = StringVar(name="font_normal")
+        self.font_time: StringVar = StringVar(name="font_time")
+        self.text_spacing: DoubleVar = DoubleVar(name="text_spacing")
+        self.title: StringVar = StringVar(name="title")
         # colors
-        self.image_bg = StringVar(name="image_bg")
-        self.color_title = StringVar(name="color_title")
-        self.color_event = StringVar(name="color_event")
-        self.color_even = StringVar(name="color_even")
-        self.color_odd = StringVar(name="color_odd")
-        self.color_first = StringVar(name="color_first")
-        self.color_second = StringVar(name="color_second")
-        self.color_third = StringVar(name="color_third")
-        self.color_bg = StringVar(name="color_bg")
-        self.brightness_bg = IntVar(name="brightness_bg")
+        self.image_bg: StringVar = StringVar(name="image_bg")
+        self.color_title: StringVar = StringVar(name="color_title")
+        self.color_event: StringVar = StringVar(name="color_event")
+        self.color_even: StringVar = StringVar(name="color_even")
+        self.color_odd: StringVar = StringVar(name="color_odd")
+        self.color_first: StringVar = StringVar(name="color_first")
+        self.color_second: StringVar = StringVar(name="color_second")
+        self.color_third: StringVar = StringVar(name="color_third")
+        self.color_bg: StringVar = StringVar(name="color_bg")
+        self.brightness_bg: IntVar = IntVar(name="brightness_bg")
         # features
-        self.num_lanes = IntVar(name="num_lanes")
-        self.min_times = IntVar(name="min_times")
-        self.time_threshold = DoubleVar(name="time_threshold")
+        self.num_lanes: IntVar = IntVar(name="num_lanes")
+        self.min_times: IntVar = IntVar(name="min_times")
+        self.time_threshold: DoubleVar = DoubleVar(name="time_threshold")
         # Preview
         self.appearance_preview = ImageVar(PILImage.Image())
         # Directories
-        self.dir_startlist = StringVar(name="dir_startlist")
+        self.dir_startlist: StringVar = StringVar(name="dir_startlist")
         self.startlist_contents = StartListVar([])
-        self.dir_results = StringVar(name="dir_results")
-        self.results_contents = RaceResultListVar([])
+        self.dir_results: StringVar = StringVar(name="dir_results")
+        self.results_contents = ResultIndexVar(ResultIndex())
+        # The result selected from the list, and its scoreboard
+        self.history_file: StringVar = StringVar(name="history_file")
+        self.history_preview: ImageVar = ImageVar(PILImage.Image())
         # Run tab
-        self.cc_status = ChromecastStatusVar([])
-        self.scoreboard = ImageVar(PILImage.Image())
-        self.latest_result = RaceResultVar(None)
+        self.cc_status: ChromecastStatusVar = ChromecastStatusVar([])
+        self.cc_refresh_interval: IntVar = IntVar(name="cc_refresh_interval")
+        self.cc_refresh_jitter: IntVar = IntVar(name="cc_refresh_jitter")
+        self.cc_encoding: StringVar = StringVar(name="cc_encoding")
+        self.event_queue_size: IntVar = IntVar(name="event_queue_size")
+        self.event_queue_overflow: StringVar = StringVar(name="event_queue_overflow")
+        self.scoreboard: ImageVar = ImageVar(PILImage.Image())
+        self.latest_result: RaceResultVar = RaceResultVar(None)
+        self.latency_summary: LatencySummaryVar = LatencySummaryVar([])
         # misc
-        self.client_id = StringVar(name="client_id")
-        self.analytics = BooleanVar(name="analytics")
-        self.version = StringVar(name="version")
+        self.client_id: StringVar = StringVar(name="client_id")
+        self.analytics: BooleanVar = BooleanVar(name="analytics")
+        self.update_check_hours: IntVar = IntVar(name="update_check_hours")
+        self.tracing: StringVar = StringVar(name="tracing")
+        self.trace_sample_rate: DoubleVar = DoubleVar(name="trace_sample_rate")
+        self.version: StringVar = StringVar(name="version")
         self.statustext = StringVar(name="statustext")
         self.statusclick = CallbackList()
 
-    def load(self, filename: str) -> None:
-        """Load user's preferences"""
-        config = ConfigParser(interpolation=None)
-        config.read(filename, encoding="utf-8")
-        if _INI_HEADING not in config:
-            config.add_section(_INI_HEADING)
-        data = config[_INI_HEADING]
-        # Calibri (sans serif) is standard since Vista
-        # It's also part of USA-S visual identity standards
-        # https://www.usaswimming.org/docs/default-source/marketingdocuments/usa-swimming-logo-standards-manual.pdf
-        self.font_normal.set(data.get("font_normal", "Calibri"))
-        # Consolas (monospace) is standard since Vista
-        self.font_time.set(data.get("font_time", "Consolas"))
-        self.text_spacing.set(data.getfloat("text_spacing", 1.1))
-        self.title.set(data.get("title", "Wahoo! Results"))
-        self.image_bg.set(data.get("image_bg", ""))
-        self.color_title.set(data.get("color_title", self.PANTONE200_RED))
-        self.color_event.set(data.get("color_event", self.PANTONE4505FLATGOLD))
-        self.color_even.set(data.get("color_even", self.PANTONE877METALIC_MDGRAY))
-        self.color_odd.set(data.get("color_odd", self.PANTONE428_LTGRAY))
-        self.color_first.set(data.get("color_first", self.PANTONE306_LTBLUE))
-        self.color_second.set(data.get("color_second", self.PANTONE200_RED))
-        self.color_third.set(data.get("color_third", self.PANTONE4505FLATGOLD))
-        self.color_bg.set(data.get("color_bg", self.BLACK))
-        self.brightness_bg.set(data.getint("brightness_bg", 100))
-        self.num_lanes.set(data.getint("num_lanes", 10))
-        self.min_times.set(data.getint("min_times", 2))
-        self.time_threshold.set(data.getfloat("time_threshold", 0.30))
-        self.dir_startlist.set(data.get("dir_startlist", "C:\\swmeets8"))
-        self.dir_results.set(data.get("dir_results", "C:\\CTSDolphin"))
-        client_id = data.get("client_id")
-        if client_id is None or len(client_id) == 0:
-            client_id = str(uuid.uuid4())
-        try:
-            uuid.UUID(client_id)
-        except ValueError:
-            client_id = str(uuid.uuid4())
-        self.client_id.set(client_id)
-        self.analytics.set(data.getboolean("analytics", True))
-
-    def save(self, filename: str) -> None:
-        """Save user's preferences"""
-        config = ConfigParser(interpolation=None)
-        config[_INI_HEADING] = {
-            "font_normal": self.font_normal.get(),
-            "font_time": self.font_time.get(),
-            "text_spacing": str(self.text_spacing.get()),
-            "title": self.title.get(),
-            "image_bg": self.image_bg.get(),
-            "color_title": self.color_title.get(),
-            "color_event": self.color_event.get(),
-            "color_even": self.color_even.get(),
-            "color_odd": self.color_odd.get(),
-            "color_first": self.color_first.get(),
-            "color_second": self.color_second.get(),
-            "color_third": self.color_third.get(),
-            "color_bg": self.color_bg.get(),
-            "brightness_bg": str(self.brightness_bg.get()),
-            "num_lanes": str(self.num_lanes.get()),
-            "min_times": str(self.min_times.get()),
-            "time_threshold": str(self.time_threshold.get()),
-            "dir_startlist": self.dir_startlist.get(),
-            "dir_results": self.dir_results.get(),
-            "client_id": self.client_id.get(),
-            "analytics": str(self.analytics.get()),
-        }
-        with open(filename, "w", encoding="utf-8") as file:
-            config.write(file)
-
-    def enqueue(self, func: Callable[[], None]) -> None:
-        """Enqueue a function to be executed by the tkinter main thread"""
-        self._event_queue.put(func)
+    def stop(self) -> None:
+        """Stop dispatching the queued work. It may be called from any thread."""
+        super().stop()
+        self._wake.set()
+
+    def _wakeup(self) -> None:
+        if not self._threaded or self._stopped.is_set():
+            return  # The dispatcher is polling or has been stopped
+        with self._wake_lock:
+            if self._dispatch_scheduled:
+                return
+            self._dispatch_scheduled = True
+        if threading.get_ident() == self._main_thread:
+            self.root.after_idle(self._dispatch_event)
+        else:
+            self._wake.set()
+
+    def _waker(self) -> None:
+        """Schedule the dispatcher on behalf of the other threads"""
+        while not self._stopped.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while not self._stopped.is_set():
+                try:
+                    # tkinter passes this to the main thread and waits for it
+                    self.root.after_idle(self._dispatch_event)
+                    break
+                except RuntimeError:
+                    # The mainloop isn't running yet, so try again
+                    self._stopped.wait(0.1)
+                except TclError:
+                    return  # The application is gone
 
     def _dispatch_event(self) -> None:
-        try:
-            func = self._event_queue.get_nowait()
-            logger.debug("Dispatching function from queue: %s", func.__name__)
-            func()
-            self._event_queue.task_done()
-            # Give tkinter a chance to process events
+        """Run the queued work in batches, yielding to tkinter between them"""
+        deadline = time.monotonic() + DISPATCH_SLICE
+        while time.monotonic() < deadline:
+            try:
+                item = self._event_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._run_queued(item)
+        else:
+            # Out of time, so give tkinter a chance to process events
             self.root.after_idle(self._dispatch_event)
-        except queue.Empty:
+            return
+        if not self._threaded:
             # No more events to process, check again later
-            self.root.after(10, self._dispatch_event)
+            self.root.after(POLL_INTERVAL_MS, self._dispatch_event)
+            return
+        with self._wake_lock:
+            if self._event_queue.empty():
+                # Sleep until more work is enqueued
+                self._dispatch_scheduled = False
+                return
+        self.root.after_idle(self._dispatch_event)
@@ -0,0 +1,403 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The watcher -> parse -> render -> cast pipeline.
+
+These functions connect a CoreModel to the result directory watcher and to
+the Chromecasts. They don't depend on tkinter, so they are shared by the Tk
+user interface and the headless mode.
+"""
+
+import argparse
+import copy
+import logging
+import mimetypes
+import os
+import platform
+import sys
+from time import sleep
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
+
+import PIL.Image as PILImage
+import sentry_sdk
+from sentry_sdk.integrations.socket import SocketIntegration
+from sentry_sdk.integrations.threading import ThreadingIntegration
+
+# We can't use Observer in type specifications due to
+# https://github.com/gorakhargosh/watchdog/issues/982 but we can use
+# BaseObserver as a workaround
+from watchdog.observers.api import BaseObserver
+
+import coremodel
+import metrics
+import resultjson
+import tracing
+import wh_analytics
+from coremodel import CoreModel, Value
+from encoder import profile_from_name
+from latency import LatencyTracker, Stage
+from racetimes import RaceTimes, RawTime, from_do4
+from rendercache import IMAGE_SIZE, Size
+from scoreboard import ScoreboardImage, waiting_screen
+from startlist import from_scb
+from version import SENTRY_DSN, WAHOO_RESULTS_VERSION
+from watcher import DO4Watcher
+
+if TYPE_CHECKING:
+    # imagecast pulls in pychromecast and zeroconf, so it's only imported
+    # once casting starts
+    from imagecast import ImageCast
+
+CONFIG_FILE = "wahoo-results.ini"
+CC_CACHE_FILE = "wahoo-results-cc.json"
+RELEASE_CACHE_FILE = "wahoo-results-releases.json"
+ANALYTICS_SPOOL_FILE = "wahoo-results-analytics.jsonl"
+logger = logging.getLogger(__name__)
+
+
+def add_logging_args(arg_parser: argparse.ArgumentParser) -> None:
+    """Add the command line options that control logging"""
+    arg_parser.add_argument(
+        "--loglevel",
+        type=str,
+        help="Set the log level",
+        choices=["debug", "info", "warning", "error", "critical"],
+    )
+    arg_parser.add_argument(
+        "--logfile",
+        type=str,
+        help="Send log output to the specified file instead of the screen",
+    )
+
+
+def setup_logging(args: argparse.Namespace) -> None:
+    """Configure logging based on the options from add_logging_args()"""
+    if args.loglevel is not None:
+        loglevel = args.loglevel
+        numeric_level = getattr(logging, loglevel.upper(), None)
+        if not isinstance(numeric_level, int):
+            raise ValueError(f"Invalid log level: {loglevel}")
+        logging.basicConfig(
+            format="%(asctime)s %(module)s %(levelname)s %(message)s",
+            level=numeric_level,
+            filename=args.logfile,  # May be None
+        )
+
+
+def appearance_vars(model: CoreModel) -> List[Value[Any]]:
+    """The model variables that affect the appearance of the scoreboard"""
+    return [
+        model.font_normal,
+        model.font_time,
+        model.text_spacing,
+        model.title,
+        model.image_bg,
+        model.color_title,
+        model.color_event,
+        model.color_even,
+        model.color_odd,
+        model.color_first,
+        model.color_second,
+        model.color_third,
+        model.color_bg,
+        model.brightness_bg,
+        model.num_lanes,
+    ]
+
+
+def setup_board(model: CoreModel, icast: "ImageCast") -> None:
+    """
+    Serve the latest result and the theme as JSON so the scoreboard can be
+    rendered by the client (/board) instead of being sent as an image.
+    """
+    bundle_dir = getattr(sys, "_MEIPASS", os.path.abspath(os.path.dirname(__file__)))
+    with open(os.path.join(bundle_dir, "media", "board.html"), "rb") as file:
+        icast.set_content("/board", file.read(), "text/html; charset=utf-8")
+    theme_path = ""
+    bg_path = ""
+
+    def publish_result() -> None:
+        race = model.latest_result.get()
+        if race is None:  # Nothing to show yet
+            doc: resultjson.JsonDoc = {"theme": theme_path}
+        else:
+            doc = resultjson.result_to_json(race, model.num_lanes.get(), theme_path)
+        icast.set_content("/result.json", resultjson.to_bytes(doc), "application/json")
+
+    def publish_theme() -> None:
+        nonlocal theme_path, bg_path
+        old_theme, old_bg = theme_path, bg_path
+        bg_path = ""
+        bg_file = model.image_bg.get()
+        mime_type = mimetypes.guess_type(bg_file)[0]
+        if bg_file != "" and mime_type is not None:
+            try:
+                with open(bg_file, "rb") as file:
+                    bg_data = file.read()
+                ext = os.path.splitext(bg_file)[1]
+                bg_path = f"/background-{resultjson.version_of(bg_data)}{ext}"
+                icast.set_content(bg_path, bg_data, mime_type, immutable=True)
+            except OSError:
+                pass
+        theme = resultjson.theme_to_json(model, bg_path or None)
+        theme_data = resultjson.to_bytes(theme)
+        theme_path = f"/theme-{resultjson.version_of(theme_data)}.json"
+        icast.set_content(theme_path, theme_data, "application/json", immutable=True)
+        if old_theme not in ["", theme_path]:
+            icast.remove_content(old_theme)
+        if old_bg not in ["", bg_path]:
+            icast.remove_content(old_bg)
+        publish_result()
+
+    for element in appearance_vars(model):
+        element.trace_add("write", lambda *_: publish_theme())
+    model.latest_result.trace_add("write", lambda *_: publish_result())
+    publish_theme()
+
+
+def load_result(
+    model: CoreModel, filename: str, latency: Optional[LatencyTracker] = None
+) -> Optional[RaceTimes]:
+    """
+    Load a result file and corresponding startlist, recording the stages in
+    latency (if provided)
+    """
+    racetime: Optional[RaceTimes] = None
+    # Retry mechanism since we get errors if we try to read while it's
+    # still being written.
+    for tries in range(1, 6):
+        try:
+            racetime = from_do4(
+                filename, model.min_times.get(), RawTime(model.time_threshold.get())
+            )
+        except ValueError:
+            sleep(0.05 * tries)
+        except OSError:
+            sleep(0.05 * tries)
+    if racetime is None:
+        return None
+    if latency is not None:
+        latency.mark(filename, Stage.PARSED)
+        latency.describe(filename, str(racetime.event), racetime.heat)
+    efilename = f"E{racetime.event:0>3}.scb"
+    try:
+        startlist = from_scb(os.path.join(model.dir_startlist.get(), efilename))
+        racetime.set_names(startlist)
+        if latency is not None:
+            latency.mark(filename, Stage.NAMED)
+    except OSError:
+        pass
+    except ValueError:
+        pass
+    return racetime
+
+
+def setup_do4_watcher(
+    model: CoreModel,
+    observer: BaseObserver,
+    on_directory: Callable[[str], None] = lambda _: None,
+    on_result: Callable[[RaceTimes], None] = lambda _: None,
+    on_removed: Callable[[str], None] = lambda _: None,
+) -> None:
+    """
+    Set up watches for files/directories and connect to model. The callbacks
+    are called from the main thread.
+
+    Parameters:
+    - model: The model to update w/ new results
+    - observer: The observer that watches the result directory
+    - on_directory: Called w/ the result directory when it changes
+    - on_result: Called w/ each new result once it has been processed
+    - on_removed: Called w/ the path of each result file that is removed
+    """
+
+    def process_new_result(file: str) -> None:
+        """Process a new race result that has been detected"""
+        with tracing.transaction(op="new_result", name="New race result"):
+            racetime = load_result(model, file, model.latency)
+            if racetime is None:
+                metrics.PARSE_FAILURES.inc()
+                return
+            scoreboard = ScoreboardImage(IMAGE_SIZE, racetime, model)
+            model.latency.mark(file, Stage.RENDERED)
+            # The result must be set first since publishing the scoreboard
+            # also renders it at the other display sizes
+            model.latest_result.set(racetime)
+            model.latency.mark(file, Stage.READY)
+            model.scoreboard.set(scoreboard.image)
+            num_cc = len([x for x in model.cc_status.get() if x.enabled])
+            wh_analytics.results_received(racetime.has_names, num_cc)
+            metrics.RESULTS_PROCESSED.inc()
+            on_result(racetime)
+
+    def do4_dir_updated() -> None:
+        """
+        When the raceresult directory is changed, update the watch to look at
+        the new directory and trigger processing of the results.
+        """
+        path = model.dir_results.get()
+        if not os.path.exists(path):
+            return
+        observer.unschedule_all()
+
+        def async_process(file: str) -> None:
+            model.latency.start(file)
+            # Repeated events for the same file only need to load it once
+            model.enqueue(lambda: process_new_result(file), ("result", file))
+
+        def async_remove(file: str) -> None:
+            model.enqueue(lambda: on_removed(file), ("removed", file))
+
+        observer.schedule(DO4Watcher(async_process, async_remove), path)
+        logger.debug("do4 watcher updated to %s", path)
+        on_directory(path)
+
+    model.dir_results.trace_add("write", lambda *_: do4_dir_updated())
+    do4_dir_updated()
+
+    # The stages are recorded from several threads
+    model.latency.set_change_callback(
+        lambda: model.enqueue(
+            lambda: model.latency_summary.set(model.latency.summary()),
+            "latency_summary",
+        )
+    )
+
+
+def setup_cast(model: CoreModel, icast: "ImageCast") -> None:
+    """Link Chromecast discovery/management and the scoreboard to the model"""
+
+    def cast_discovery() -> None:
+        dev_list = copy.deepcopy(icast.get_devices())
+        model.enqueue(lambda: model.cc_status.set(dev_list), "cc_status")
+
+    def update_cc_list() -> None:
+        dev_list = model.cc_status.get()
+        for dev in dev_list:
+            icast.enable(dev.uuid, dev.enabled)
+
+    model.cc_status.trace_add("write", lambda *_: update_cc_list())
+    icast.set_discovery_callback(cast_discovery)
+
+    # Send the scoreboard to the Chromecasts
+    model.scoreboard.trace_add(
+        "write", lambda *_: icast.publish(model.scoreboard.get())
+    )
+    model.cc_encoding.trace_add(
+        "write",
+        lambda *_: icast.set_encoding(profile_from_name(model.cc_encoding.get())),
+    )
+
+    def render(size: Size, background: bool) -> PILImage.Image:
+        """Render the current scoreboard for displays other than the default"""
+        race = model.latest_result.get()
+        if race is not None:
+            return ScoreboardImage(size, race, model, background).image
+        if background:
+            return waiting_screen(size, model)
+        return PILImage.new("RGBA", size, "#00000000")
+
+    icast.set_renderer(render, model.enqueue)
+
+
+def start_cast(
+    model: CoreModel, port: int = 9998, device_cache: Optional[str] = CC_CACHE_FILE
+) -> "ImageCast":
+    """
+    Start casting the scoreboard, using the settings from the model. Returns
+    the running ImageCast.
+
+    Parameters:
+        - model: The model to take the settings and scoreboard from
+        - port: The port for the embedded web server (0 for any free port)
+        - device_cache: File in which the Chromecasts are remembered. Only
+          the devices that are enabled in it are cast to.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from imagecast import ImageCast
+
+    icast = ImageCast(
+        port,
+        refresh_interval=model.cc_refresh_interval.get(),
+        refresh_jitter=model.cc_refresh_jitter.get(),
+        device_cache=device_cache,
+        encoding=profile_from_name(model.cc_encoding.get()),
+        latency=model.latency,
+    )
+    setup_cast(model, icast)
+    setup_board(model, icast)
+    metrics.EVENT_QUEUE_DEPTH.set_function(model.queue_depth)
+    icast.start()
+    # Set initial scoreboard image
+    model.scoreboard.set(waiting_screen(IMAGE_SIZE, model))
+    return icast
+
+
+def initialize_sentry(model: CoreModel) -> sentry_sdk.Hub:
+    """
+    Initialize sentry.io crash reporting and start the application session.
+    Returns the Hub to pass to shutdown_sentry().
+    """
+    execution_environment = "source"
+    if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
+        execution_environment = "executable"
+    if coremodel.TESTING:
+        execution_environment = "test"
+
+    # Performance traces only go to Sentry if that's the tracing mode. Crash
+    # reports are always sent.
+    trace_mode = tracing.mode_from_name(model.tracing.get())
+    sample_rate = min(1.0, max(0.0, model.trace_sample_rate.get()))
+    tracing.configure(trace_mode, sample_rate)
+
+    # Initialize Sentry crash reporting
+    sentry_sdk.init(
+        dsn=SENTRY_DSN,
+        sample_rate=1.0,
+        traces_sample_rate=(
+            sample_rate if trace_mode == tracing.TraceMode.SENTRY else None
+        ),
+        environment=execution_environment,
+        release=f"wahoo-results@{WAHOO_RESULTS_VERSION}",
+        include_local_variables=True,
+        integrations=[SocketIntegration(), ThreadingIntegration(propagate_hub=True)],
+        debug=False,
+    )
+    uname = platform.uname()
+    sentry_sdk.set_tag("os_system", uname.system)
+    sentry_sdk.set_tag("os_release", uname.release)
+    sentry_sdk.set_tag("os_version", uname.version)
+    sentry_sdk.set_tag("os_machine", uname.machine)
+    sentry_sdk.set_user(
+        {
+            "id": model.client_id.get(),
+            "ip_address": "{{auto}}",
+        }
+    )
+    hub = sentry_sdk.Hub.current
+    hub.start_session(session_mode="application")
+    return hub
+
+
+def shutdown_sentry(hub: sentry_sdk.Hub) -> None:
+    """End the application session and flush the crash reporting"""
+    tracing.report()
+    logger.debug("Shutting down Sentry")
+    hub.end_session()
+    client = hub.client
+    if client is not None:
+        client.close(timeout=2.0)
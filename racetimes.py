@@ -79,6 +79,8 @@ class RaceTimes(ABC):
         """
         self.min_times = min_times
         self.threshold = threshold
+        # The file the times were read from, if any
+        self.filename = ""
         self._startlist = StartList()
         self._has_names = False
 
@@ -299,4 +301,6 @@ def from_do4(filename: str, min_times: int, threshold: RawTime) -> RaceTimes:
             meet_id = meet_match.group(1)
         stinfo = os.stat(filename)
         mtime = datetime.fromtimestamp(stinfo.st_mtime)
-        return DO4(file, min_times, threshold, mtime, meet_id)
+        racetimes = DO4(file, min_times, threshold, mtime, meet_id)
+        racetimes.filename = filename
+        return racetimes
@@ -0,0 +1,262 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Rendering of the scoreboard at multiple resolutions.
+
+The published scoreboard image has a fixed size. Displays that need a
+different size (or an image w/o the background) get their own FrameChannel,
+which the RenderCache renders at most once per published frame, regardless
+of how many displays share it.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from PIL import Image
+
+import tracing
+from encoder import EncodingProfile
+from framechannel import FrameChannel
+
+Size = Tuple[int, int]
+# Renders the current scoreboard at a given size, w/ or w/o its background
+RenderFn = Callable[[Size, bool], Image.Image]
+# Arranges for a function to be called on the thread that publishes images
+ScheduleFn = Callable[[Callable[[], None]], None]
+# Key for the rendered images: (has background, size)
+_Key = Tuple[bool, Size]
+
+# Default resolution of images for the Chromecast
+IMAGE_SIZE = (1280, 720)
+# Range of image sizes that may be requested
+_MIN_SIZE = (160, 90)
+_MAX_SIZE = (3840, 2160)
+# Sizes stop being rendered once nobody has asked for them in this long
+# (seconds)
+_IDLE_TIMEOUT = 15 * 60
+# The most kinds of image (size, w/ or w/o background) that are rendered in
+# addition to the published one. Each is rendered for every result, so
+# requests for more are refused.
+MAX_CHANNELS = 6
+# How long (seconds) a request waits for an image to be rendered at a new size
+_RENDER_WAIT = 2
+
+logger = logging.getLogger(__name__)
+
+
+def parse_size(text: str) -> Optional[Size]:
+    """
+    Parse an image size of the form WIDTHxHEIGHT. Returns None if the size
+    is invalid or outside of the supported range.
+
+    >>> parse_size("1920x1080")
+    (1920, 1080)
+    >>> parse_size("3840X2160")
+    (3840, 2160)
+    >>> parse_size("7680x4320") is None
+    True
+    >>> parse_size("big") is None
+    True
+    """
+    try:
+        width, height = (int(x) for x in text.lower().split("x"))
+    except ValueError:
+        return None
+    if not _MIN_SIZE[0] <= width <= _MAX_SIZE[0]:
+        return None
+    if not _MIN_SIZE[1] <= height <= _MAX_SIZE[1]:
+        return None
+    return (width, height)
+
+
+def format_size(size: Size) -> str:
+    """
+    Format an image size for use in a URL
+
+    >>> format_size((1920, 1080))
+    '1920x1080'
+    """
+    return f"{size[0]}x{size[1]}"
+
+
+class RenderCache:  # pylint: disable=too-many-instance-attributes
+    """
+    The scoreboard rendered at each of the sizes currently in use.
+
+    The frames of the main channel (the published image) identify the
+    scoreboard. Each of the other channels records which of those frames it
+    was last rendered from, so it's only rendered again once the scoreboard
+    changes.
+    """
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(
+        self,
+        main: FrameChannel,
+        main_size: Size,
+        encoding: EncodingProfile,
+        pinned: Callable[[], Set[Size]],
+        on_rendered: Callable[[], None],
+    ):
+        """
+        Parameters:
+        - main: The channel holding the published images
+        - main_size: The size of the published images
+        - encoding: How images w/ a background are encoded
+        - pinned: Returns the sizes that must be kept even if they haven't
+          been asked for recently
+        - on_rendered: Called after a scheduled render has completed
+        """
+        self._main = main
+        self._main_size = main_size
+        self._encoding = encoding
+        self._pinned = pinned
+        self._on_rendered = on_rendered
+        self._lock = threading.Lock()
+        self._rendered = threading.Condition(self._lock)
+        self._channels: Dict[_Key, FrameChannel] = {(True, main_size): main}
+        self._sources: Dict[_Key, str] = {}
+        self._last_used: Dict[_Key, float] = {}
+        self._render_queued = False
+        self._renderer: Optional[RenderFn] = None
+        self._schedule: Optional[ScheduleFn] = None
+
+    def set_renderer(self, render: RenderFn, schedule: ScheduleFn) -> None:
+        """
+        Set the function used to render the scoreboard.
+
+        Parameters:
+        - render: Renders the current scoreboard. It is only called from
+          render_stale().
+        - schedule: Arranges for a function to be called on the thread that
+          publishes images. It may be called from any thread.
+        """
+        self._renderer = render
+        self._schedule = schedule
+
+    def set_encoding(self, encoding: EncodingProfile) -> None:
+        """Change how images w/ a background are encoded"""
+        with self._lock:
+            self._encoding = encoding
+            channels = [y for x, y in self._channels.items() if x[0]]
+        for channel in channels:
+            channel.set_encoding(encoding)
+
+    def channel(self, background: bool, size: Size) -> Optional[FrameChannel]:
+        """
+        Find (or create) a channel, marking it as being in use. Returns None
+        if there are already MAX_CHANNELS other channels.
+        """
+        if self._renderer is None:
+            return self._main  # Nothing else can be rendered
+        key = (background, size)
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                if len(self._channels) > MAX_CHANNELS:
+                    logger.warning("Too many image sizes, refusing %s", key)
+                    return None
+                # W/o a background, the transparency must be kept, so use PNG
+                encoding = self._encoding if background else EncodingProfile.PNG
+                channel = FrameChannel(encoding)
+                self._channels[key] = channel
+            self._last_used[key] = time.monotonic()
+        return channel
+
+    def is_current(self, background: bool, size: Size) -> bool:
+        """Whether the channel holds the current scoreboard"""
+        if self._renderer is None or (background, size) == (True, self._main_size):
+            return True
+        with self._lock:
+            return self._is_current((background, size))
+
+    def _is_current(self, key: _Key) -> bool:
+        return self._sources.get(key) == self._main.frame
+
+    def wait_for(self, background: bool, size: Size) -> Optional[FrameChannel]:
+        """
+        The channel for the requested kind of image, waiting (a little) for
+        the image to be rendered if it isn't current yet. Returns None if
+        there are too many channels to add it.
+        """
+        channel = self.channel(background, size)
+        if channel is None or self.is_current(background, size):
+            return channel
+        self.request_render()
+        with self._rendered:
+            self._rendered.wait_for(
+                lambda: self._is_current((background, size)), _RENDER_WAIT
+            )
+        return channel
+
+    def request_render(self) -> None:
+        """Have the stale channels rendered on the publishing thread"""
+        with self._lock:
+            if self._render_queued or self._schedule is None:
+                return
+            self._render_queued = True
+        self._schedule(lambda: self.render_stale(scheduled=True))
+
+    def render_stale(self, scheduled: bool = False) -> None:
+        """
+        Render the current scoreboard for each channel that is out of date,
+        and drop the channels that are no longer being used. This must be
+        called on the thread that publishes images.
+
+        Parameters:
+        - scheduled: True when run via request_render(), in which case
+          on_rendered is called afterwards
+        """
+        frame = self._main.frame
+        pinned = self._pinned()
+        with self._lock:
+            self._render_queued = False
+            self._drop_idle(pinned)
+            stale = [
+                (key, channel)
+                for key, channel in self._channels.items()
+                if channel is not self._main and not self._is_current(key)
+            ]
+        if self._renderer is not None and frame is not None:
+            for key, channel in stale:
+                background, size = key
+                with tracing.span(
+                    op="render_size",
+                    description=f"{format_size(size)} bg={background}",
+                ):
+                    channel.set_image(self._renderer(size, background))
+                with self._rendered:
+                    self._sources[key] = frame
+                    self._rendered.notify_all()
+        if scheduled:
+            self._on_rendered()
+
+    def _drop_idle(self, pinned: Set[Size]) -> None:
+        """Drop the channels that nobody is using. Requires _lock."""
+        now = time.monotonic()
+        for key, channel in list(self._channels.items()):
+            if channel is self._main or channel.viewers > 0:
+                continue
+            if key[0] and key[1] in pinned:
+                continue
+            if now - self._last_used.get(key, now) > _IDLE_TIMEOUT:
+                logger.debug("Dropping unused image size %s", key)
+                del self._channels[key]
+                self._sources.pop(key, None)
+                self._last_used.pop(key, None)
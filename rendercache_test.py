@@ -0,0 +1,58 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for rendering the scoreboard at multiple resolutions"""
+
+from PIL import Image
+
+from encoder import EncodingProfile
+from framechannel import FrameChannel
+from rendercache import IMAGE_SIZE, MAX_CHANNELS, RenderCache
+
+
+def _cache(scheduled):
+    main = FrameChannel(EncodingProfile.PNG)
+    cache = RenderCache(main, IMAGE_SIZE, EncodingProfile.PNG, set, lambda: None)
+    cache.set_renderer(
+        lambda size, _background: Image.new("RGB", size), scheduled.append
+    )
+    main.set_image(Image.new("RGB", IMAGE_SIZE))
+    return cache
+
+
+def test_number_of_sizes_is_limited():
+    """Requests for more sizes than can be rendered are refused"""
+    cache = _cache([])
+    for width in range(MAX_CHANNELS):
+        assert cache.channel(True, (200 + width, 90)) is not None
+    assert cache.channel(True, (1920, 1080)) is None
+    assert cache.wait_for(False, (1920, 1080)) is None
+    # The sizes already in use are still available
+    assert cache.channel(True, (200, 90)) is not None
+    assert cache.channel(True, IMAGE_SIZE) is not None
+
+
+def test_renders_are_scheduled():
+    """Requested renders run later, on the scheduled thread"""
+    scheduled = []
+    cache = _cache(scheduled)
+    cache.channel(True, (1920, 1080))
+    cache.request_render()
+    cache.request_render()
+    assert len(scheduled) == 1
+    assert not cache.is_current(True, (1920, 1080))
+    scheduled[0]()
+    assert cache.is_current(True, (1920, 1080))
@@ -0,0 +1,340 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Replay a meet through the live pipeline, w/o a user interface.
+
+The result files of one or more meet directories (one per pool) are copied
+into a temporary results directory w/ the same spacing as their original
+modification times, divided by the speed factor. The whole chain (watcher,
+parse, render, and publish) runs as it does in headless mode, and the
+throughput, per-stage latency, and memory use are reported at the end:
+
+    python replay.py --speed 100 MEETDIR [MEETDIR ...]
+
+A generated meet can be used instead, e.g., 2,000 heats over two pools:
+
+    python replay.py --speed 100 --generate 125 --heats 8 --pools 2
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from watchdog.observers import Observer
+
+import wh_analytics
+from autotest import AddDO4, LoadAllSCB, Scenario, eventually, run_scenario
+from coremodel import CoreModel
+from latency import HeatLatency, Stage, percentile
+from meetgen import MeetSpec, generate
+from pipeline import setup_do4_watcher, start_cast
+
+MIB = 1024 * 1024
+
+
+@dataclass
+class ReplayItem:
+    """A result file and when to copy it (seconds from the start)"""
+
+    offset: float
+    directory: str
+    name: str
+
+
+def schedule(directories: List[str], speed: float) -> List[ReplayItem]:
+    """
+    The result files of the directories, in order of their modification
+    times, spaced according to the speed factor
+    """
+    files = [
+        (os.path.getmtime(os.path.join(directory, name)), directory, name)
+        for directory in directories
+        for name in os.listdir(directory)
+        if name.endswith(".do4")
+    ]
+    if not files:
+        return []
+    files.sort()
+    first = files[0][0]
+    return [
+        ReplayItem((mtime - first) / speed, directory, name)
+        for mtime, directory, name in files
+    ]
+
+
+def generate_pools(  # pylint: disable=too-many-arguments
+    directory: str, pools: int, events: int, heats: int, interval: float, seed: int
+) -> List[str]:
+    """
+    Generate a meet for each pool, w/ the heats of each starting about
+    interval seconds apart. Returns the directory of each pool.
+    """
+    rng = random.Random(seed)
+    start = time.time() - 1e6  # Well in the past, so only the spacing matters
+    pooldirs = []
+    for pool in range(pools):
+        pooldir = os.path.join(directory, f"pool{pool + 1}")
+        os.makedirs(pooldir)
+        spec = MeetSpec(
+            events=events,
+            heats=heats,
+            meet_id=pool + 1,
+            first_event=pool * events + 1,
+            seed=seed + pool,
+        )
+        meet = generate(spec)
+        meet.write_startlists(pooldir)
+        when = start + rng.uniform(0, interval)
+        for race in meet.races:
+            os.utime(meet.write_race(race, pooldir), (when, when))
+            when += interval * rng.uniform(0.75, 1.25)
+        pooldirs.append(pooldir)
+    return pooldirs
+
+
+@dataclass
+class ReplayResult:  # pylint: disable=too-many-instance-attributes
+    """The measurements from a replay"""
+
+    items: List[ReplayItem]
+    speed: float
+    elapsed: float = 0.0  # Seconds from the first copy to the last render
+    max_lag: float = 0.0  # Seconds the copying fell behind the schedule
+    created: Dict[str, float] = field(default_factory=dict)  # By file name
+    heats: Dict[str, HeatLatency] = field(default_factory=dict)  # By file name
+    memory: List[int] = field(default_factory=list)  # Traced bytes, per copy
+    memory_peak: int = 0
+
+    def rendered(self) -> List[HeatLatency]:
+        """The heats that made it onto the scoreboard"""
+        return [x for x in self.heats.values() if Stage.RENDERED in x.stamps]
+
+    def overlapped(self) -> int:
+        """
+        The number of heats that were still being processed when the next
+        result arrived, i.e., times the pipeline didn't keep up
+
+        >>> result = ReplayResult([], 1)
+        >>> result.created = {"1.do4": 0.0, "2.do4": 1.0, "3.do4": 1.5}
+        >>> result.heats = {
+        ...     "1.do4": HeatLatency("1.do4", stamps={Stage.RENDERED: 0.5}),
+        ...     "2.do4": HeatLatency("2.do4", stamps={Stage.RENDERED: 1.7}),
+        ... }
+        >>> result.overlapped()
+        2
+        """
+        order = sorted(self.created.items(), key=lambda x: x[1])
+        late = 0
+        for (name, _), (_, next_created) in zip(order, order[1:] + [("", 1e99)]):
+            heat = self.heats.get(name)
+            rendered = heat.stamps.get(Stage.RENDERED) if heat else None
+            if rendered is None or rendered > next_created:
+                late += 1
+        return late
+
+    def report(self) -> str:
+        """A summary of the measurements"""
+        rendered = self.rendered()
+        duration = self.items[-1].offset if self.items else 0.0
+        pools = len({item.directory for item in self.items})
+        lines = [
+            f"Replayed {len(self.items)} heats from {pools} pool(s) at "
+            f"{self.speed:g}x in {self.elapsed:.1f} s",
+            f"Displayed: {len(rendered)} of {len(self.items)} heats",
+            f"Throughput: {len(rendered) / max(self.elapsed, 1e-9):.2f} heats/s "
+            f"(arrivals: {len(self.items) / max(duration, 1e-9):.2f} heats/s)",
+            f"Still processing when the next heat arrived: {self.overlapped()}",
+            f"Copying fell behind the schedule by up to {self.max_lag * 1000:.0f} ms",
+            "",
+            f"{'latency (ms)':<14}{'count':>7}{'p50':>9}{'p95':>9}{'max':>9}",
+        ]
+        for stage in Stage:
+            values = [
+                x * 1000 for heat in self.heats.values() for x in heat.elapsed(stage)
+            ]
+            if stage == Stage.CREATED or not values:
+                continue
+            lines.append(
+                f"{stage.value:<14}{len(values):>7}{percentile(values, 50):>9.0f}"
+                f"{percentile(values, 95):>9.0f}{max(values):>9.0f}"
+            )
+        if self.memory:
+            lines += [
+                "",
+                f"Memory (traced): {self.memory[0] / MIB:.1f} MiB at the start, "
+                f"{self.memory[-1] / MIB:.1f} MiB at the end, "
+                f"{self.memory_peak / MIB:.1f} MiB peak",
+            ]
+        return "\n".join(lines)
+
+
+class Replay(Scenario):  # pylint: disable=too-few-public-methods
+    """Copy result files into the results directory on a schedule"""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        model: CoreModel,
+        items: List[ReplayItem],
+        resultdir: str,
+        result: ReplayResult,
+        timeout: float,
+    ) -> None:
+        """
+        :param model: the application model
+        :param items: the files to copy and when
+        :param resultdir: the directory for the do4 files
+        :param result: where to record the measurements
+        :param timeout: how long to wait (seconds) for the last heats
+        """
+        super().__init__()
+        self._model = model
+        self._items = items
+        self._resultdir = resultdir
+        self._result = result
+        self._timeout = timeout
+
+    def _collect(self) -> None:
+        """Save the stages of the heats before the tracker drops them"""
+        for heat in self._model.latency.heats():
+            self._result.heats[os.path.basename(heat.file)] = heat
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self._result.memory.append(current)
+            self._result.memory_peak = max(self._result.memory_peak, peak)
+
+    def _done(self) -> bool:
+        self._collect()
+        return len(self._result.rendered()) >= len(self._items)
+
+    def run(self) -> None:
+        start = time.monotonic()
+        for item in self._items:
+            delay = start + item.offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._result.max_lag = max(self._result.max_lag, -delay)
+            self._result.created[item.name] = time.time()
+            AddDO4(item.directory, self._resultdir, item.name, []).run()
+            self._collect()
+        if not eventually(self._done, 0.05, int(self._timeout / 0.05)):
+            print("Timed out waiting for the last heats")
+        rendered = [x.stamps[Stage.RENDERED] for x in self._result.rendered()]
+        if rendered:
+            self._result.elapsed = max(rendered) - min(self._result.created.values())
+        self._model.stop()
+
+
+def replay(
+    directories: List[str], speed: float, timeout: float, memory: bool
+) -> ReplayResult:
+    """Replay the results of the meet directories through the pipeline"""
+    items = schedule(directories, speed)
+    result = ReplayResult(items, speed)
+    if not items:
+        return result
+    if memory:
+        tracemalloc.start()
+    model = CoreModel()
+    model.load("")  # Use the default settings
+    model.analytics.set(False)
+    wh_analytics.application_start(model, (0, 0))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        startlistdir = os.path.join(tmpdir, "startlists")
+        resultdir = os.path.join(tmpdir, "results")
+        os.makedirs(startlistdir)
+        os.makedirs(resultdir)
+        for directory in directories:
+            LoadAllSCB(directory, startlistdir).run()
+        model.dir_startlist.set(startlistdir)
+        model.dir_results.set(resultdir)
+
+        observer = Observer()
+        observer.start()
+        setup_do4_watcher(model, observer)
+        # Use a private device cache so no real displays are cast to, and
+        # a free port so it can run alongside Wahoo! Results
+        icast = start_cast(model, 0, os.path.join(tmpdir, "wahoo-results-cc.json"))
+        run_scenario(Replay(model, items, resultdir, result, timeout))
+        model.run()
+        observer.unschedule_all()
+        observer.stop()
+        icast.stop()
+    wh_analytics.application_stop(model)
+    if memory:
+        tracemalloc.stop()
+    return result
+
+
+def main() -> None:
+    """Replay a meet"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "directories", nargs="*", help="Meet directories to replay, one per pool"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Speed-up factor (default: 1)"
+    )
+    parser.add_argument(
+        "--generate", type=int, default=0, help="Generate a meet w/ this many events"
+    )
+    parser.add_argument(
+        "--heats", type=int, default=8, help="Heats per generated event (default: 8)"
+    )
+    parser.add_argument(
+        "--pools", type=int, default=1, help="Pools in the generated meet (default: 1)"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=90.0,
+        help="Average seconds between generated heats in a pool (default: 90)",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generator")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60.0,
+        help="Seconds to wait for the last heats (default: 60)",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Don't trace memory allocations, which slow the pipeline",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as gendir:
+        directories: List[str] = args.directories
+        if args.generate:
+            directories = generate_pools(
+                gendir, args.pools, args.generate, args.heats, args.interval, args.seed
+            )
+        if not directories:
+            parser.error("No meet directories to replay")
+        result = replay(directories, args.speed, args.timeout, not args.no_memory)
+    print(result.report())
+
+
+if __name__ == "__main__":
+    main()
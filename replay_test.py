@@ -0,0 +1,44 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the meet replay harness"""
+
+import os
+
+from replay import generate_pools, schedule
+
+
+def test_schedule_follows_mtimes(tmp_path):
+    """Files are replayed in order of their mtimes, scaled by the speed"""
+    for name, mtime in [("b.do4", 1030.0), ("a.do4", 1010.0), ("x.scb", 1000.0)]:
+        path = tmp_path / name
+        path.write_text("")
+        os.utime(path, (mtime, mtime))
+    items = schedule([str(tmp_path)], 10)
+    assert [(x.name, x.offset) for x in items] == [("a.do4", 0.0), ("b.do4", 2.0)]
+
+
+def test_pools_are_interleaved(tmp_path):
+    """Generated pools have their own events, and their heats overlap"""
+    dirs = generate_pools(str(tmp_path), 2, 3, 2, 60.0, 1)
+    assert sorted(x for x in os.listdir(dirs[1]) if x.endswith(".scb")) == [
+        "E004.scb",
+        "E005.scb",
+        "E006.scb",
+    ]
+    pools = [x.directory for x in schedule(dirs, 1)]
+    assert len(pools) == 12
+    assert pools[:6].count(dirs[0]) not in (0, 6)
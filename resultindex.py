@@ -0,0 +1,158 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+An index of the race results in the results directory.
+
+It holds just enough about each heat to list and filter a season's worth of
+results (newest first); the times themselves are loaded from the file when a
+heat is selected.
+"""
+
+import bisect
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from racetimes import RaceTimes
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    """A race result in the index"""
+
+    filename: str
+    meet_id: str
+    event: int
+    heat: int
+    recorded: datetime
+
+    @property
+    def day(self) -> str:
+        """The date the result was recorded (YYYY-MM-DD)"""
+        return self.recorded.strftime("%Y-%m-%d")
+
+    def row(self) -> List[str]:
+        """The values to display for the result"""
+        return [
+            self.meet_id,
+            str(self.event),
+            str(self.heat),
+            self.recorded.strftime("%Y-%m-%d %H:%M:%S"),
+        ]
+
+
+class ResultIndex:
+    """
+    The race results, newest first. Results can be added and removed one at
+    a time as the files come and go, and updates only add and remove the
+    results that changed.
+
+    >>> from datetime import datetime
+    >>> index = ResultIndex()
+    >>> index.update([
+    ...     IndexEntry("1-1-1.do4", "1", 1, 1, datetime(2024, 5, 4, 9, 0)),
+    ...     IndexEntry("2-3-1.do4", "2", 3, 1, datetime(2024, 6, 1, 9, 0)),
+    ... ])
+    >>> [x.filename for x in index.select()]
+    ['2-3-1.do4', '1-1-1.do4']
+    >>> [x.filename for x in index.select(day="2024-05")]
+    ['1-1-1.do4']
+    >>> index.meets()
+    ['1', '2']
+    >>> index.remove("2-3-1.do4")
+    >>> "2-3-1.do4" in index, len(index)
+    (False, 1)
+    """
+
+    def __init__(self) -> None:
+        # (sort key, filename) of each result, in order
+        self._order: List[Tuple[Tuple[float, str], str]] = []
+        self._entries: Dict[str, IndexEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self._entries
+
+    def add(self, entry: IndexEntry) -> None:
+        """Add a result, replacing the one from the same file (if any)"""
+        if self._entries.get(entry.filename) == entry:
+            return
+        self.remove(entry.filename)
+        bisect.insort(self._order, (self._key(entry), entry.filename))
+        self._entries[entry.filename] = entry
+
+    def remove(self, filename: str) -> None:
+        """Remove the result from a file, if it's in the index"""
+        entry = self._entries.pop(filename, None)
+        if entry is not None:
+            del self._order[
+                bisect.bisect_left(self._order, (self._key(entry), filename))
+            ]
+
+    def update(self, entries: Iterable[IndexEntry]) -> None:
+        """Make the index hold exactly these results"""
+        latest = {entry.filename: entry for entry in entries}
+        for filename in [x for x in self._entries if x not in latest]:
+            self.remove(filename)
+        for entry in latest.values():
+            self.add(entry)
+
+    def select(
+        self, meet: str = "", event: str = "", day: str = ""
+    ) -> List[IndexEntry]:
+        """
+        The results, newest first, that match the filters. Empty filters
+        match everything.
+
+        - meet: The meet number
+        - event: The event number
+        - day: The start of the date the result was recorded (e.g.,
+          "2024-05" for all of May 2024)
+        """
+        entries = (self._entries[filename] for _, filename in self._order)
+        return [
+            entry
+            for entry in entries
+            if (not meet or entry.meet_id == meet)
+            and (not event or str(entry.event) == (event.lstrip("0") or "0"))
+            and (not day or entry.day.startswith(day))
+        ]
+
+    def meets(self) -> List[str]:
+        """The meets w/ results in the index"""
+        return sorted({entry.meet_id for entry in self._entries.values()})
+
+    @staticmethod
+    def _key(entry: IndexEntry) -> Tuple[float, str]:
+        return (-entry.recorded.timestamp(), entry.filename)
+
+
+def index_entries(results: Iterable[RaceTimes]) -> List[IndexEntry]:
+    """The index entries for the results that were read from files"""
+    return [
+        IndexEntry(
+            result.filename,
+            result.meet_id,
+            result.event,
+            result.heat,
+            result.time_recorded,
+        )
+        for result in results
+        if result.filename
+    ]
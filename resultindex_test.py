@@ -0,0 +1,83 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the race result index"""
+
+import os
+from datetime import datetime, timedelta
+
+from racetimes import RawTime, from_do4
+from resultindex import IndexEntry, ResultIndex, index_entries
+
+START = datetime(2024, 5, 4, 9, 0)
+
+
+def _entry(number: int, meet: str = "1", event: int = 1) -> IndexEntry:
+    return IndexEntry(
+        f"{number}.do4", meet, event, 1, START + timedelta(minutes=number)
+    )
+
+
+def test_updates_keep_newest_first():
+    """Results that are added, removed, or changed stay in order"""
+    index = ResultIndex()
+    index.update([_entry(n) for n in [3, 1, 2]])
+    assert [x.filename for x in index.select()] == ["3.do4", "2.do4", "1.do4"]
+    # 1 is removed, 4 is added, and 2 was rewritten so it's now the newest
+    rewritten = IndexEntry("2.do4", "1", 1, 1, START + timedelta(minutes=5))
+    index.update([_entry(3), _entry(4), rewritten])
+    assert [x.filename for x in index.select()] == ["2.do4", "4.do4", "3.do4"]
+    assert len(index) == 3
+
+
+def test_filters():
+    """Results can be filtered by meet, event, and date"""
+    index = ResultIndex()
+    index.update(
+        [
+            _entry(1, meet="1", event=1),
+            _entry(2, meet="1", event=12),
+            _entry(3, meet="2", event=12),
+            IndexEntry("4.do4", "2", 1, 1, datetime(2024, 6, 1, 9, 0)),
+        ]
+    )
+    assert [x.filename for x in index.select(meet="2")] == ["4.do4", "3.do4"]
+    assert [x.filename for x in index.select(event="012")] == ["3.do4", "2.do4"]
+    assert [x.filename for x in index.select(day="2024-06")] == ["4.do4"]
+    assert [x.filename for x in index.select("1", "1", "2024-05-04")] == ["1.do4"]
+    assert not index.select(event="3")
+
+
+def test_entries_from_files():
+    """Results read from files are indexed by their file name"""
+    filename = os.path.join("testdata", "001-011-002A-0016.do4")
+    result = from_do4(filename, 2, RawTime("0.30"))
+    [entry] = index_entries([result])
+    assert entry.filename == filename
+    assert (entry.meet_id, entry.event, entry.heat) == ("001", 11, 2)
+
+
+def test_add_and_remove():
+    """Single results can be added, replaced, and removed"""
+    index = ResultIndex()
+    index.add(_entry(1))
+    index.add(_entry(2))
+    index.add(IndexEntry("1.do4", "1", 1, 1, START + timedelta(minutes=3)))
+    assert [x.filename for x in index.select()] == ["1.do4", "2.do4"]
+    index.remove("2.do4")
+    index.remove("missing.do4")
+    assert [x.filename for x in index.select()] == ["1.do4"]
+    assert "2.do4" not in index
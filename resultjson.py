@@ -0,0 +1,121 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+JSON representations of race results and the scoreboard theme so that the
+scoreboard can be rendered by the client (browser) instead of sending it an
+image.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from coremodel import CoreModel
+from racetimes import RaceTimes
+from scoreboard import format_lane_time
+
+JsonDoc = Dict[str, Any]
+
+
+def result_to_json(race: RaceTimes, lanes: int, theme: str) -> JsonDoc:
+    """
+    Describe a race result for display on the scoreboard.
+
+    Parameters:
+    - race: The result to describe
+    - lanes: The number of lanes to include
+    - theme: Path of the theme document to use when rendering the result
+
+    >>> from template import get_template
+    >>> doc = result_to_json(get_template(), 3, "/theme-1234.json")
+    >>> doc["event"], doc["heat"], doc["theme"]
+    (999, 99, '/theme-1234.json')
+    >>> doc["lanes"][0]
+    {'lane': 1, 'place': 1, 'name': 'HUTCHINS, LORRAINE O', 'team': 'TEAM', \
+'time': '99:50.99', 'valid': True}
+    >>> doc["lanes"][1]["time"], doc["lanes"][2]["valid"]
+    ('NS', False)
+    """
+    return {
+        "event": race.event,
+        "heat": race.heat,
+        "event_name": race.event_name,
+        "theme": theme,
+        "lanes": [
+            {
+                "lane": lane,
+                "place": race.place(lane),
+                "name": race.name(lane),
+                "team": race.team(lane),
+                "time": format_lane_time(race, lane),
+                "valid": race.final_time(lane).is_valid,
+            }
+            for lane in range(1, lanes + 1)
+        ],
+    }
+
+
+def theme_to_json(model: CoreModel, background: Optional[str]) -> JsonDoc:
+    """
+    Describe the scoreboard appearance settings.
+
+    Parameters:
+    - model: The model holding the appearance settings
+    - background: Path of the background image, or None if there isn't one
+    """
+    return {
+        "title": model.title.get(),
+        "num_lanes": model.num_lanes.get(),
+        "text_spacing": model.text_spacing.get(),
+        "font_normal": model.font_normal.get(),
+        "font_time": model.font_time.get(),
+        "colors": {
+            "title": model.color_title.get(),
+            "event": model.color_event.get(),
+            "even": model.color_even.get(),
+            "odd": model.color_odd.get(),
+            "first": model.color_first.get(),
+            "second": model.color_second.get(),
+            "third": model.color_third.get(),
+            "background": model.color_bg.get(),
+        },
+        "background": background,
+        "brightness": model.brightness_bg.get(),
+    }
+
+
+def to_bytes(doc: JsonDoc) -> bytes:
+    """
+    Serialize a document as compactly as possible
+
+    >>> to_bytes({"a": [1, 2], "b": None})
+    b'{"a":[1,2],"b":null}'
+    """
+    return json.dumps(doc, separators=(",", ":")).encode("utf-8")
+
+
+def version_of(data: bytes) -> str:
+    """
+    A short version identifier for some content. It changes whenever the
+    content does, so it can be used to make cacheable URLs.
+
+    >>> version_of(b"theme")
+    '6b26e3ff06ece7da'
+    >>> version_of(b"theme") == version_of(b"theme2")
+    False
+    """
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
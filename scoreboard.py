@@ -19,22 +19,22 @@ Generates an image of the scoreboard from a RaceTimes object.
 """
 from typing import Optional, Tuple
 
-import sentry_sdk
-from matplotlib import font_manager  # type: ignore
 from PIL import Image, ImageDraw, ImageFont, UnidentifiedImageError
 from PIL.ImageEnhance import Brightness
 
-from model import Model
+import metrics
+import tracing
+from coremodel import CoreModel
 from racetimes import RaceTimes, RawTime
 from startlist import NameMode, format_name
 
 
-def waiting_screen(size: Tuple[int, int], model: Model) -> Image.Image:
+def waiting_screen(size: Tuple[int, int], model: CoreModel) -> Image.Image:
     """Generate a "waiting" image to display on the scoreboard."""
     img = Image.new(mode="RGBA", size=size, color=model.color_bg.get())
     center = (int(size[0] * 0.5), int(size[1] * 0.8))
     normal = fontname_to_file(model.font_normal.get())
-    font_size = 72
+    font_size = int(size[1] * 0.1)  # 72 at 720p
     fnt = ImageFont.truetype(normal, font_size)
     draw = ImageDraw.Draw(img)
     color = model.color_event.get()
@@ -68,10 +68,11 @@ class ScoreboardImage:  # pylint: disable=too-many-instance-attributes
         self,
         size: Tuple[int, int],
         race: RaceTimes,
-        model: Model,
+        model: CoreModel,
         background: bool = True,
     ):
-        with sentry_sdk.start_span(op="render_image", description="Render image"):
+        render_timer = metrics.RENDER_SECONDS.time(str(background).lower())
+        with tracing.span(op="render_image", description="Render image"), render_timer:
             self._race = race
             self._model = model
             # We save the lane count once because it's used multiple times, and we
@@ -274,14 +275,7 @@ class ScoreboardImage:  # pylint: disable=too-many-instance-attributes
             )
 
     def _time_text(self, lane: int) -> str:
-        if self._race.is_noshow(lane):
-            return "NS"
-        final_time = self._race.final_time(lane)
-        if final_time.value == RawTime("0"):
-            return ""
-        if not final_time.is_valid:
-            return "--:--.--"
-        return format_time(final_time.value)
+        return format_lane_time(self._race, lane)
 
     def _baseline(self, line: int) -> int:
         """
@@ -314,8 +308,34 @@ def format_time(seconds: RawTime) -> str:
     return f"{minutes}:{seconds:05.2f}"
 
 
+def format_lane_time(race: RaceTimes, lane: int) -> str:
+    """
+    The text to display for a lane's final time
+
+    >>> from template import get_template
+    >>> format_lane_time(get_template(), 1)
+    '99:50.99'
+    >>> format_lane_time(get_template(), 2)
+    'NS'
+    >>> format_lane_time(get_template(), 3)
+    '--:--.--'
+    """
+    if race.is_noshow(lane):
+        return "NS"
+    final_time = race.final_time(lane)
+    if final_time.value == RawTime("0"):
+        return ""
+    if not final_time.is_valid:
+        return "--:--.--"
+    return format_time(final_time.value)
+
+
 def fontname_to_file(name: str) -> str:
     """Convert a font name (Roboto) to its corresponding file name"""
+    # matplotlib is slow to import, so wait until a font is actually needed
+    # pylint: disable-next=import-outside-toplevel
+    from matplotlib import font_manager  # type: ignore
+
     properties = font_manager.FontProperties(family=name, weight="bold")
     filename = font_manager.findfont(properties)
     return filename
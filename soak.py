@@ -0,0 +1,270 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Memory soak test for Wahoo Results.
+
+Tens of thousands of results are processed by the running application, a
+session of a generated meet at a time: the start lists are replaced w/ the
+next session's, and its results are added while only the latest ones are
+kept. The retained memory is sampled w/ tracemalloc every so many results,
+and the test fails if it keeps growing faster than the allowed slope. The
+allocation sites that grew the most are reported either way:
+
+    wahoo_results.py --test soak:<results>[:<interval>[:<max_slope>]]
+"""
+
+import gc
+import logging
+import os
+import shutil
+import tracemalloc
+from typing import List, Optional, Tuple
+
+from autotest import (
+    Counter,
+    Delay,
+    Enqueue,
+    Scenario,
+    Sequentially,
+    eventually,
+    generate_meet,
+)
+from model import Model
+
+logger = logging.getLogger(__name__)
+
+
+def build_soak_scenario(model: Model, test: str) -> Scenario:
+    """
+    Builds a test scenario that processes many results while watching for
+    memory leaks
+
+    :param model: the application model
+    :param test: soak:<results>[:<interval>[:<max_slope>]], where interval is
+        the number of results between memory samples (default: 1000) and
+        max_slope is the allowed growth in retained memory (bytes per result,
+        default: 64)
+    """
+    [results, *options] = test.split(":")[1:]
+    interval = int(options[0]) if options else 1000
+    max_slope = float(options[1]) if len(options) > 1 else 64.0
+    testdatadir = os.path.join(os.curdir, "testdata")
+    assert os.path.exists(testdatadir), "Test data directory does not exist"
+    tmp_startlist = os.path.join(testdatadir, "tmp_startlists")
+    tmp_result = os.path.join(testdatadir, "tmp_result")
+    for dirname in [tmp_startlist, tmp_result]:
+        shutil.rmtree(dirname, ignore_errors=True)
+        os.makedirs(dirname)
+    meetdir = generate_meet(testdatadir, 40)
+
+    startlist_counter = Counter(model.startlist_contents)
+    result_counter = Counter(model.latest_result)
+    model.enqueue(lambda: model.dir_startlist.set(tmp_startlist))
+    model.enqueue(lambda: model.dir_results.set(tmp_result))
+
+    return Sequentially(
+        [
+            Delay(2),  # Wait for the application to start
+            Soak(
+                meetdir,
+                tmp_startlist,
+                tmp_result,
+                [startlist_counter, result_counter],
+                int(results),
+                interval,
+                max_slope,
+            ),
+            Enqueue(model, model.menu_exit.run),
+        ]
+    )
+
+
+def memory_slope(samples: List[Tuple[int, int]]) -> float:
+    """
+    The growth in memory per result: the least-squares slope of the (results
+    processed, bytes) samples
+
+    >>> memory_slope([(0, 1000), (100, 1500), (200, 2000)])
+    5.0
+    >>> memory_slope([(100, 1000)])
+    0.0
+    """
+    if len(samples) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in samples) / len(samples)
+    mean_y = sum(y for _, y in samples) / len(samples)
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in samples)
+    variance = sum((x - mean_x) ** 2 for x, _ in samples)
+    return covariance / variance if variance else 0.0
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    """A snapshot of the allocations, except those made by tracemalloc"""
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+
+
+# pylint: disable-next=too-few-public-methods,too-many-instance-attributes
+class Soak(Scenario):
+    """
+    Process results over and over, a session of the meet at a time, and fail
+    if the retained memory keeps growing
+    """
+
+    # Number of sessions the meet's events are split into
+    SESSIONS = 4
+    # Number of result files kept in the results directory
+    WINDOW = 100
+    # Number of allocation sites to report
+    TOP_SITES = 15
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        meetdir: str,
+        startlistdir: str,
+        do4dir: str,
+        counters: List[Counter],
+        results: int,
+        interval: int,
+        max_slope: float,
+    ) -> None:
+        """
+        Process results over and over
+
+        :param meetdir: the directory containing the meet's start lists and
+            results
+        :param startlistdir: the directory for the startlists
+        :param do4dir: the directory for the do4 files
+        :param counters: the counters used to verify the start lists (first)
+            and do4 files (second) were processed
+        :param results: the number of results to process
+        :param interval: the number of results between memory snapshots
+        :param max_slope: the allowed growth in retained memory (bytes per
+            result)
+        """
+        super().__init__()
+        self._meetdir = meetdir
+        self._startlistdir = startlistdir
+        self._do4dir = do4dir
+        self._startlist_counter, self._result_counter = counters
+        self._results = results
+        self._interval = max(interval, 1)
+        self._max_slope = max_slope
+        self._processed = 0
+        self._samples: List[Tuple[int, int]] = []
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+        assert os.path.isdir(self._meetdir), "Meet directory does not exist"
+        assert os.path.isdir(self._startlistdir), "Startlist directory does not exist"
+        assert os.path.isdir(self._do4dir), "DO4 directory does not exist"
+
+    def _sessions(self) -> List[Tuple[List[str], List[str]]]:
+        """The start lists and results of each session, in order"""
+        files = sorted(os.listdir(self._meetdir))
+        scbs = [x for x in files if x.endswith(".scb")]
+        size = max(1, -(-len(scbs) // self.SESSIONS))
+        sessions = []
+        for first in range(0, len(scbs), size):
+            events = {int(x[1:4]) for x in scbs[first : first + size]}
+            do4s = [
+                x
+                for x in files
+                if x.endswith(".do4") and int(x.split("-")[1]) in events
+            ]
+            sessions.append((scbs[first : first + size], do4s))
+        return sessions
+
+    def _rotate_startlists(self, scbs: List[str]) -> None:
+        """Replace the start lists w/ those of the next session"""
+        for name in os.listdir(self._startlistdir):
+            os.remove(os.path.join(self._startlistdir, name))
+        before = self._startlist_counter.get()
+        for name in scbs:
+            shutil.copy(os.path.join(self._meetdir, name), self._startlistdir)
+        assert eventually(
+            lambda: self._startlist_counter.get() > before, 0.01, 1000
+        ), "Start lists were not processed"
+
+    def _add_result(self, do4: str) -> None:
+        """Copy a result into place, keeping only the latest WINDOW files"""
+        before = self._result_counter.get()
+        shutil.copy(os.path.join(self._meetdir, do4), self._do4dir)
+        assert eventually(
+            lambda: self._result_counter.get() > before, 0.005, 2000
+        ), "DO4 file was not processed"
+        existing = sorted(
+            (os.path.getmtime(x.path), x.path)
+            for x in os.scandir(self._do4dir)
+            if x.name.endswith(".do4")
+        )
+        for _, path in existing[: -self.WINDOW]:
+            os.remove(path)
+        self._processed += 1
+
+    def _run_session(self, scbs: List[str], do4s: List[str]) -> None:
+        logger.info("Soak: starting a session w/ %d events", len(scbs))
+        self._rotate_startlists(scbs)
+        for do4 in do4s[: self._results - self._processed]:
+            self._add_result(do4)
+            if self._processed % self._interval == 0:
+                self._snapshot()
+
+    def _snapshot(self) -> None:
+        """Record the retained memory"""
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        if self._baseline is None:
+            # The first interval warms up caches, so it isn't part of the trend
+            self._baseline = _take_snapshot()
+        else:
+            self._samples.append((self._processed, current))
+        logger.info(
+            "Soak: %d results, %.1f MiB retained",
+            self._processed,
+            current / (1024 * 1024),
+        )
+
+    def _report(self, slope: float) -> None:
+        print(f"Soak: processed {self._processed} results")
+        for processed, current in self._samples:
+            print(f"  {processed:>8} results: {current / (1024 * 1024):8.2f} MiB")
+        print(
+            f"Soak: retained memory grew {slope:.1f} bytes/result "
+            f"(limit {self._max_slope:g})"
+        )
+        if self._baseline is None:
+            return
+        print(f"Top {self.TOP_SITES} allocation sites by growth:")
+        growth = _take_snapshot().compare_to(self._baseline, "lineno")
+        for stat in growth[: self.TOP_SITES]:
+            print(f"  {stat}")
+
+    def run(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        sessions = self._sessions()
+        while self._processed < self._results:
+            for scbs, do4s in sessions:
+                if self._processed < self._results:
+                    self._run_session(scbs, do4s)
+        slope = memory_slope(self._samples)
+        self._report(slope)
+        assert slope <= self._max_slope, (
+            f"Retained memory grew {slope:.1f} bytes/result, "
+            f"more than the limit of {self._max_slope:g}"
+        )
@@ -0,0 +1,86 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Timing of the phases of application startup"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import sentry_sdk
+
+import tracing
+
+ClockFn = Callable[[], float]
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Records how long each phase of startup takes.
+
+    >>> now = 0.0
+    >>> timer = StartupTimer(clock=lambda: now)
+    >>> with timer.phase("settings"):
+    ...     now += 0.25
+    >>> with timer.phase("window"):
+    ...     now += 0.5
+    >>> timer.phases
+    [('settings', 0.25), ('window', 0.5)]
+    >>> timer.total
+    0.75
+    >>> print(timer.summary())
+    settings  250 ms
+    window    500 ms
+    total     750 ms
+    """
+
+    def __init__(self, clock: ClockFn = time.perf_counter):
+        self._clock = clock
+        self._start = clock()
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase of startup"""
+        start = self._clock()
+        with tracing.span(op="startup", description=name):
+            yield
+        self.phases.append((name, self._clock() - start))
+
+    @property
+    def total(self) -> float:
+        """Time (seconds) since the timer was created"""
+        return self._clock() - self._start
+
+    def summary(self) -> str:
+        """A table of the phases and their duration"""
+        rows = self.phases + [("total", self.total)]
+        width = max(len(name) for name, _ in rows)
+        return "\n".join(
+            f"{name:<{width}} {duration * 1000:4.0f} ms" for name, duration in rows
+        )
+
+    def report(self) -> None:
+        """Log the timings and attach them to crash reports"""
+        logger.info("Startup timing:\n%s", self.summary())
+        timings: Dict[str, int] = {
+            name: round(duration * 1000) for name, duration in self.phases
+        }
+        timings["total"] = round(self.total * 1000)
+        sentry_sdk.set_context("startup_ms", timings)
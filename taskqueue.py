@@ -0,0 +1,166 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A bounded queue of tasks for another thread to run.
+
+Tasks may be given a key. A task that's waiting to run is replaced by a newer
+one w/ the same key, so a burst of requests to redo the same work (e.g.,
+reloading the start lists) only does it once. When the queue is full, the
+overflow policy decides whether to wait for room or to drop a task.
+"""
+
+import collections
+import enum
+import queue
+import threading
+import time
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+Task = Callable[[], None]
+# A task and when (time.monotonic()) it was first enqueued
+QueuedTask = Tuple[Task, float]
+
+
+class Overflow(enum.Enum):
+    """What to do when a task is added to a full queue"""
+
+    BLOCK = "block"  # Wait for room
+    DROP_NEWEST = "drop-newest"  # Discard the task being added
+    DROP_OLDEST = "drop-oldest"  # Discard the task that has waited longest
+
+
+class Outcome(enum.Enum):
+    """What happened to a task that was added to the queue"""
+
+    ADDED = "added"
+    MERGED = "merged"  # It replaced a waiting task w/ the same key
+    DROPPED = "dropped"  # It, or an older task, was discarded
+
+
+class TaskQueue:  # pylint: disable=too-many-instance-attributes
+    """
+    A bounded FIFO queue of tasks, where tasks w/ the same key are merged
+
+    >>> tasks = TaskQueue(maxsize=2, overflow=Overflow.DROP_NEWEST)
+    >>> tasks.put(lambda: print("first"), key="startlists")
+    <Outcome.ADDED: 'added'>
+    >>> tasks.put(lambda: print("second"), key="startlists")
+    <Outcome.MERGED: 'merged'>
+    >>> tasks.put(lambda: print("third"))
+    <Outcome.ADDED: 'added'>
+    >>> tasks.put(lambda: print("fourth"))
+    <Outcome.DROPPED: 'dropped'>
+    >>> while not tasks.empty():
+    ...     tasks.get_nowait()[0]()
+    second
+    third
+    """
+
+    def __init__(self, maxsize: int = 0, overflow: Overflow = Overflow.BLOCK):
+        """
+        Parameters:
+        - maxsize: The most tasks that may be waiting, or 0 for no limit
+        - overflow: What to do when a task is added to a full queue. The
+          thread that takes the tasks never waits for room, since it would be
+          waiting for itself.
+        """
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        # The waiting tasks, as [key, task, enqueued]. The entries are lists
+        # so a merged task can be replaced in place.
+        self._tasks: Deque[List] = collections.deque()
+        self._keyed: Dict[Hashable, List] = {}
+        self._consumer: Optional[int] = None
+        self.merged = 0
+        self.dropped = 0
+
+    def configure(self, maxsize: int, overflow: Overflow) -> None:
+        """
+        Change the size limit and overflow policy (see __init__()). Tasks
+        that are already waiting are kept, even if there are now too many.
+        """
+        with self._lock:
+            self._maxsize = maxsize
+            self._overflow = overflow
+            self._not_full.notify_all()
+
+    def put(self, task: Task, key: Optional[Hashable] = None) -> Outcome:
+        """
+        Add a task to the queue. If a task w/ the same key is waiting, it's
+        replaced by this one, keeping its place in line.
+        """
+        with self._lock:
+            if key is not None and key in self._keyed:
+                self._keyed[key][1] = task
+                self.merged += 1
+                return Outcome.MERGED
+            outcome = Outcome.ADDED
+            if self._full():
+                if self._overflow == Overflow.DROP_NEWEST:
+                    self.dropped += 1
+                    return Outcome.DROPPED
+                if self._overflow == Overflow.DROP_OLDEST:
+                    self._pop()
+                    self.dropped += 1
+                    outcome = Outcome.DROPPED
+                elif threading.get_ident() != self._consumer:
+                    while self._full():
+                        self._not_full.wait()
+            entry = [key, task, time.monotonic()]
+            self._tasks.append(entry)
+            if key is not None:
+                self._keyed[key] = entry
+            self._not_empty.notify()
+            return outcome
+
+    def get(self, timeout: Optional[float] = None) -> QueuedTask:
+        """
+        Remove and return the oldest task, waiting up to timeout seconds (or
+        forever if None) for one. Raises queue.Empty if there isn't one.
+        """
+        with self._lock:
+            self._consumer = threading.get_ident()
+            if not self._not_empty.wait_for(lambda: self._tasks, timeout):
+                raise queue.Empty
+            return self._pop()
+
+    def get_nowait(self) -> QueuedTask:
+        """Remove and return the oldest task, raising queue.Empty if there
+        isn't one"""
+        return self.get(timeout=0)
+
+    def qsize(self) -> int:
+        """The number of waiting tasks"""
+        with self._lock:
+            return len(self._tasks)
+
+    def empty(self) -> bool:
+        """Whether there are no waiting tasks"""
+        return self.qsize() == 0
+
+    def _full(self) -> bool:
+        return 0 < self._maxsize <= len(self._tasks)
+
+    def _pop(self) -> QueuedTask:
+        key, task, enqueued = self._tasks.popleft()
+        if key is not None:
+            del self._keyed[key]
+        self._not_full.notify()
+        return task, enqueued
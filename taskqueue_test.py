@@ -0,0 +1,106 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the task queue"""
+
+import queue
+import threading
+
+import pytest
+
+from taskqueue import Outcome, Overflow, TaskQueue
+
+
+def _drain(tasks: TaskQueue) -> None:
+    while not tasks.empty():
+        tasks.get_nowait()[0]()
+
+
+def test_merged_task_keeps_its_place():
+    """A newer task w/ the same key replaces the waiting one, in its place"""
+    ran = []
+    tasks = TaskQueue()
+    tasks.put(lambda: ran.append("old result"), ("result", "a.do4"))
+    tasks.put(lambda: ran.append("other"), "other")
+    assert tasks.put(lambda: ran.append("new result"), ("result", "a.do4")) == (
+        Outcome.MERGED
+    )
+    assert tasks.qsize() == 2
+    _drain(tasks)
+    assert ran == ["new result", "other"]
+    assert tasks.merged == 1
+
+
+def test_key_is_reusable_once_taken():
+    """A task w/ the key of one that already ran is added again"""
+    tasks = TaskQueue()
+    tasks.put(lambda: None, "startlists")
+    tasks.get_nowait()
+    assert tasks.put(lambda: None, "startlists") == Outcome.ADDED
+    assert tasks.qsize() == 1
+
+
+def test_drop_oldest():
+    """When full, the task that waited longest is discarded"""
+    ran = []
+    tasks = TaskQueue(maxsize=2, overflow=Overflow.DROP_OLDEST)
+    tasks.put(lambda: ran.append(1), "first")
+    tasks.put(lambda: ran.append(2))
+    assert tasks.put(lambda: ran.append(3)) == Outcome.DROPPED
+    # The dropped task's key is free again
+    assert tasks.put(lambda: ran.append(4), "first") == Outcome.DROPPED
+    _drain(tasks)
+    assert ran == [3, 4]
+    assert tasks.dropped == 2
+
+
+def test_block_waits_for_room():
+    """A producer waits for the consumer to make room"""
+    tasks = TaskQueue(maxsize=1)
+    tasks.put(lambda: None)
+    added = threading.Event()
+
+    def produce() -> None:
+        tasks.put(lambda: None)
+        added.set()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    assert not added.wait(0.1)
+    tasks.get()
+    assert added.wait(5)
+    producer.join()
+    assert tasks.qsize() == 1
+
+
+def test_consumer_never_blocks():
+    """The consumer can add to a full queue, since it can't wait for itself"""
+    tasks = TaskQueue(maxsize=1)
+    with pytest.raises(queue.Empty):
+        tasks.get(timeout=0)
+    tasks.put(lambda: None)
+    assert tasks.put(lambda: None) == Outcome.ADDED
+    assert tasks.qsize() == 2
+
+
+def test_reconfigure():
+    """The limit and policy can be changed once tasks are waiting"""
+    tasks = TaskQueue(maxsize=1)
+    tasks.put(lambda: None)
+    tasks.configure(2, Overflow.DROP_NEWEST)
+    assert tasks.put(lambda: None) == Outcome.ADDED
+    assert tasks.put(lambda: None) == Outcome.DROPPED
+    assert tasks.qsize() == 2
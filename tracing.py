@@ -0,0 +1,334 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Performance tracing of the application's work.
+
+Code marks its work w/ transaction() (a top-level unit of work, like
+processing a new result) and span() (a stage within it, like rendering).
+Where the timings go depends on the TraceMode that is configured:
+
+- off: Nothing is recorded. Spans are a shared no-op object, so tracing costs
+  next to nothing.
+- sentry: Transactions are sampled and uploaded to Sentry.
+- local: Sampled timings are kept in an in-memory ring buffer (LocalTracer)
+  and never leave the computer.
+"""
+
+import enum
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Protocol,
+    Type,
+)
+
+import sentry_sdk
+
+ClockFn = Callable[[], float]
+RandomFn = Callable[[], float]
+
+logger = logging.getLogger(__name__)
+
+
+class TraceMode(enum.Enum):
+    """Where the traces are sent"""
+
+    OFF = "off"
+    SENTRY = "sentry"
+    LOCAL = "local"
+
+
+def mode_from_name(name: str) -> TraceMode:
+    """
+    Look up a tracing mode by name, falling back to Sentry if the name is not
+    recognized.
+
+    >>> mode_from_name("local")
+    <TraceMode.LOCAL: 'local'>
+    >>> mode_from_name("bogus")
+    <TraceMode.SENTRY: 'sentry'>
+    """
+    try:
+        return TraceMode(name)
+    except ValueError:
+        return TraceMode.SENTRY
+
+
+class Span(Protocol):  # pylint: disable=too-few-public-methods
+    """A unit of work that is being traced"""
+
+    def set_tag(self, key: str, value: Any) -> None:
+        """Attach a piece of information to the span"""
+
+
+class Tracer(Protocol):
+    """Creates the spans"""
+
+    def transaction(self, op: str, name: str) -> ContextManager[Span]:
+        """Trace a top-level unit of work"""
+
+    def span(self, op: str, description: str) -> ContextManager[Span]:
+        """Trace a stage of the current work"""
+
+
+class _NullSpan:
+    """A span that records nothing. It has no state, so it's shared."""
+
+    def set_tag(self, key: str, value: Any) -> None:
+        """Ignore the tag"""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """Doesn't trace anything"""
+
+    # pylint: disable-next=unused-argument
+    def transaction(self, op: str, name: str) -> ContextManager[Span]:
+        """Trace a top-level unit of work"""
+        return _NULL_SPAN
+
+    # pylint: disable-next=unused-argument
+    def span(self, op: str, description: str) -> ContextManager[Span]:
+        """Trace a stage of the current work"""
+        return _NULL_SPAN
+
+
+class SentryTracer:
+    """Sends the traces to Sentry, which samples the transactions"""
+
+    def transaction(self, op: str, name: str) -> ContextManager[Span]:
+        """Trace a top-level unit of work"""
+        return sentry_sdk.start_transaction(op=op, name=name)
+
+    def span(self, op: str, description: str) -> ContextManager[Span]:
+        """Trace a stage of the current work"""
+        return sentry_sdk.start_span(op=op, description=description)
+
+
+@dataclass
+class SpanRecord:
+    """The timing of a completed span"""
+
+    op: str
+    description: str
+    start: float  # Clock time when the span started (seconds)
+    duration: float  # seconds
+    tags: Dict[str, Any] = field(default_factory=dict)
+
+
+# Whether the current transaction is being recorded (None if there isn't one)
+_SAMPLED: ContextVar[Optional[bool]] = ContextVar("sampled", default=None)
+
+
+class _LocalSpan:
+    def __init__(self, tracer: "LocalTracer", op: str, description: str):
+        self._tracer = tracer
+        self._record = SpanRecord(op, description, 0.0, 0.0)
+
+    def set_tag(self, key: str, value: Any) -> None:
+        """Attach a piece of information to the span"""
+        self._record.tags[key] = value
+
+    def __enter__(self) -> "_LocalSpan":
+        self._record.start = self._tracer.clock()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._record.duration = self._tracer.clock() - self._record.start
+        self._tracer.add(self._record)
+
+
+class _LocalTransaction(_LocalSpan):
+    def __init__(self, tracer: "LocalTracer", op: str, name: str):
+        super().__init__(tracer, op, name)
+        self._token = _SAMPLED.set(True)
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        super().__exit__(exc_type, exc, traceback)
+        _SAMPLED.reset(self._token)
+
+
+class _UnsampledTransaction(_NullSpan):
+    def __init__(self) -> None:
+        self._token = _SAMPLED.set(False)
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        _SAMPLED.reset(self._token)
+
+
+class LocalTracer:
+    """
+    Keeps the timings of the most recent spans in memory.
+
+    The sampling decision is made per transaction, so either all or none of
+    its spans are recorded. Spans outside of a transaction are sampled
+    individually.
+
+    >>> now = 0.0
+    >>> tracer = LocalTracer(clock=lambda: now)
+    >>> with tracer.transaction("new_result", "New race result"):
+    ...     with tracer.span("render_image", "Render image"):
+    ...         now += 0.125
+    >>> [(r.op, r.duration) for r in tracer.records()]
+    [('render_image', 0.125), ('new_result', 0.125)]
+    >>> print(tracer.summary())
+    op            count   mean    max
+    new_result        1  125.0  125.0
+    render_image      1  125.0  125.0
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1000,
+        sample_rate: float = 1.0,
+        clock: ClockFn = time.perf_counter,
+        rand: RandomFn = random.random,
+    ):
+        """
+        Parameters:
+        - capacity: The number of spans to keep. Older ones are discarded.
+        - sample_rate: The fraction of transactions to record (0.0 - 1.0)
+        - clock: Source of the current time (seconds)
+        - rand: Source of random numbers in [0.0, 1.0) for sampling
+        """
+        self.clock = clock
+        self._rand = rand
+        self._sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._records: Deque[SpanRecord] = deque(maxlen=capacity)
+
+    def transaction(self, op: str, name: str) -> ContextManager[Span]:
+        """Trace a top-level unit of work"""
+        if self._rand() < self._sample_rate:
+            return _LocalTransaction(self, op, name)
+        return _UnsampledTransaction()
+
+    def span(self, op: str, description: str) -> ContextManager[Span]:
+        """Trace a stage of the current work"""
+        sampled = _SAMPLED.get()
+        if sampled is None:
+            sampled = self._rand() < self._sample_rate
+        if sampled:
+            return _LocalSpan(self, op, description)
+        return _NULL_SPAN
+
+    def add(self, record: SpanRecord) -> None:
+        """Record a completed span"""
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> List[SpanRecord]:
+        """The recorded spans, oldest first"""
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> str:
+        """A table of the duration (ms) of the recorded spans, by op"""
+        durations: Dict[str, List[float]] = {}
+        for record in self.records():
+            durations.setdefault(record.op, []).append(record.duration * 1000)
+        width = max([len("op")] + [len(op) for op in durations])
+        lines = [f"{'op':<{width}} {'count':>6} {'mean':>6} {'max':>6}"]
+        for op in sorted(durations):
+            values = durations[op]
+            lines.append(
+                f"{op:<{width}} {len(values):>6} "
+                f"{statistics.mean(values):>6.1f} {max(values):>6.1f}"
+            )
+        return "\n".join(lines)
+
+
+_TRACER: Tracer = NullTracer()
+
+
+def configure(mode: TraceMode, sample_rate: float) -> Tracer:
+    """
+    Set where the traces go. For Sentry, the sample rate must also be passed
+    to sentry_sdk.init().
+    """
+    global _TRACER  # pylint: disable=global-statement
+    if mode == TraceMode.SENTRY:
+        _TRACER = SentryTracer()
+    elif mode == TraceMode.LOCAL:
+        _TRACER = LocalTracer(sample_rate=sample_rate)
+    else:
+        _TRACER = NullTracer()
+    return _TRACER
+
+
+def transaction(op: str, name: str) -> ContextManager[Span]:
+    """Trace a top-level unit of work"""
+    return _TRACER.transaction(op, name)
+
+
+def span(op: str, description: str = "") -> ContextManager[Span]:
+    """Trace a stage of the current work"""
+    return _TRACER.span(op, description)
+
+
+def local_tracer() -> Optional[LocalTracer]:
+    """The tracer that holds the local timings, if tracing locally"""
+    return _TRACER if isinstance(_TRACER, LocalTracer) else None
+
+
+def report() -> None:
+    """Log a summary of the local timings"""
+    tracer = local_tracer()
+    if tracer is not None:
+        logger.info("Trace timings (ms):\n%s", tracer.summary())
@@ -0,0 +1,50 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the tracing facade"""
+
+import tracing
+from tracing import LocalTracer
+
+
+def test_unsampled_transaction_skips_spans():
+    """Spans within a transaction follow its sampling decision"""
+    tracer = LocalTracer(sample_rate=0.1, rand=lambda: 0.5)
+    with tracer.transaction("new_result", "New race result") as txn:
+        txn.set_tag("lanes", 10)
+        with tracer.span("render_image", "Render image"):
+            pass
+    assert not tracer.records()
+
+
+def test_ring_buffer_keeps_newest():
+    """Only the most recent spans are kept"""
+    tracer = LocalTracer(capacity=2)
+    for i in range(3):
+        with tracer.span("render_image", str(i)):
+            pass
+    assert [r.description for r in tracer.records()] == ["1", "2"]
+
+
+def test_configure():
+    """The module-level functions use the configured tracer"""
+    tracer = tracing.configure(tracing.TraceMode.LOCAL, 1.0)
+    with tracing.span("publish_one") as span:
+        span.set_tag("device", "lane display")
+    assert tracing.local_tracer() is tracer
+    assert tracer.records()[0].tags == {"device": "lane display"}
+    tracing.configure(tracing.TraceMode.OFF, 0.0)
+    assert tracing.local_tracer() is None
@@ -16,6 +16,7 @@ a = Analysis(
     binaries=[],
     datas=[
         ("media\\wr-icon.ico", "media"),
+        ("media\\board.html", "media"),
     ],
     hiddenimports=[
         # Needed starting with zeroconf 0.128.0 -> 0.131.0 transition
@@ -18,22 +18,15 @@
 """Wahoo Results!"""
 
 import argparse
-import copy
 import logging
 import os
-import platform
 import re
-import sys
 import threading
 import webbrowser
-from time import sleep
 from tkinter import Tk, filedialog, messagebox
-from typing import List, Optional
+from typing import TYPE_CHECKING, List
 
 import sentry_sdk
-from requests.exceptions import RequestException
-from sentry_sdk.integrations.socket import SocketIntegration
-from sentry_sdk.integrations.threading import ThreadingIntegration
 from watchdog.observers import Observer
 
 # We can't use Observer in type specifications due to
@@ -42,20 +35,40 @@ from watchdog.observers import Observer
 from watchdog.observers.api import BaseObserver
 
 import autotest
-import imagecast
+import coremodel
+import headless
 import main_window
+import soak
+import tracing
 import wh_analytics
-import wh_version
 from about import about
 from model import Model
+from pipeline import (
+    ANALYTICS_SPOOL_FILE,
+    CONFIG_FILE,
+    RELEASE_CACHE_FILE,
+    add_logging_args,
+    appearance_vars,
+    initialize_sentry,
+    load_result,
+    setup_do4_watcher,
+    setup_logging,
+    shutdown_sentry,
+    start_cast,
+)
 from racetimes import RaceTimes, RawTime, from_do4
-from scoreboard import ScoreboardImage, waiting_screen
-from startlist import events_to_csv, from_scb, load_all_scb
+from rendercache import IMAGE_SIZE
+from resultindex import IndexEntry, index_entries
+from scoreboard import ScoreboardImage
+from startlist import events_to_csv, load_all_scb
+from startup import StartupTimer
 from template import get_template
-from version import SENTRY_DSN, WAHOO_RESULTS_VERSION
-from watcher import DO4Watcher, SCBWatcher
+from version import WAHOO_RESULTS_VERSION
+from watcher import SCBWatcher
+
+if TYPE_CHECKING:
+    from wh_version import ReleaseInfo
 
-CONFIG_FILE = "wahoo-results.ini"
 logger = logging.getLogger(__name__)
 
 
@@ -94,7 +107,7 @@ def setup_template(model: Model) -> None:
         )
         if len(filename) == 0:
             return
-        template = ScoreboardImage(imagecast.IMAGE_SIZE, get_template(), model, True)
+        template = ScoreboardImage(IMAGE_SIZE, get_template(), model, True)
         template.image.save(filename)
 
     model.menu_export_template.add(do_export)
@@ -118,30 +131,31 @@ def setup_save(model: Model) -> None:
     model.menu_save_scoreboard.add(do_save)
 
 
+def setup_latency_export(model: Model) -> None:
+    """Setup handler for exporting the per-heat result latency"""
+
+    def do_export() -> None:
+        filename = filedialog.asksaveasfilename(
+            confirmoverwrite=True,
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv")],
+            initialfile="latency",
+        )
+        if len(filename) == 0:
+            return
+        model.latency.write_csv(filename)
+
+    model.latency_export.add(do_export)
+
+
 def setup_appearance(model: Model) -> None:
     """Link model changes to the scoreboard preview"""
 
     def update_preview() -> None:
-        preview = ScoreboardImage(imagecast.IMAGE_SIZE, get_template(), model)
+        preview = ScoreboardImage(IMAGE_SIZE, get_template(), model)
         model.appearance_preview.set(preview.image)
 
-    for element in [
-        model.font_normal,
-        model.font_time,
-        model.text_spacing,
-        model.title,
-        model.image_bg,
-        model.color_title,
-        model.color_event,
-        model.color_even,
-        model.color_odd,
-        model.color_first,
-        model.color_second,
-        model.color_third,
-        model.color_bg,
-        model.brightness_bg,
-        model.num_lanes,
-    ]:
+    for element in appearance_vars(model):
         element.trace_add("write", lambda *_: update_preview())
     update_preview()
 
@@ -182,7 +196,9 @@ def setup_scb_watcher(model: Model, observer: BaseObserver) -> None:
         # When the watcher notices a change in the startlists, the update
         # needs to happen from the main thread, so we enqueue instead of
         # directly call process_startlists from the SCBWatcher.
-        observer.schedule(SCBWatcher(lambda: model.enqueue(process_startlists)), path)
+        observer.schedule(
+            SCBWatcher(lambda: model.enqueue(process_startlists, "startlists")), path
+        )
         logger.debug("scb watcher updated to %s", path)
         process_startlists()
 
@@ -190,15 +206,17 @@ def setup_scb_watcher(model: Model, observer: BaseObserver) -> None:
     scb_dir_updated()
 
 
+def is_result_file(name: str) -> bool:
+    """Whether a file name is that of a race result (e.g., 1-001-002A-0003.do4)"""
+    return name.endswith(".do4") and re.match(r"^(\d+)-", name) is not None
+
+
 def summarize_racedir(directory: str) -> List[RaceTimes]:
     """Summarize all race results in a directory"""
     files = os.scandir(directory)
     contents: List[RaceTimes] = []
     for file in files:
-        if file.name.endswith(".do4"):
-            match = re.match(r"^(\d+)-", file.name)
-            if match is None:
-                continue
+        if is_result_file(file.name):
             try:
                 # min times and threshold don't matter for the summary
                 racetime = from_do4(file.path, 1, RawTime(99.9))
@@ -211,257 +229,202 @@ def summarize_racedir(directory: str) -> List[RaceTimes]:
     return contents
 
 
-def load_result(model: Model, filename: str) -> Optional[RaceTimes]:
-    """Load a result file and corresponding startlist"""
-    racetime: Optional[RaceTimes] = None
-    # Retry mechanism since we get errors if we try to read while it's
-    # still being written.
-    for tries in range(1, 6):
-        try:
-            racetime = from_do4(
-                filename, model.min_times.get(), RawTime(model.time_threshold.get())
-            )
-        except ValueError:
-            sleep(0.05 * tries)
-        except OSError:
-            sleep(0.05 * tries)
-    if racetime is None:
-        return None
-    efilename = f"E{racetime.event:0>3}.scb"
-    try:
-        startlist = from_scb(os.path.join(model.dir_startlist.get(), efilename))
-        racetime.set_names(startlist)
-    except OSError:
-        pass
-    except ValueError:
-        pass
-    return racetime
-
-
-def setup_do4_watcher(model: Model, observer: BaseObserver) -> None:
-    """Set up watches for files/directories and connect to model"""
-
-    def process_racedir() -> None:
-        """
-        Load all the race results and update the UI
-        """
-        with sentry_sdk.start_span(
-            op="update_race_ui", description="Update race summaries in UI"
-        ) as span:
-            directory = model.dir_results.get()
-            contents = summarize_racedir(directory)
-            span.set_tag("race_files", len(contents))
-            model.results_contents.set(contents)
-
-    def process_new_result(file: str) -> None:
-        """Process a new race result that has been detected"""
-        with sentry_sdk.start_transaction(op="new_result", name="New race result"):
-            racetime = load_result(model, file)
-            if racetime is None:
-                return
-            scoreboard = ScoreboardImage(imagecast.IMAGE_SIZE, racetime, model)
-            model.scoreboard.set(scoreboard.image)
-            model.latest_result.set(racetime)
-            num_cc = len([x for x in model.cc_status.get() if x.enabled])
-            wh_analytics.results_received(racetime.has_names, num_cc)
-            process_racedir()  # update the UI
-
-    def do4_dir_updated() -> None:
-        """
-        When the raceresult directory is changed, update the watch to look at
-        the new directory and trigger processing of the results.
-        """
-        path = model.dir_results.get()
-        if not os.path.exists(path):
+def setup_results_summary(model: Model, observer: BaseObserver) -> None:
+    """
+    Watch the result directory, keeping the UI's index of results updated.
+    When the directory changes, it's scanned in the background. After that,
+    only the results that are added or removed change the index.
+    """
+    index = model.results_contents.get()
+
+    def scan_racedir(directory: str) -> None:
+        """Load all the race results in the background and index them"""
+        with tracing.transaction(op="scan_racedir", name="Scan race results") as txn:
+            entries = index_entries(summarize_racedir(directory))
+            txn.set_tag("race_files", len(entries))
+        model.enqueue(lambda: add_entries(directory, entries))
+
+    def add_entries(directory: str, entries: List[IndexEntry]) -> None:
+        # Skip the scan if the directory has changed since
+        if directory != model.dir_results.get():
             return
-        observer.unschedule_all()
-
-        def async_process(file: str) -> None:
-            model.enqueue(lambda: process_new_result(file))
-
-        observer.schedule(DO4Watcher(async_process), path)
-        logger.debug("do4 watcher updated to %s", path)
-        process_racedir()
-
-    model.dir_results.trace_add("write", lambda *_: do4_dir_updated())
-    do4_dir_updated()
+        for entry in entries:
+            index.add(entry)
+        model.results_contents.set(index)
+
+    def racedir_changed(directory: str) -> None:
+        index.update([])
+        model.results_contents.set(index)
+        threading.Thread(
+            target=scan_racedir, args=(directory,), name="scan-racedir", daemon=True
+        ).start()
+
+    def result_added(racetime: RaceTimes) -> None:
+        if is_result_file(os.path.basename(racetime.filename)):
+            for entry in index_entries([racetime]):
+                index.add(entry)
+            model.results_contents.set(index)
+
+    def result_removed(filename: str) -> None:
+        if filename in index:
+            index.remove(filename)
+            model.results_contents.set(index)
+
+    def preview_selected() -> None:
+        """Load and render the result that was selected from the list"""
+        filename = model.history_file.get()
+        racetime = load_result(model, filename) if filename else None
+        if racetime is not None:
+            image = ScoreboardImage(IMAGE_SIZE, racetime, model).image
+            model.history_preview.set(image)
+
+    model.history_file.trace_add("write", lambda *_: preview_selected())
+    setup_do4_watcher(model, observer, racedir_changed, result_added, result_removed)
 
 
 def check_for_update(model: Model) -> None:
-    """Notifies if there's a newer released version"""
+    """
+    Notifies if there's a newer released version. The check runs in the
+    background so it doesn't delay startup, and GitHub is only asked once
+    per update_check_hours.
+    """
     current_version = model.version.get()
-    try:
-        latest_version = wh_version.latest()
-        if latest_version is not None and not wh_version.is_latest_version(
-            latest_version, current_version
-        ):
-            model.statustext.set(
-                f"New version available. Click to download: {latest_version.tag}"
-            )
-            model.statusclick.add(lambda: webbrowser.open(latest_version.url))
-    except RequestException as ex:
-        logger.warning("Error checking for update: %s", ex)
-
-
-def setup_run(model: Model, icast: imagecast.ImageCast) -> None:
-    """Link Chromecast discovery/management to the UI"""
+    interval = model.update_check_hours.get() * 60 * 60
 
-    def cast_discovery() -> None:
-        dev_list = copy.deepcopy(icast.get_devices())
-        model.enqueue(lambda: model.cc_status.set(dev_list))
-
-    def update_cc_list() -> None:
-        dev_list = model.cc_status.get()
-        for dev in dev_list:
-            icast.enable(dev.uuid, dev.enabled)
+    def notify(latest_version: "ReleaseInfo") -> None:
+        model.statustext.set(
+            f"New version available. Click to download: {latest_version.tag}"
+        )
+        model.statusclick.add(lambda: webbrowser.open(latest_version.url))
 
-    model.cc_status.trace_add("write", lambda *_: update_cc_list())
-    icast.set_discovery_callback(cast_discovery)
+    def check() -> None:
+        # requests is slow to import, so wait until it's needed
+        # pylint: disable=import-outside-toplevel
+        from requests.exceptions import RequestException
 
-    # Link Chromecast contents to the UI preview
-    model.scoreboard.trace_add(
-        "write", lambda *_: icast.publish(model.scoreboard.get())
-    )
+        from wh_version import is_latest_version, latest
 
+        try:
+            latest_version = latest(RELEASE_CACHE_FILE, interval)
+            if latest_version is not None and not is_latest_version(
+                latest_version, current_version
+            ):
+                model.enqueue(lambda: notify(latest_version))
+        except (RequestException, ValueError, KeyError) as ex:
+            logger.warning("Error checking for update: %s", ex)
 
-def initialize_sentry(model: Model) -> None:
-    """Initialize sentry.io crash reporting"""
-    execution_environment = "source"
-    if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
-        execution_environment = "executable"
-    if autotest.TESTING:
-        execution_environment = "test"
-
-    # Initialize Sentry crash reporting
-    sentry_sdk.init(
-        dsn=SENTRY_DSN,
-        sample_rate=1.0,
-        traces_sample_rate=1.0,
-        environment=execution_environment,
-        release=f"wahoo-results@{WAHOO_RESULTS_VERSION}",
-        include_local_variables=True,
-        integrations=[SocketIntegration(), ThreadingIntegration(propagate_hub=True)],
-        debug=False,
-    )
-    uname = platform.uname()
-    sentry_sdk.set_tag("os_system", uname.system)
-    sentry_sdk.set_tag("os_release", uname.release)
-    sentry_sdk.set_tag("os_version", uname.version)
-    sentry_sdk.set_tag("os_machine", uname.machine)
-    sentry_sdk.set_user(
-        {
-            "id": model.client_id.get(),
-            "ip_address": "{{auto}}",
-        }
-    )
+    threading.Thread(target=check, name="update-check", daemon=True).start()
 
 
 def main() -> None:  # pylint: disable=too-many-statements,too-many-locals
     """Main program"""
     arg_parser = argparse.ArgumentParser()
-    arg_parser.add_argument(
-        "--loglevel",
-        type=str,
-        help="Set the log level",
-        choices=["debug", "info", "warning", "error", "critical"],
-    )
-    arg_parser.add_argument(
-        "--logfile",
-        type=str,
-        help="Send log output to the specified file instead of the screen",
-    )
+    add_logging_args(arg_parser)
     arg_parser.add_argument(
         "--test",
         type=str,
         help="Enable test mode, running for the specified scenario",
     )
+    arg_parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Run w/o the user interface, using the settings from the ini file",
+    )
     args = arg_parser.parse_args()
-    if args.loglevel is not None:
-        loglevel = args.loglevel
-        numeric_level = getattr(logging, loglevel.upper(), None)
-        if not isinstance(numeric_level, int):
-            raise ValueError(f"Invalid log level: {loglevel}")
-        logging.basicConfig(
-            format="%(asctime)s %(module)s %(levelname)s %(message)s",
-            level=numeric_level,
-            filename=args.logfile,  # May be None
-        )
+    setup_logging(args)
     if args.test is not None:
-        autotest.set_test_mode()
-
-    root = Tk()
-
-    model = Model(root)
-
-    model.load(CONFIG_FILE)
-    model.version.set(WAHOO_RESULTS_VERSION)
-
-    initialize_sentry(model)
-    hub = sentry_sdk.Hub.current
-    hub.start_session(session_mode="application")
-
-    screen_size = (root.winfo_screenwidth(), root.winfo_screenheight())
-    wh_analytics.application_start(model, screen_size)
-    sentry_sdk.set_context(
-        "display",
-        {
-            "size": f"{screen_size[0]}x{screen_size[1]}",
-        },
-    )
-
-    main_window.View(root, model)
-
-    setup_exit(root, model)
-    setup_save(model)
-    setup_template(model)
-
-    def docs_fn() -> None:
-        query_params = "&".join(
-            [
-                "utm_source=wahoo_results",
-                "utm_medium=menu",
-                "utm_campaign=docs_link",
-                f"ajs_uid={model.client_id.get()}",
-            ]
+        coremodel.set_test_mode()
+    if args.headless:
+        headless.run()
+        return
+
+    # Startup is staged so the window appears as early as possible. The
+    # network requests (update check & analytics) happen in the background.
+    timer = StartupTimer()
+    with timer.phase("settings"):
+        root = Tk()
+        model = Model(root)
+        model.load(CONFIG_FILE)
+        model.version.set(WAHOO_RESULTS_VERSION)
+
+    with timer.phase("crash reporting"):
+        hub = initialize_sentry(model)
+        screen_size = (root.winfo_screenwidth(), root.winfo_screenheight())
+        sentry_sdk.set_context(
+            "display",
+            {
+                "size": f"{screen_size[0]}x{screen_size[1]}",
+            },
         )
-        webbrowser.open("https://wahoo-results.com/?" + query_params)
-
-    model.menu_docs.add(docs_fn)
-    check_for_update(model)
-
-    model.menu_about.add(lambda: about(root))
-
-    # Connections for the appearance tab
-    setup_appearance(model)
 
-    # Connections for the directories tab
-    scb_observer = Observer()
-    scb_observer.start()
-    setup_scb_watcher(model, scb_observer)
-
-    do4_observer = Observer()
-    do4_observer.start()
-    setup_do4_watcher(model, do4_observer)
-
-    def write_dolphin_csv():
-        directory = model.dir_startlist.get()
-        slists = load_all_scb(directory)
-        csv = events_to_csv(slists)
-        filename = os.path.join(directory, "dolphin_events.csv")
-        with open(filename, "w", encoding="cp1252") as file:
-            file.writelines(csv)
-        num_events = len(csv)
-        wh_analytics.wrote_dolphin_csv(num_events)
+    with timer.phase("window"):
+        main_window.View(root, model)
+
+        setup_exit(root, model)
+        setup_save(model)
+        setup_template(model)
+        setup_latency_export(model)
+
+        def docs_fn() -> None:
+            query_params = "&".join(
+                [
+                    "utm_source=wahoo_results",
+                    "utm_medium=menu",
+                    "utm_campaign=docs_link",
+                    f"ajs_uid={model.client_id.get()}",
+                ]
+            )
+            webbrowser.open("https://wahoo-results.com/?" + query_params)
 
-    model.dolphin_export.add(write_dolphin_csv)
+        model.menu_docs.add(docs_fn)
+        model.menu_about.add(lambda: about(root))
 
-    # Connections for the run tab
-    icast = imagecast.ImageCast(9998)
-    setup_run(model, icast)
-    icast.start()
+        # Connections for the appearance tab
+        setup_appearance(model)
 
-    # Set initial scoreboard image
-    model.scoreboard.set(waiting_screen(imagecast.IMAGE_SIZE, model))
+        # Allow the root window to build, then close the splash screen if
+        # it's up and we're running in exe mode
+        try:
+            root.update()
+            # pylint: disable=import-error,import-outside-toplevel
+            import pyi_splash  # type: ignore
+
+            if pyi_splash.is_alive():
+                pyi_splash.close()
+        except ModuleNotFoundError:
+            pass
+        except RuntimeError:
+            pass
+
+    with timer.phase("background tasks"):
+        wh_analytics.application_start(model, screen_size, ANALYTICS_SPOOL_FILE)
+        check_for_update(model)
+
+    with timer.phase("watchers"):
+        # Connections for the directories tab
+        scb_observer = Observer()
+        scb_observer.start()
+        setup_scb_watcher(model, scb_observer)
+
+        do4_observer = Observer()
+        do4_observer.start()
+        setup_results_summary(model, do4_observer)
+
+        def write_dolphin_csv():
+            directory = model.dir_startlist.get()
+            slists = load_all_scb(directory)
+            csv = events_to_csv(slists)
+            filename = os.path.join(directory, "dolphin_events.csv")
+            with open(filename, "w", encoding="cp1252") as file:
+                file.writelines(csv)
+            num_events = len(csv)
+            wh_analytics.wrote_dolphin_csv(num_events)
+
+        model.dolphin_export.add(write_dolphin_csv)
+
+    with timer.phase("casting"):
+        # Connections for the run tab
+        icast = start_cast(model)
 
     # Analytics triggers
     model.menu_docs.add(wh_analytics.documentation_link)
@@ -472,26 +435,17 @@ def main() -> None:  # pylint: disable=too-many-statements,too-many-locals
     model.dir_results.trace_add(
         "write", lambda *_: wh_analytics.set_do4_directory(True)
     )
-
-    # Allow the root window to build, then close the splash screen if it's up
-    # and we're running in exe mode
-    try:
-        root.update()
-        # pylint: disable=import-error,import-outside-toplevel
-        import pyi_splash  # type: ignore
-
-        if pyi_splash.is_alive():
-            pyi_splash.close()
-    except ModuleNotFoundError:
-        pass
-    except RuntimeError:
-        pass
+    timer.report()
 
     if args.test is not None:
-        scenario = autotest.build_scenario(model, args.test)
+        if args.test.startswith("soak:"):
+            scenario = soak.build_soak_scenario(model, args.test)
+        else:
+            scenario = autotest.build_scenario(model, args.test)
         autotest.run_scenario(scenario)
 
     root.mainloop()
+    model.stop()
     logger.debug("Cancelling all 'after' events")
     for after_id in root.tk.eval("after info").split():
         root.after_cancel(after_id)
@@ -510,11 +464,7 @@ def main() -> None:  # pylint: disable=too-many-statements,too-many-locals
     root.update()
     wh_analytics.application_stop(model)
     root.update()
-    logger.debug("Shutting down Sentry")
-    hub.end_session()
-    client = hub.client
-    if client is not None:
-        client.close(timeout=2.0)
+    shutdown_sentry(hub)
     if logger.isEnabledFor(logging.DEBUG):
         for thread in threading.enumerate():
             logger.debug(
@@ -17,10 +17,12 @@
 """Monitor the startlist directory"""
 
 import logging
-from typing import Callable
+from typing import Callable, Optional
 
 import watchdog.events  # type: ignore
 
+import metrics
+
 CallbackFn = Callable[[], None]
 CreatedCallbackFn = Callable[[str], None]
 
@@ -35,6 +37,7 @@ class SCBWatcher(watchdog.events.PatternMatchingEventHandler):
         self._callback = callback
 
     def on_any_event(self, event: watchdog.events.FileSystemEvent):
+        metrics.WATCHER_EVENTS.inc("scb", event.event_type)
         # Limit triggering to only events that modify the contents to avoid
         # creating a loop
         if event.event_type in [
@@ -50,14 +53,37 @@ class SCBWatcher(watchdog.events.PatternMatchingEventHandler):
 
 
 class DO4Watcher(watchdog.events.PatternMatchingEventHandler):
-    """Monitors a directory for new .do4 race result files"""
+    """Monitors a directory for new (and removed) .do4 race result files"""
 
-    def __init__(self, callback: CreatedCallbackFn):
+    def __init__(
+        self, callback: CreatedCallbackFn, removed: Optional[CreatedCallbackFn] = None
+    ):
+        """
+        Parameters:
+        - callback: Called w/ the path of each new result file
+        - removed: Called w/ the path of each result file that is deleted or
+          moved away
+        """
         super().__init__(patterns=["*.do4"], ignore_directories=True)
         self._callback = callback
+        self._removed = removed
+
+    def on_any_event(self, event: watchdog.events.FileSystemEvent):
+        metrics.WATCHER_EVENTS.inc("do4", event.event_type)
 
     def on_created(self, event: watchdog.events.FileSystemEvent):
         logger.debug(
             "DO4Watcher: operation=%s, path=%s", event.event_type, event.src_path
         )
         self._callback(event.src_path)
+
+    def on_deleted(self, event: watchdog.events.FileSystemEvent):
+        logger.debug(
+            "DO4Watcher: operation=%s, path=%s", event.event_type, event.src_path
+        )
+        if self._removed is not None:
+            self._removed(event.src_path)
+
+    def on_moved(self, event: watchdog.events.FileSystemEvent):
+        if self._removed is not None and event.src_path.endswith(".do4"):
+            self._removed(event.src_path)
@@ -14,53 +14,56 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-"""Application usage analytics"""
+"""
+Application usage analytics
+
+The events are built and sent from a background queue so that the network
+requests (and the slow to import analytics libraries) never delay the user
+interface or the publishing of results. Events are sent in batches, and they
+are saved to disk while offline so they can be sent later.
+"""
 
 import locale
 import platform
 import socket
 import time
+from datetime import datetime, timezone
 from pprint import pprint
-from typing import Any, Dict, Optional, Tuple
-
-import ipinfo  # type: ignore
-import ipinfo.exceptions  # type: ignore
-import requests
-import sentry_sdk
-from segment import analytics  # type: ignore
+from typing import Any, Dict, List, Optional, Tuple
 
-import autotest
+import coremodel
 import version
-from model import Model
+from analyticsqueue import AnalyticsQueue, Message
+from coremodel import CoreModel
 
 _CONTEXT: Dict[str, Any] = {}
-
-
-def application_start(model: Model, screen_size: Tuple[int, int]) -> None:
-    """Event for application startup"""
-    analytics.write_key = version.SEGMENT_WRITE_KEY
-    analytics.send = model.analytics.get()
-    global _CONTEXT  # pylint: disable=global-statement
+_QUEUE: Optional[AnalyticsQueue] = None
+# How long (seconds) to wait for the queued events to be sent at shutdown
+_SHUTDOWN_TIMEOUT = 10
+
+
+def application_start(
+    model: CoreModel, screen_size: Tuple[int, int], spool_file: Optional[str] = None
+) -> None:
+    """
+    Event for application startup. Events that couldn't be sent are saved in
+    spool_file.
+    """
+    global _CONTEXT, _QUEUE  # pylint: disable=global-statement
     _CONTEXT = {
-        "context": _setup_context(screen_size),
         "race_count": 0,
         "race_count_with_names": 0,
         "session_start": time.time(),
         "user_id": model.client_id.get(),
+        "send": model.analytics.get(),
     }
-
-    if autotest.TESTING:  # Don't send analytics during testing
-        return
-
-    analytics.identify(
-        user_id=_CONTEXT["user_id"],
-        context=_CONTEXT["context"],
-        traits=_CONTEXT["context"]["traits"],
-    )
-    _send_event("Scoreboard started")
+    _QUEUE = AnalyticsQueue(_post, spool_file)
+    _QUEUE.start()
+    timestamp = datetime.now(timezone.utc)
+    _QUEUE.put(lambda: _start_session(screen_size, timestamp))
 
 
-def application_stop(model: Model) -> None:
+def application_stop(model: CoreModel) -> None:
     """Event for application shutdown"""
     _send_event(
         "Scoreboard stopped",
@@ -76,7 +79,8 @@ def application_stop(model: Model) -> None:
             "time_font": model.font_time.get(),
         },
     )
-    analytics.shutdown()
+    if _QUEUE is not None:
+        _QUEUE.stop(_SHUTDOWN_TIMEOUT)
 
 
 def results_received(has_names: bool, chromecasts: int) -> None:
@@ -140,22 +144,85 @@ def cc_toggle(enable: bool) -> None:
 
 
 def _send_event(name: str, kvparams: Optional[Dict[str, Any]] = None) -> None:
-    with sentry_sdk.start_span(op="analytics", description="Process analytics event"):
-        if "user_id" not in _CONTEXT:
-            return
-        if autotest.TESTING:  # Don't send analytics during testing
-            return
-        if kvparams is None:
-            kvparams = {}
-        analytics.track(
-            _CONTEXT["user_id"], name, kvparams, context=_CONTEXT["context"]
+    if "user_id" not in _CONTEXT or _QUEUE is None:
+        return
+    # Events keep the time they happened, not the time they're sent
+    timestamp = datetime.now(timezone.utc)
+    _QUEUE.put(lambda: _track(name, kvparams or {}, timestamp))
+
+
+def _client() -> Any:
+    """
+    A Segment client that only builds messages. Sending is left to the
+    AnalyticsQueue so the messages can be batched and saved while offline.
+    """
+    if "client" not in _CONTEXT:
+        # The analytics library is slow to import, so wait until it's needed
+        # pylint: disable-next=import-outside-toplevel
+        from segment.analytics.client import Client  # type: ignore
+
+        _CONTEXT["client"] = Client(
+            version.SEGMENT_WRITE_KEY, send=False, sync_mode=True
         )
-        if analytics.write_key == "unknown":  # dev environment
-            print(f"Event: {name}")
-            pprint(kvparams)
+    return _CONTEXT["client"]
+
+
+def _should_send() -> bool:
+    if coremodel.TESTING:  # Don't send analytics during testing
+        return False
+    return _CONTEXT["send"]
+
+
+def _post(batch: List[Message]) -> None:
+    """Send a batch of messages, raising an exception if it should be retried"""
+    # pylint: disable-next=import-outside-toplevel
+    from segment.analytics.request import APIError, post  # type: ignore
+
+    try:
+        post(version.SEGMENT_WRITE_KEY, batch=batch, timeout=_SHUTDOWN_TIMEOUT)
+    except APIError as err:
+        # Retrying won't fix a rejected batch, but it will fix rate limiting
+        # or server problems
+        if err.status == 429 or err.status >= 500:
+            raise
+
+
+def _start_session(screen_size: Tuple[int, int], timestamp: datetime) -> List[Message]:
+    _CONTEXT["context"] = _setup_context(screen_size)
+    if not _should_send():
+        return []
+    _, identify = _client().identify(
+        user_id=_CONTEXT["user_id"],
+        context=_CONTEXT["context"],
+        traits=_CONTEXT["context"]["traits"],
+        timestamp=timestamp,
+    )
+    return [identify] + _track("Scoreboard started", {}, timestamp)
+
+
+def _track(name: str, kvparams: Dict[str, Any], timestamp: datetime) -> List[Message]:
+    if not _should_send():
+        return []
+    _, message = _client().track(
+        _CONTEXT["user_id"],
+        name,
+        kvparams,
+        context=_CONTEXT["context"],
+        timestamp=timestamp,
+    )
+    if version.SEGMENT_WRITE_KEY == "unknown":  # dev environment
+        print(f"Event: {name}")
+        pprint(kvparams)
+        return []
+    return [message]
 
 
 def _setup_context(screen_size: Tuple[int, int]) -> Dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    import ipinfo  # type: ignore
+    import ipinfo.exceptions  # type: ignore
+    import requests
+
     uname = platform.uname()
     # https://segment.com/docs/connections/spec/identify/#traits
     traits: Dict[str, Any] = {}
@@ -202,6 +269,8 @@ def _setup_context(screen_size: Tuple[int, int]) -> Dict[str, Any]:
         pass
     except requests.HTTPError:  # General HTTP error
         pass
+    except requests.ConnectionError:  # No network
+        pass
     except requests.JSONDecodeError:  # Invalid JSON returned
         pass
     except requests.Timeout:  # ConnectTimeout or ReadTimeout
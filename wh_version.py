@@ -16,14 +16,25 @@
 
 """Version information"""
 import datetime
+import json
+import logging
+import os
 import re
-from typing import List, Optional
+import time
+from dataclasses import asdict, dataclass, field
+from http import HTTPStatus
+from typing import Any, Dict, List, Optional
 
 import dateutil.parser
 import dateutil.tz
 import requests
 import semver.version  # type: ignore
 
+# The fields of GitHub's release JSON that are used by ReleaseInfo
+_RELEASE_FIELDS = ["tag_name", "html_url", "draft", "prerelease", "published_at"]
+
+logger = logging.getLogger(__name__)
+
 
 # pylint: disable=too-few-public-methods
 class ReleaseInfo:
@@ -50,22 +61,65 @@ class ReleaseInfo:
             self.semver = match.group(1)
 
 
-def releases(user_repo: str) -> List[ReleaseInfo]:
+@dataclass
+class ReleaseCache:
+    """The release list last retrieved from GitHub, saved between runs"""
+
+    checked: float = 0.0  # When GitHub was last asked (seconds since the epoch)
+    etag: str = ""  # The ETag of the release list
+    releases: List[Dict[str, Any]] = field(default_factory=list)  # Release JSON
+
+    @classmethod
+    def load(cls, filename: str) -> "ReleaseCache":
+        """Load the cache from a file, returning an empty cache if it's missing"""
+        try:
+            with open(filename, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            return cls(
+                float(data["checked"]), str(data["etag"]), list(data["releases"])
+            )
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            logger.warning("Unable to load release cache: %s", err)
+        return cls()
+
+    def save(self, filename: str) -> None:
+        """Save the cache to a file"""
+        tmpfile = filename + ".tmp"
+        try:
+            with open(tmpfile, "w", encoding="utf-8") as file:
+                json.dump(asdict(self), file)
+            os.replace(tmpfile, filename)
+        except OSError as err:
+            logger.warning("Unable to save release cache: %s", err)
+
+
+def fetch_releases(user_repo: str, cache: ReleaseCache) -> None:
     """
-    Retrieves the list of releases for the provided repo. user_repo should be
-    of the form "user/repo" (i.e., "JohnStrunk/wahoo-results")
+    Update the cache w/ the list of releases for the provided repo. user_repo
+    should be of the form "user/repo" (i.e., "JohnStrunk/wahoo-results"). The
+    cached ETag is sent so that an unchanged list isn't downloaded again.
+    Releases that are missing any of the fields are skipped. Raises
+    ValueError if the response isn't a list of releases.
     """
     url = f"https://api.github.com/repos/{user_repo}/releases"
-    # The timeout may be too fast, but it's going to hold up displaying the
-    # settings screen. Better to miss an update than hang for too long.
-    resp = requests.get(
-        url, headers={"Accept": "application/vnd.github.v3+json"}, timeout=2
-    )
-    if not resp.ok:
-        return []
-
-    body = resp.json()
-    return list(map(ReleaseInfo, body))
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    if cache.etag:
+        headers["If-None-Match"] = cache.etag
+    # This runs in the background, so it doesn't need to give up quickly
+    resp = requests.get(url, headers=headers, timeout=10)
+    if resp.status_code == HTTPStatus.NOT_MODIFIED or not resp.ok:
+        return
+    releases = resp.json()
+    if not isinstance(releases, list):
+        raise ValueError("GitHub's release list is not a list")
+    cache.etag = resp.headers.get("ETag", "")
+    cache.releases = [
+        {key: release[key] for key in _RELEASE_FIELDS}
+        for release in releases
+        if isinstance(release, dict) and all(key in release for key in _RELEASE_FIELDS)
+    ]
 
 
 def highest_semver(rlist: List[ReleaseInfo]) -> ReleaseInfo:
@@ -130,9 +184,24 @@ def git_semver(wrv: str) -> str:
     return str(version_info)
 
 
-def latest() -> Optional[ReleaseInfo]:
-    """Retrieves the latest release info"""
-    rlist = releases("JohnStrunk/wahoo-results")
+def latest(cache_file: str, interval: float) -> Optional[ReleaseInfo]:
+    """
+    Retrieves the latest release info. GitHub is asked at most once per
+    interval (seconds); otherwise, the release list saved in cache_file is
+    used. Raises requests.RequestException if GitHub can't be reached, and
+    ValueError if its reply (or a release's version or date) can't be parsed.
+    """
+    cache = ReleaseCache.load(cache_file)
+    since_check = time.time() - cache.checked
+    if not 0 <= since_check < interval:
+        # Record the attempt even if it fails so that being offline doesn't
+        # cause a request every time
+        cache.checked = time.time()
+        try:
+            fetch_releases("JohnStrunk/wahoo-results", cache)
+        finally:
+            cache.save(cache_file)
+    rlist = list(map(ReleaseInfo, cache.releases))
     if len(rlist) == 0:
         return None
     return highest_semver(rlist)
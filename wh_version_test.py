@@ -0,0 +1,120 @@
+# Wahoo! Results - https://github.com/JohnStrunk/wahoo-results
+# Copyright (C) 2024 - John D. Strunk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests for the cached update check"""
+
+from typing import Any, Dict, List
+
+import pytest
+import requests
+
+import wh_version
+
+_RELEASE = {
+    "tag_name": "v1.2.0",
+    "html_url": "https://example.com/v1.2.0",
+    "draft": False,
+    "prerelease": False,
+    "published_at": "2024-01-01T00:00:00Z",
+    "body": "Release notes that don't need to be cached",
+}
+
+
+class FakeResponse:  # pylint: disable=too-few-public-methods
+    """Enough of requests.Response for fetch_releases()"""
+
+    def __init__(self, status_code: int, body: Any = None, etag: str = ""):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {"ETag": etag} if etag else {}
+        self._body = body
+
+    def json(self) -> Any:
+        """The decoded body"""
+        return self._body
+
+
+@pytest.fixture(name="github")
+def fixture_github(monkeypatch: pytest.MonkeyPatch) -> List[Dict[str, str]]:
+    """Replace GitHub w/ one that returns an ETag, recording the headers sent"""
+    requests_sent: List[Dict[str, str]] = []
+
+    def fake_get(_url: str, headers: Dict[str, str], timeout: float) -> FakeResponse:
+        assert timeout > 0
+        requests_sent.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, [_RELEASE], '"v1"')
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    return requests_sent
+
+
+def test_releases_are_cached(tmp_path, github):
+    """Within the interval, the saved release list is used"""
+    cache_file = str(tmp_path / "releases.json")
+    assert wh_version.latest(cache_file, 3600).tag == "v1.2.0"
+    assert wh_version.latest(cache_file, 3600).tag == "v1.2.0"
+    assert len(github) == 1
+    assert "body" not in wh_version.ReleaseCache.load(cache_file).releases[0]
+
+
+def test_etag_revalidation(tmp_path, github):
+    """Once the interval expires, the ETag is used to revalidate"""
+    cache_file = str(tmp_path / "releases.json")
+    wh_version.latest(cache_file, 0)
+    assert wh_version.latest(cache_file, 0).tag == "v1.2.0"
+    assert len(github) == 2
+    assert github[1]["If-None-Match"] == '"v1"'
+
+
+def test_offline_attempt_is_recorded(tmp_path, monkeypatch):
+    """Being offline doesn't cause a request every time"""
+    cache_file = str(tmp_path / "releases.json")
+    attempts = []
+
+    def offline_get(*_args, **_kwargs):
+        attempts.append(1)
+        raise requests.ConnectionError("offline")
+
+    monkeypatch.setattr(requests, "get", offline_get)
+    with pytest.raises(requests.RequestException):
+        wh_version.latest(cache_file, 3600)
+    assert wh_version.latest(cache_file, 3600) is None
+    assert len(attempts) == 1
+
+
+def test_malformed_releases_are_skipped(tmp_path, monkeypatch):
+    """Releases w/o the needed fields don't break the update check"""
+    cache_file = str(tmp_path / "releases.json")
+    incomplete = {"tag_name": "v9.0.0", "html_url": "https://example.com"}
+    monkeypatch.setattr(
+        requests,
+        "get",
+        lambda *_args, **_kwargs: FakeResponse(200, [incomplete, "v9", _RELEASE]),
+    )
+    assert wh_version.latest(cache_file, 3600).tag == "v1.2.0"
+
+
+def test_invalid_release_list(tmp_path, monkeypatch):
+    """A reply that isn't a list of releases is an error, but not cached"""
+    cache_file = str(tmp_path / "releases.json")
+    monkeypatch.setattr(
+        requests, "get", lambda *_args, **_kwargs: FakeResponse(200, {}, '"v1"')
+    )
+    with pytest.raises(ValueError):
+        wh_version.latest(cache_file, 3600)
+    assert not wh_version.ReleaseCache.load(cache_file).etag
@@ -18,6 +18,7 @@
 TKinter code to display a button that presents a colorpicker.
 """
 
+import bisect
 import os
 from tkinter import (
     VERTICAL,
@@ -27,9 +28,10 @@ from tkinter import (
     Widget,
     colorchooser,
     filedialog,
-    ttk,
 )
-from typing import Any, Optional
+from tkinter import font as tkfont
+from tkinter import ttk
+from typing import Any, Dict, List, Optional, Tuple
 
 import PIL.Image as PILImage
 from PIL import ImageTk  # type: ignore
@@ -38,13 +40,17 @@ import scoreboard
 from model import (
     ChromecastStatusVar,
     ImageVar,
-    RaceResultListVar,
+    LatencySummaryVar,
     RaceResultVar,
+    ResultIndexVar,
     StartListVar,
 )
 from racetimes import RawTime
+from resultindex import IndexEntry
 
 TkContainer = Any
+# A Treeview row: its sort key, id, and column values
+Row = Tuple[Any, str, List[str]]
 
 
 def swatch(width: int, height: int, color: str) -> ImageTk.PhotoImage:
@@ -105,6 +111,49 @@ class Preview(Canvas):
         self.create_image(0, 0, image=self._pimage, anchor="nw")
 
 
+class _SortedRows:  # pylint: disable=too-few-public-methods
+    """
+    Keeps the rows of a Treeview in sorted order, changing only the rows
+    that were added, removed, or modified since the last update
+    """
+
+    def __init__(self, tview: ttk.Treeview):
+        self._tview = tview
+        # (sort key, id) of the displayed rows, in display order
+        self._order: List[Tuple[Any, str]] = []
+        # The sort key and values of each displayed row
+        self._rows: Dict[str, Tuple[Any, List[str]]] = {}
+
+    def update(self, rows: List[Row]) -> None:
+        """Make the displayed rows match the list (in any order)"""
+        latest = {iid: (key, values) for key, iid, values in rows}
+        for iid in [x for x in self._rows if x not in latest]:
+            self._remove(iid)
+        for iid, (key, values) in latest.items():
+            shown = self._rows.get(iid)
+            if shown is None:
+                self._tview.insert("", self._add(key, iid), id=iid, values=values)
+            elif shown[0] != key:
+                self._remove_order(shown[0], iid)
+                self._tview.move(iid, "", self._add(key, iid))
+            if shown is not None and shown[1] != values:
+                self._tview.item(iid, values=values)
+            self._rows[iid] = (key, values)
+
+    def _add(self, key: Any, iid: str) -> int:
+        """Add a row to the order, returning its position"""
+        index = bisect.bisect_left(self._order, (key, iid))
+        self._order.insert(index, (key, iid))
+        return index
+
+    def _remove_order(self, key: Any, iid: str) -> None:
+        del self._order[bisect.bisect_left(self._order, (key, iid))]
+
+    def _remove(self, iid: str) -> None:
+        self._remove_order(self._rows.pop(iid)[0], iid)
+        self._tview.delete(iid)
+
+
 class StartListTreeView(ttk.Frame):
     """Widget to display a set of startlists"""
 
@@ -126,18 +175,20 @@ class StartListTreeView(ttk.Frame):
         self.tview.column("heats", anchor="w", minwidth=40, width=40)
         self.tview.heading("heats", anchor="w", text="Heats")
         self.startlist = startlist
+        self._rows = _SortedRows(self.tview)
         startlist.trace_add("write", lambda *_: self._update_contents())
 
-    def _update_contents(self):
-        self.tview.delete(*self.tview.get_children())
-        local_list = self.startlist.get()
-        for entry in local_list:
-            self.tview.insert(
-                "",
-                "end",
-                id=str(entry.event_num),
-                values=[str(entry.event_num), entry.event_name, str(entry.heats)],
-            )
+    def _update_contents(self) -> None:
+        self._rows.update(
+            [
+                (
+                    entry.event_num,
+                    str(entry.event_num),
+                    [str(entry.event_num), entry.event_name, str(entry.heats)],
+                )
+                for entry in self.startlist.get()
+            ]
+        )
 
 
 class DirSelection(ttk.Frame):
@@ -168,9 +219,14 @@ class DirSelection(ttk.Frame):
 
 
 class RaceResultTreeView(ttk.Frame):
-    """Widget that displays a table of completed races"""
-
-    def __init__(self, parent: Widget, racelist: RaceResultListVar):
+    """
+    Widget that displays a table of completed races. Selecting a race sets
+    the selected variable to its file.
+    """
+
+    def __init__(
+        self, parent: Widget, racelist: ResultIndexVar, selected: StringVar
+    ) -> None:
         super().__init__(parent)
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
@@ -179,7 +235,7 @@ class RaceResultTreeView(ttk.Frame):
         self.scroll = ttk.Scrollbar(self, orient=VERTICAL, command=self.tview.yview)
         self.scroll.grid(column=1, row=0, sticky="news")
         self.tview.configure(
-            selectmode="none", show="headings", yscrollcommand=self.scroll.set
+            selectmode="browse", show="headings", yscrollcommand=self.scroll.set
         )
         self.tview.column("meet", anchor="w", minwidth=50, width=50)
         self.tview.heading("meet", anchor="w", text="Meet")
@@ -190,22 +246,227 @@ class RaceResultTreeView(ttk.Frame):
         self.tview.column("time", anchor="w", minwidth=140, width=140)
         self.tview.heading("time", anchor="w", text="Time")
         self.racelist = racelist
-        racelist.trace_add("write", lambda *_: self._update_contents())
+        self._selected = selected
+        self._rows = _SortedRows(self.tview)
+        self.tview.bind("<<TreeviewSelect>>", lambda _: self._row_selected())
+        self._trace = racelist.trace_add("write", lambda *_: self._update_contents())
+        self._update_contents()
 
-    def _update_contents(self):
-        self.tview.delete(*self.tview.get_children())
-        local_list = self.racelist.get()
-        # Sort the list by date, descending
-        # https://stackoverflow.com/a/39359270
-        local_list.sort(key=lambda e: e.time_recorded, reverse=True)
-        for entry in local_list:
-            timetext = entry.time_recorded.strftime("%Y-%m-%d %H:%M:%S")
-            self.tview.insert(
-                "",
-                "end",
-                id=str(entry.time_recorded.timestamp()),
-                values=[str(entry.meet_id), entry.event, entry.heat, timetext],
-            )
+    def destroy(self) -> None:
+        self.racelist.trace_remove("write", self._trace)
+        super().destroy()
+
+    def _update_contents(self) -> None:
+        rows: List[Row] = []
+        for entry in self.racelist.get().select():
+            # Sorted by date, descending. Results can share a timestamp, so
+            # each row is identified by its file.
+            rows.append((-entry.recorded.timestamp(), entry.filename, entry.row()))
+        self._rows.update(rows)
+        if self.tview.exists(self._selected.get()):
+            self.tview.selection_set(self._selected.get())
+
+    def _row_selected(self) -> None:
+        selection = self.tview.selection()
+        if selection and selection[0] != self._selected.get():
+            self._selected.set(selection[0])
+
+
+# pylint: disable-next=too-many-ancestors,too-many-instance-attributes
+class ResultBrowser(ttk.Frame):
+    """
+    Widget to browse a large number of race results, filtered by meet, event,
+    and date. Only the rows that are visible are put in the table. Selecting
+    a heat sets the selected variable to its file.
+    """
+
+    ALL_MEETS = "All"
+
+    def __init__(
+        self,
+        parent: Widget,
+        racelist: ResultIndexVar,
+        selected: StringVar,
+    ):
+        super().__init__(parent)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.racelist = racelist
+        self._selected = selected
+        self._matches: List[IndexEntry] = []
+        self._first = 0  # The match shown in the top row
+        self._visible = 1  # The number of rows that fit in the table
+        # Filters
+        filters = ttk.Frame(self)
+        filters.grid(column=0, row=0, columnspan=2, sticky="news")
+        self._meet = StringVar(value=self.ALL_MEETS)
+        self._event = StringVar()
+        self._day = StringVar()
+        ttk.Label(filters, text="Meet:").grid(column=0, row=0, padx=1)
+        self._meets = ttk.Combobox(
+            filters, textvariable=self._meet, state="readonly", width=6
+        )
+        self._meets.grid(column=1, row=0, padx=1)
+        ttk.Label(filters, text="Event:").grid(column=2, row=0, padx=1)
+        ttk.Entry(filters, textvariable=self._event, width=5).grid(
+            column=3, row=0, padx=1
+        )
+        ttk.Label(filters, text="Date:").grid(column=4, row=0, padx=1)
+        ttk.Entry(filters, textvariable=self._day, width=10).grid(
+            column=5, row=0, padx=1
+        )
+        for var in [self._meet, self._event, self._day]:
+            var.trace_add("write", lambda *_: self._filter(True))
+        # Table
+        self.tview = ttk.Treeview(
+            self, columns=["meet", "event", "heat", "time"], height=1
+        )
+        self.tview.grid(column=0, row=1, sticky="news")
+        self.scroll = ttk.Scrollbar(self, orient=VERTICAL, command=self._yview)
+        self.scroll.grid(column=1, row=1, sticky="news")
+        self.tview.configure(selectmode="browse", show="headings")
+        self.tview.column("meet", anchor="w", minwidth=50, width=50)
+        self.tview.heading("meet", anchor="w", text="Meet")
+        self.tview.column("event", anchor="w", minwidth=50, width=50)
+        self.tview.heading("event", anchor="w", text="Event")
+        self.tview.column("heat", anchor="w", minwidth=50, width=50)
+        self.tview.heading("heat", anchor="w", text="Heat")
+        self.tview.column("time", anchor="w", minwidth=140, width=140)
+        self.tview.heading("time", anchor="w", text="Time")
+        rowheight = ttk.Style(self).lookup("Treeview", "rowheight")
+        self._row_height = int(
+            rowheight or tkfont.nametofont("TkDefaultFont").metrics("linespace") + 4
+        )
+        self.tview.bind("<Configure>", self._resized)
+        self.tview.bind("<MouseWheel>", self._wheel)
+        self.tview.bind("<Button-4>", lambda _: self._scroll_to(self._first - 3))
+        self.tview.bind("<Button-5>", lambda _: self._scroll_to(self._first + 3))
+        self.tview.bind("<<TreeviewSelect>>", lambda _: self._row_selected())
+        self._status = StringVar()
+        ttk.Label(self, textvariable=self._status).grid(
+            column=0, row=2, columnspan=2, sticky="w"
+        )
+        self._trace = racelist.trace_add("write", lambda *_: self._update_contents())
+        self._update_contents()
+
+    def destroy(self) -> None:
+        self.racelist.trace_remove("write", self._trace)
+        super().destroy()
+
+    def _update_contents(self) -> None:
+        self._meets.configure(values=[self.ALL_MEETS, *self.racelist.get().meets()])
+        self._filter(False)
+
+    def _filter(self, to_top: bool) -> None:
+        """Find the matching results, optionally scrolling back to the top"""
+        meet = self._meet.get()
+        self._matches = self.racelist.get().select(
+            "" if meet == self.ALL_MEETS else meet,
+            self._event.get().strip(),
+            self._day.get().strip(),
+        )
+        if to_top:
+            self._first = 0
+        self._show()
+
+    def _show(self) -> None:
+        """Fill the rows of the table from the visible matches"""
+        self._first = max(0, min(self._first, len(self._matches) - self._visible))
+        window = self._matches[self._first : self._first + self._visible]
+        rows = self.tview.get_children()
+        # The rows are reused, so only the values change while scrolling
+        if len(rows) > len(window):
+            self.tview.delete(*rows[len(window) :])
+        for slot in range(len(rows), len(window)):
+            self.tview.insert("", "end", id=f"row{slot}")
+        for slot, entry in enumerate(window):
+            self.tview.item(f"row{slot}", values=entry.row())
+        self.tview.selection_set(
+            [
+                f"row{slot}"
+                for slot, entry in enumerate(window)
+                if entry.filename == self._selected.get()
+            ]
+        )
+        total = len(self._matches)
+        if total:
+            self.scroll.set(self._first / total, (self._first + len(window)) / total)
+        else:
+            self.scroll.set(0, 1)
+        self._status.set(f"{total} of {len(self.racelist.get())} heats")
+
+    def _scroll_to(self, first: int) -> None:
+        self._first = first
+        self._show()
+
+    def _yview(self, *args: str) -> None:
+        """Scroll in response to the scrollbar"""
+        if args[0] == "moveto":
+            self._scroll_to(round(float(args[1]) * len(self._matches)))
+        elif args[0] == "scroll":
+            step = self._visible if args[2] == "pages" else 1
+            self._scroll_to(self._first + int(args[1]) * step)
+
+    def _wheel(self, event) -> None:
+        self._scroll_to(self._first + (-3 if event.delta > 0 else 3))
+
+    def _resized(self, event) -> None:
+        # The heading takes up one row
+        self._visible = max(1, event.height // self._row_height - 1)
+        self._show()
+
+    def _row_selected(self) -> None:
+        selection = self.tview.selection()
+        if not selection:
+            return
+        entry = self._matches[self._first + self.tview.index(selection[0])]
+        if entry.filename != self._selected.get():
+            self._selected.set(entry.filename)
+
+
+class RaceResultList(ttk.Frame):
+    """
+    Widget that lists the race results, switching from a RaceResultTreeView
+    to a ResultBrowser once there are too many results to list them all. The
+    selected heat is previewed below the list.
+    """
+
+    # The number of results above which the ResultBrowser is used
+    BROWSER_THRESHOLD = 1000
+
+    def __init__(
+        self,
+        parent: Widget,
+        racelist: ResultIndexVar,
+        selected: StringVar,
+        preview: ImageVar,
+    ):
+        super().__init__(parent)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.racelist = racelist
+        self._selected = selected
+        Preview(self, preview).grid(column=0, row=1)
+        self._view: Optional[ttk.Frame] = None
+        self._trace = ""
+        self._choose_view()
+
+    def _choose_view(self) -> None:
+        browse = len(self.racelist.get()) > self.BROWSER_THRESHOLD
+        if self._view is not None:
+            if isinstance(self._view, ResultBrowser) == browse:
+                return
+            self._view.destroy()
+        if browse:
+            self._view = ResultBrowser(self, self.racelist, self._selected)
+        else:
+            self._view = RaceResultTreeView(self, self.racelist, self._selected)
+        self._view.grid(column=0, row=0, sticky="news")
+        # Tcl runs the newest trace first. Re-adding this one lets it replace
+        # the view before the old view updates itself w/ the new results.
+        if self._trace:
+            self.racelist.trace_remove("write", self._trace)
+        self._trace = self.racelist.trace_add("write", lambda *_: self._choose_view())
 
 
 class ChromcastSelector(ttk.Frame):
@@ -309,3 +570,48 @@ class RaceResultView(ttk.LabelFrame):
                     id=str(lane),
                     values=[str(lane), timestr[0], timestr[1], timestr[2], finalstr],
                 )
+
+
+class LatencyView(ttk.Frame):
+    """Widget that displays the latency of each stage of showing a result"""
+
+    def __init__(self, parent: Widget, summaryvar: LatencySummaryVar) -> None:
+        super().__init__(parent)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.tview = ttk.Treeview(
+            self,
+            columns=["stage", "count", "p50", "p95", "max"],
+            selectmode="none",
+            show="headings",
+            height=8,
+        )
+        self.tview.grid(column=0, row=0, sticky="news")
+        self.tview.heading("stage", anchor="w", text="Stage")
+        self.tview.column("stage", anchor="w", width=80)
+        for column, text in [
+            ("count", "Count"),
+            ("p50", "p50 (ms)"),
+            ("p95", "p95 (ms)"),
+            ("max", "Max (ms)"),
+        ]:
+            self.tview.heading(column, anchor="e", text=text)
+            self.tview.column(column, anchor="e", width=70)
+        self._summaryvar = summaryvar
+        self._summaryvar.trace_add("write", lambda *_: self._update())
+
+    def _update(self) -> None:
+        self.tview.delete(*self.tview.get_children())
+        for summary in self._summaryvar.get():
+            self.tview.insert(
+                "",
+                "end",
+                id=summary.stage.value,
+                values=[
+                    summary.stage.value,
+                    str(summary.count),
+                    f"{summary.p50:.0f}",
+                    f"{summary.p95:.0f}",
+                    f"{summary.max:.0f}",
+                ],
+            )